@@ -0,0 +1,109 @@
+import argparse
+import importlib
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.stub_graph import StubGraphServer
+from benchmarks.stub_openai import ANSWER, StubOpenAIServer
+from whatsapp_bot.bulk import fan_out
+
+# The Batch API bills half the regular price
+BATCH_DISCOUNT = 0.5
+
+
+# Estimated OpenAI cost of `requests` completions with the stub's usage
+# (20 prompt tokens, a token per four characters of the answer)
+def cost(router, model, requests, discount=1.0):
+    price = router.prices.get(model, (0.0, 0.0))
+    return round(requests * (20 * price[0] + len(ANSWER) // 4 * price[1]) / 1e6 * discount, 6)
+
+
+# AI messages for many recipients two ways, against stub OpenAI and Graph
+# servers: one completion per recipient (generate_ai_response and a send,
+# `--concurrency` at a time) against one OpenAI batch (/send_ai_batch). The
+# stub batch is done `--batch-latency` seconds after it is submitted; a
+# real one takes minutes to hours, which is the price of the discount.
+# Reports wall time, the HTTP requests each stub saw and the estimated cost.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16, help="recipients in flight on the direct path")
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="stub completion time in seconds")
+    parser.add_argument("--batch-latency", type=float, default=2.0, help="stub batch completion time in seconds")
+    parser.add_argument("--graph-latency", type=float, default=0.02, help="stub send time in seconds")
+    parser.add_argument("--app", default="main_en", help="app module to load")
+    args = parser.parse_args()
+
+    graph = StubGraphServer(latency=args.graph_latency).start()
+    openai = StubOpenAIServer(latency=args.openai_latency, batch_latency=args.batch_latency).start()
+    directory = tempfile.TemporaryDirectory()
+    os.environ.update(
+        GRAPH_API_BASE_URL=graph.base_url,
+        OPENAI_BASE_URL=openai.base_url,
+        OPENAI_API_KEY="benchmark",
+        WHATSAPP_API_TOKEN="benchmark",
+        WHATSAPP_PHONE_ID="benchmark",
+        AI_BATCH_PATH=os.path.join(directory.name, "ai_batches.db"),
+        AI_BATCH_POLL_INTERVAL="0.2",
+        AI_BATCH_SEND_CONCURRENCY=str(args.concurrency),
+        GRAPH_POOL_MAXSIZE=str(args.concurrency),
+    )
+    # Measure the two paths, not the throughput tier or the caches
+    for name in ("RATE_LIMIT_ENABLED", "AI_CACHE_ENABLED", "SEMANTIC_CACHE_ENABLED", "AI_COALESCE_ENABLED"):
+        os.environ.setdefault(name, "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    app = importlib.import_module(args.app)
+    client = app.app.test_client()
+    # Both paths on the route the direct path picks for these questions
+    router = app.get_model_router()
+    route = router.choose("Campaign question 0")
+    recipients = [f"35840{i:07d}" for i in range(args.recipients)]
+    results = {}
+
+    try:
+        def direct(number, n):
+            return app.send_whatsapp_message(number, app.generate_ai_response(f"Campaign question {n}", number))
+
+        start = time.perf_counter()
+        sent = sum(fan_out(((number, n) for n, number in enumerate(recipients)), direct, args.concurrency))
+        results["direct"] = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "sent": sent,
+            "openai_requests": openai.requests,
+            "graph_requests": graph.requests,
+            "estimated_cost_usd": cost(router, route.model, args.recipients),
+        }
+
+        openai.reset_counters()
+        graph.reset_counters()
+        start = time.perf_counter()
+        batch_id = client.post(
+            "/send_ai_batch",
+            json={"recipients": [{"phone_number": number, "question": f"Campaign question {n}"}
+                                 for n, number in enumerate(recipients)],
+                  "route": route.name},
+        ).get_json()["batch_id"]
+        while True:
+            batch = client.get(f"/ai_batches/{batch_id}").get_json()
+            if batch["status"] in ("completed", "failed"):
+                break
+            time.sleep(0.05)
+        results["batch"] = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "sent": batch["recipients"]["sent"],
+            "openai_requests": openai.requests,
+            "graph_requests": graph.requests,
+            "estimated_cost_usd": cost(router, route.model, args.recipients, BATCH_DISCOUNT),
+        }
+    finally:
+        graph.stop()
+        openai.stop()
+        directory.cleanup()
+
+    print(json.dumps({"config": {**vars(args), "model": route.model}, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
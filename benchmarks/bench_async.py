@@ -0,0 +1,78 @@
+import argparse
+import importlib.util
+import json
+import os
+
+from benchmarks.harness import SERVERS, run_drive, start_server, stop_server
+from benchmarks.stub_graph import StubGraphServer
+from benchmarks.stub_openai import StubOpenAIServer
+
+
+# POSTs to /send_ai_message, each to its own recipient so conversation
+# memory stays out of it
+def send_ai_message(i):
+    return {
+        "method": "POST",
+        "url": "/send_ai_message",
+        "json": {"phone_number": f"35840{i:07d}", "question": "When are you open?"},
+    }
+
+
+# Load test of /send_ai_message served by the threaded Flask app (gunicorn
+# gthread, one worker) and by the ASGI app (uvicorn, one worker), against
+# stub OpenAI and Graph servers. With a slow OpenAI stub the threaded app
+# tops out at threads / latency requests per second; the ASGI app keeps
+# every request in flight on one event loop.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[32, 256])
+    parser.add_argument("--openai-latency", type=float, default=2.0, help="stub completion time in seconds")
+    parser.add_argument("--graph-latency", type=float, default=0.02, help="stub send time in seconds")
+    parser.add_argument("--threads", type=int, default=32, help="threads of the threaded server")
+    parser.add_argument("--modes", nargs="+", default=["threaded", "asgi"], choices=["threaded", "asgi"])
+    parser.add_argument("--app", default="main_en", help="app module to serve")
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        server = SERVERS[mode]
+        if importlib.util.find_spec(server) is None:
+            raise SystemExit(f"--modes {mode} needs {server} (pip install {server})")
+
+    graph = StubGraphServer(latency=args.graph_latency).start()
+    openai = StubOpenAIServer(latency=args.openai_latency).start()
+    env = dict(
+        os.environ,
+        GRAPH_API_BASE_URL=graph.base_url,
+        OPENAI_BASE_URL=openai.base_url,
+        OPENAI_API_KEY="benchmark",
+        RATE_LIMIT_ENABLED="false",
+        AI_CACHE_ENABLED="false",
+        SEMANTIC_CACHE_ENABLED="false",
+        GRAPH_POOL_MAXSIZE=str(max(args.concurrency)),
+    )
+
+    results = []
+    try:
+        for mode in args.modes:
+            server, base_url = start_server(mode, args.app, env, threads=args.threads)
+            try:
+                for concurrency in args.concurrency:
+                    result = run_drive(base_url, send_ai_message, args.requests, concurrency)
+                    results.append({"mode": mode, "concurrency": concurrency, **result})
+            finally:
+                stop_server(server)
+    finally:
+        graph.stop()
+        openai.stop()
+
+    print(json.dumps({
+        "openai_latency": args.openai_latency,
+        "graph_latency": args.graph_latency,
+        "threads": args.threads,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
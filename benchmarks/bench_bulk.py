@@ -0,0 +1,55 @@
+import argparse
+import importlib
+import json
+import os
+import time
+
+from benchmarks.stub_graph import StubGraphServer
+
+
+# Throughput of /send_bulk against a local stub Graph server, for a few
+# fan-out concurrency levels. Runs the app in-process via Flask's test
+# client, so the numbers cover payload building, fan-out and the HTTP
+# round trips to the stub.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency", type=float, default=0.02, help="stub response delay in seconds")
+    parser.add_argument("--app", default="main_en", help="app module to load")
+    args = parser.parse_args()
+
+    server = StubGraphServer(latency=args.latency).start()
+    os.environ["GRAPH_API_BASE_URL"] = server.base_url
+    os.environ["BULK_MAX_CONCURRENCY"] = str(max(args.concurrency))
+    # Measure the fan-out itself, not the configured throughput tier
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    client = importlib.import_module(args.app).app.test_client()
+
+    recipients = [f"35840{i:07d}" for i in range(args.recipients)]
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            response = client.post(
+                "/send_bulk",
+                json={"recipients": recipients, "message": "benchmark", "concurrency": concurrency},
+            )
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+            elapsed = time.perf_counter() - start
+            results.append({
+                "concurrency": concurrency,
+                "recipients": args.recipients,
+                "summary": lines[-1]["summary"],
+                "seconds": round(elapsed, 3),
+                "messages_per_second": round(args.recipients / elapsed, 1),
+            })
+    finally:
+        server.stop()
+
+    print(json.dumps({"stub_latency": args.latency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from whatsapp_bot.conversations import ConversationStore
+
+WORDS = (
+    "hello when are you open tomorrow thanks the order delivery price "
+    "kiitos hei milloin aukeaa huomenna tilaus toimitus hinta"
+).split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+# Memory of `users` conversations holding `exchanges` question/answer pairs
+# each (short questions, answers of about 40 words), measured with
+# tracemalloc, plus the cost of building one prompt history.
+def bench(users, exchanges, token_budget):
+    rng = random.Random(0)
+    questions = [sentence(rng, 8) for _ in range(200)]
+    answers = [sentence(rng, 40) for _ in range(200)]
+    store = ConversationStore(
+        token_budget=token_budget, max_turns=exchanges, max_entries=users, summarize=False
+    )
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for turn in range(exchanges):
+        for user in range(users):
+            store.append(f"358{user:09d}", questions[(user + turn) % 200], answers[(user * 7 + turn) % 200])
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for user in range(0, users, max(1, users // 1000)):
+        store.history(f"358{user:09d}")
+    lookups = len(range(0, users, max(1, users // 1000)))
+    history_us = (time.perf_counter() - start) / lookups * 1e6
+
+    return {
+        "users": users,
+        "exchanges_per_user": exchanges,
+        "token_budget": token_budget,
+        "memory_mb": round(used / 1e6, 1),
+        "bytes_per_user": round(used / users),
+        "appends_per_s": round(users * exchanges / elapsed),
+        "history_us": round(history_us, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--exchanges", type=int, default=4)
+    parser.add_argument("--token-budget", type=int, default=1000)
+    args = parser.parse_args()
+
+    results = [bench(users, args.exchanges, args.token_budget) for users in args.users]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.stub_graph import StubGraphServer
+from whatsapp_bot.graph_client import GraphClient
+
+PAYLOAD = {
+    "messaging_product": "whatsapp",
+    "recipient_type": "individual",
+    "to": "+358401234567",
+    "type": "text",
+    "text": {"preview_url": False, "body": "benchmark"},
+}
+
+
+def run(server, send, messages, concurrency):
+    server.reset_counters()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(lambda _: send().status_code, range(messages)))
+    elapsed = time.perf_counter() - start
+    return {
+        "messages": messages,
+        "errors": sum(1 for status in statuses if status != 200),
+        "seconds": round(elapsed, 4),
+        "messages_per_second": round(messages / elapsed, 1),
+        "tcp_connections": server.connections,
+    }
+
+
+# Compare the old per-call requests.post against the pooled GraphClient
+# against a local stub. The stub is plain HTTP, so the saving shown here is
+# the TCP handshake only; against graph.facebook.com every avoided
+# connection also skips a TLS handshake.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub response delay in seconds")
+    args = parser.parse_args()
+
+    server = StubGraphServer(latency=args.latency).start()
+    try:
+        url = f"{server.base_url}/v22.0/PHONE_ID/messages"
+        headers = {"Content-Type": "application/json", "Authorization": "Bearer TOKEN"}
+        client = GraphClient(
+            token="TOKEN",
+            phone_id="PHONE_ID",
+            base_url=server.base_url,
+            pool_maxsize=args.concurrency,
+        )
+
+        results = {
+            "requests.post": run(
+                server,
+                lambda: requests.post(url, headers=headers, json=PAYLOAD),
+                args.messages,
+                args.concurrency,
+            ),
+            "GraphClient": run(
+                server, lambda: client.send_message(PAYLOAD), args.messages, args.concurrency
+            ),
+        }
+        client.close()
+    finally:
+        server.stop()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.stub_graph import StubGraphServer
+from whatsapp_bot.bulk import fan_out
+from whatsapp_bot.graph_client import get_graph_client
+from whatsapp_bot.media import MediaStore, MemoryBackend
+from whatsapp_bot.payloads import media_payload
+
+
+# The straightforward way: read the file and upload it again for every
+# recipient, with requests building the multipart body in memory
+def reupload(path, number):
+    client = get_graph_client()
+    with open(path, "rb") as f:
+        response = client.session.post(
+            client.url("media"),
+            data={"messaging_product": "whatsapp", "type": "application/pdf"},
+            files={"file": (os.path.basename(path), f.read(), "application/pdf")},
+            headers={"Content-Type": None},
+            timeout=client.timeout,
+        )
+    media_id = response.json()["id"]
+    return client.send_message(media_payload(number, "document", media_id)).status_code == 200
+
+
+def run(graph, send, recipients, concurrency):
+    graph.reset_counters()
+    tracemalloc.start()
+    start = time.perf_counter()
+    sent = sum(fan_out(((f"+35840{i:07d}",) for i in range(recipients)), send, concurrency))
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds": round(seconds, 3),
+        "sent": sent,
+        "uploads": graph.uploads,
+        "upload_mb": round(graph.upload_bytes / 1e6, 1),
+        "peak_python_mb": round(peak / 1e6, 1),
+    }
+
+
+# The same PDF to many recipients against a stub Graph API: uploaded again
+# for every send, against uploaded once through MediaStore (hashed and
+# streamed from disk, then sent by media id). Reports wall time, the
+# uploads and bytes the stub received and the peak Python memory of the
+# sending side (the stub only counts upload bytes, it does not keep them).
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--size-mb", type=float, default=20.0, help="size of the PDF")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--graph-latency", type=float, default=0.02, help="stub send and upload time in seconds")
+    args = parser.parse_args()
+
+    graph = StubGraphServer(latency=args.graph_latency).start()
+    directory = tempfile.TemporaryDirectory()
+    os.environ.update(
+        GRAPH_API_BASE_URL=graph.base_url,
+        WHATSAPP_API_TOKEN="benchmark",
+        WHATSAPP_PHONE_ID="benchmark",
+        GRAPH_POOL_MAXSIZE=str(args.concurrency),
+        GRAPH_READ_TIMEOUT="60",
+    )
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    path = os.path.join(directory.name, "price-list.pdf")
+    with open(path, "wb") as f:
+        for _ in range(int(args.size_mb)):
+            f.write(os.urandom(1024 * 1024))
+        f.write(os.urandom(int(args.size_mb % 1 * 1024 * 1024)) or b"%")
+
+    store = MediaStore(MemoryBackend(), media_dir=directory.name)
+
+    def cached(number):
+        media_id, _, _ = store.media_id("document", path="price-list.pdf")
+        return get_graph_client().send_message(media_payload(number, "document", media_id)).status_code == 200
+
+    try:
+        # Only a few recipients for the slow path; its cost is per send
+        results = {
+            "reupload": run(graph, lambda number: reupload(path, number),
+                            min(args.recipients, args.concurrency * 4), args.concurrency),
+            "cached": run(graph, cached, args.recipients, args.concurrency),
+        }
+    finally:
+        graph.stop()
+        directory.cleanup()
+
+    for result in results.values():
+        result["seconds_per_send"] = round(result["seconds"] / result["sent"], 4) if result["sent"] else None
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
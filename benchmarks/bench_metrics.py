@@ -0,0 +1,90 @@
+import argparse
+import json
+import threading
+import time
+
+from whatsapp_bot.metrics import Counter, Gauge, Histogram, Registry
+
+
+def ns_per_op(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def contended_ns_per_op(fn, iterations, threads):
+    per_thread = iterations // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(per_thread):
+            fn()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e9
+
+
+# Cost of the instrumentation on the request path: one labelled counter
+# increment, one histogram observation including the two perf_counter()
+# calls that time a stage, and a gauge update, single-threaded and with
+# `threads` threads contending for the same series. "per_request_us" is
+# what one /send_ai_message adds (request, AI and send latency, request
+# counter, two token counters), to compare against the hundreds of
+# milliseconds an OpenAI call takes.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--series", type=int, default=100, help="label sets rendered by /metrics")
+    args = parser.parse_args()
+
+    counter = Counter("bench_total", "bench", ["route", "method", "status"])
+    histogram = Histogram("bench_seconds", "bench", ["route", "method"])
+    gauge = Gauge("bench_depth", "bench")
+
+    def inc():
+        counter.inc(route="/send_ai_message", method="POST", status=200)
+
+    def observe():
+        start = time.perf_counter()
+        histogram.observe(time.perf_counter() - start, route="/send_ai_message", method="POST")
+
+    def set_gauge():
+        gauge.set(42)
+
+    operations = {"counter_inc": inc, "histogram_observe_timed": observe, "gauge_set": set_gauge}
+    results = {
+        name: {
+            "ns_per_op": round(ns_per_op(fn, args.iterations)),
+            f"ns_per_op_{args.threads}_threads": round(contended_ns_per_op(fn, args.iterations, args.threads)),
+        }
+        for name, fn in operations.items()
+    }
+    per_request_ns = 3 * results["histogram_observe_timed"]["ns_per_op"] + 3 * results["counter_inc"]["ns_per_op"]
+
+    registry = Registry()
+    rendered = registry.get_or_create(Histogram, "render_seconds", "bench", ["route"])
+    for i in range(args.series):
+        rendered.observe(0.1, route=f"/route{i}")
+    start = time.perf_counter()
+    text = registry.render()
+    render_ms = (time.perf_counter() - start) * 1000
+
+    print(json.dumps({
+        "iterations": args.iterations,
+        "operations": results,
+        "per_request_us": round(per_request_ns / 1000, 2),
+        "render": {"histogram_series": args.series, "lines": text.count("\n"), "ms": round(render_ms, 2)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
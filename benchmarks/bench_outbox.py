@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from whatsapp_bot.outbox import SqliteBackend
+from whatsapp_bot.send_queue import Job, MemoryBackend
+
+# Run by the crash check in a child process: accept jobs, finish some of
+# them and die without any shutdown
+CRASH_CHILD = """
+import os, sys, time
+from whatsapp_bot.outbox import SqliteBackend
+from whatsapp_bot.send_queue import SUCCEEDED, Job
+
+backend = SqliteBackend(sys.argv[1])
+jobs = [Job("send_message", {"phone_number": "+358400000000", "message": str(i)}) for i in range(int(sys.argv[2]))]
+for job in jobs:
+    backend.put(job)
+for job in jobs[:int(sys.argv[3])]:
+    job.status = SUCCEEDED
+    job.finished_at = time.time()
+    backend.save(job)
+time.sleep(0.5)
+os._exit(1)
+"""
+
+
+# Jobs per second accepted by put() from `threads` threads at once, and the
+# time one put() takes
+def put_throughput(backend, jobs, threads):
+    per_thread = jobs // threads
+    barrier = threading.Barrier(threads + 1)
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        barrier.wait()
+        mine = []
+        for i in range(per_thread):
+            job = Job("send_message", {"phone_number": "+358400000000", "message": str(i)})
+            start = time.perf_counter()
+            backend.put(job)
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "jobs_per_second": round(len(latencies) / elapsed),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+    }
+
+
+# A process that dies with unfinished jobs leaves them to the next one that
+# opens the outbox
+def crash_replay(directory, jobs, finished):
+    path = os.path.join(directory, "crash.db")
+    subprocess.run([sys.executable, "-c", CRASH_CHILD, path, str(jobs), str(finished)], check=False)
+    backend = SqliteBackend(path)
+    start = time.perf_counter()
+    backend.open()
+    replayed = backend.depth()
+    return {
+        "accepted": jobs,
+        "finished_before_crash": finished,
+        "replayed": replayed,
+        "lost": jobs - finished - replayed,
+        "recovery_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+# Cost of the durable outbox: put() throughput and latency of the memory
+# backend against SQLite with synchronous=FULL (fsync on every commit) and
+# NORMAL (fsync at checkpoints only), single-threaded and with concurrent
+# senders whose inserts share group commits. Then a crash check: a child
+# process accepts jobs, finishes some and exits abruptly; the jobs it did
+# not finish must all come back.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=2000, help="jobs per measurement")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--crash-jobs", type=int, default=500)
+    parser.add_argument("--dir", help="directory of the database files (default: a temporary one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        results = []
+        for threads in args.threads:
+            backends = {"memory": MemoryBackend(maxsize=args.jobs * 2)}
+            for synchronous in ("FULL", "NORMAL"):
+                path = os.path.join(directory, f"{synchronous.lower()}-{threads}.db")
+                backends[f"sqlite_{synchronous.lower()}"] = SqliteBackend(
+                    path, maxsize=args.jobs * 2, synchronous=synchronous
+                )
+            for name, backend in backends.items():
+                backend.open()
+                results.append({"backend": name, "threads": threads, **put_throughput(backend, args.jobs, threads)})
+        crash = crash_replay(directory, args.crash_jobs, args.crash_jobs // 2)
+
+    print(json.dumps({"config": vars(args), "put": results, "crash": crash}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
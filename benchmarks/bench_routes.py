@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import hmac
+import importlib.util
+import json
+import os
+import platform
+import re
+import time
+
+import httpx
+
+from benchmarks.harness import SERVERS, run_drive, start_server, stop_server
+from benchmarks.stub_graph import StubGraphServer
+from benchmarks.stub_openai import StubOpenAIServer
+
+APP_SECRET = "benchmark"
+QUESTION = "When are you open?"
+
+
+def phone(n):
+    return f"35840{n:07d}"
+
+
+# The same question for every request, so concurrent AI calls are
+# coalesced, unless --distinct-questions numbers them
+def question(n, args):
+    return f"{QUESTION} ({n})" if args.distinct_questions else QUESTION
+
+
+def webhook_request(n, args):
+    body = json.dumps({
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "benchmark",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "messages": [{
+                        "from": phone(n),
+                        "id": f"wamid.bench{n}",
+                        "timestamp": str(int(time.time())),
+                        "type": "text",
+                        "text": {"body": question(n, args)},
+                    }],
+                },
+            }],
+        }],
+    }).encode()
+    signature = hmac.new(APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return {
+        "method": "POST",
+        "url": "/webhook",
+        "content": body,
+        "headers": {"Content-Type": "application/json", "X-Hub-Signature-256": f"sha256={signature}"},
+    }
+
+
+# Request builders by route name. Each gets a number unique across the whole
+# run, so recipients (conversation memory) and webhook message ids (dedup)
+# never repeat. BACKGROUND_ROUTES leave work on the send queue after
+# answering.
+ROUTES = {
+    "testmessage": lambda n, args: {
+        "method": "GET", "url": "/testmessage", "params": {"to": phone(n), "message": "benchmark"},
+    },
+    "askAI": lambda n, args: {
+        "method": "GET", "url": "/askAI", "params": {"to": phone(n), "question": question(n, args)},
+    },
+    "send_message": lambda n, args: {
+        "method": "POST", "url": "/send_message", "json": {"phone_number": phone(n), "message": "benchmark"},
+    },
+    "send_ai_message": lambda n, args: {
+        "method": "POST", "url": "/send_ai_message", "json": {"phone_number": phone(n), "question": question(n, args)},
+    },
+    "send_ai_message_stream": lambda n, args: {
+        "method": "POST", "url": "/send_ai_message",
+        "json": {"phone_number": phone(n), "question": question(n, args), "stream": True},
+    },
+    "send_template": lambda n, args: {
+        "method": "POST", "url": "/send_template",
+        "json": {"phone_number": phone(n), "template_name": "hello_world", "language_code": "en_US"},
+    },
+    "send_bulk": lambda n, args: {
+        "method": "POST", "url": "/send_bulk",
+        "json": {
+            "recipients": [phone(n * args.bulk_size + i) for i in range(args.bulk_size)],
+            "message": "benchmark",
+        },
+    },
+    "webhook": lambda n, args: webhook_request(n, args),
+    "metrics": lambda n, args: {"method": "GET", "url": "/metrics"},
+}
+ASGI_ROUTES = {"testmessage", "askAI", "send_message", "send_ai_message", "send_template", "metrics"}
+BACKGROUND_ROUTES = {"webhook"}
+
+
+# Wait until the send queue is empty and the stubs have seen no new request
+# for `idle` seconds, so background replies are not billed to the next run
+def wait_for_background(base_url, stubs, idle, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        metrics = httpx.get(base_url + "/metrics", timeout=5.0).text
+        depth = re.search(r"^send_queue_depth (\S+)$", metrics, re.MULTILINE)
+        current = tuple(stub.requests for stub in stubs)
+        if current == last and (depth is None or float(depth.group(1)) == 0):
+            return
+        last = current
+        time.sleep(idle)
+
+
+def change(baseline, current):
+    if not baseline:
+        return None
+    return round((current - baseline) / baseline * 100, 1)
+
+
+# Per (mode, route, concurrency): throughput, p95/p99 and error rate of this
+# run against a saved one
+def compare(baseline, results):
+    previous = {(r["mode"], r["route"], r["concurrency"]): r for r in baseline["results"]}
+    rows = []
+    for result in results:
+        before = previous.get((result["mode"], result["route"], result["concurrency"]))
+        if before is None:
+            continue
+        row = {"mode": result["mode"], "route": result["route"], "concurrency": result["concurrency"]}
+        for name, old, new in (
+            ("requests_per_second", before["requests_per_second"], result["requests_per_second"]),
+            ("p95_ms", before["latency"].get("p95_ms"), result["latency"].get("p95_ms")),
+            ("p99_ms", before["latency"].get("p99_ms"), result["latency"].get("p99_ms")),
+            ("error_rate", before["errors"] / before["requests"], result["errors"] / result["requests"]),
+        ):
+            row[name] = {"baseline": old, "current": new, "change_pct": change(old, new)}
+        rows.append(row)
+    return rows
+
+
+# Load test of every route against stub OpenAI and Graph servers with
+# configurable latency, error and 429 rates. Prints one JSON document with
+# throughput, latency percentiles and status breakdowns per route and
+# concurrency, plus what the stubs saw; --output saves it and --baseline
+# compares against an earlier run.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", nargs="+", default=list(ROUTES), choices=list(ROUTES))
+    parser.add_argument("--modes", nargs="+", default=["threaded"], choices=list(SERVERS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and concurrency")
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="stub completion time in seconds")
+    parser.add_argument("--graph-latency", type=float, default=0.05, help="stub send time in seconds")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="share of OpenAI calls answered 500")
+    parser.add_argument("--openai-throttle-rate", type=float, default=0.0, help="share of OpenAI calls answered 429")
+    parser.add_argument("--graph-error-rate", type=float, default=0.0, help="share of Graph sends answered 500")
+    parser.add_argument("--graph-throttle-rate", type=float, default=0.0, help="share of Graph sends answered 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of the stub 429s in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the injected failures")
+    parser.add_argument(
+        "--distinct-questions", action="store_true", help="give every AI question its own text, so none are coalesced"
+    )
+    parser.add_argument("--bulk-size", type=int, default=10, help="recipients per /send_bulk request")
+    parser.add_argument("--threads", type=int, default=32, help="threads per worker of the threaded server")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the Graph API rate limiter on")
+    parser.add_argument("--app", default="main_en", help="app module to serve")
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        if importlib.util.find_spec(SERVERS[mode]) is None:
+            raise SystemExit(f"--modes {mode} needs {SERVERS[mode]} (pip install {SERVERS[mode]})")
+
+    graph = StubGraphServer(
+        latency=args.graph_latency, error_rate=args.graph_error_rate,
+        throttle_rate=args.graph_throttle_rate, retry_after=args.retry_after, seed=args.seed,
+    ).start()
+    openai = StubOpenAIServer(
+        latency=args.openai_latency, error_rate=args.openai_error_rate,
+        throttle_rate=args.openai_throttle_rate, retry_after=args.retry_after, seed=args.seed,
+    ).start()
+    env = dict(
+        os.environ,
+        GRAPH_API_BASE_URL=graph.base_url,
+        OPENAI_BASE_URL=openai.base_url,
+        OPENAI_API_KEY="benchmark",
+        WHATSAPP_API_TOKEN="benchmark",
+        WHATSAPP_PHONE_ID="benchmark",
+        WHATSAPP_APP_SECRET=APP_SECRET,
+        RATE_LIMIT_ENABLED="true" if args.rate_limit else "false",
+        AI_CACHE_ENABLED="false",
+        SEMANTIC_CACHE_ENABLED="false",
+        GRAPH_POOL_MAXSIZE=str(max(args.concurrency) * args.bulk_size),
+        BULK_MAX_CONCURRENCY=str(args.bulk_size),
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+    )
+    idle = max(0.5, 2 * (args.openai_latency + args.graph_latency))
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+
+    results = []
+    skipped = []
+    number = 0
+    try:
+        for mode in args.modes:
+            routes = [route for route in args.routes if mode != "asgi" or route in ASGI_ROUTES]
+            skipped += [{"mode": mode, "route": route} for route in args.routes if route not in routes]
+            server, base_url = start_server(mode, args.app, env, threads=args.threads, workers=args.workers)
+            try:
+                for route in routes:
+                    for concurrency in args.concurrency:
+                        graph.reset_counters()
+                        openai.reset_counters()
+                        build = ROUTES[route]
+                        result = run_drive(
+                            base_url, lambda i, start=number: build(start + i, args), args.requests, concurrency
+                        )
+                        number += args.requests
+                        if route in BACKGROUND_ROUTES:
+                            wait_for_background(base_url, (graph, openai), idle)
+                        results.append({
+                            "mode": mode,
+                            "route": route,
+                            "concurrency": concurrency,
+                            **result,
+                            "upstream": {"openai": openai.stats(), "graph": graph.stats()},
+                        })
+            finally:
+                stop_server(server)
+    finally:
+        graph.stop()
+        openai.stop()
+
+    report = {
+        "config": {
+            **{name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+            "python": platform.python_version(),
+            "started_at": started_at,
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(json.load(f), results)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from whatsapp_bot.scheduler import Scheduler
+
+DAY = 86400.0
+
+
+class _Job:
+    __slots__ = ("id",)
+
+    def __init__(self, job_id):
+        self.id = job_id
+
+
+# Stands in for SendQueue.submit: records when each send was queued
+class Recorder:
+    def __init__(self):
+        self.times = []
+        self._lock = threading.Lock()
+
+    def submit(self, task, **kwargs):
+        with self._lock:
+            self.times.append(time.time())
+            return _Job(str(len(self.times)))
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+# Fills the database with `pending` sends spread over the next 30 days, then
+# times single schedule() calls on top of it. Only the sends due within the
+# horizon end up in the heap.
+def insert_cost(directory, pending, chunk, probes):
+    scheduler = Scheduler(path=os.path.join(directory, f"pending-{pending}.db"), jitter=0.0, poll_interval=3600.0)
+    scheduler.bind(Recorder().submit)
+    now = time.time()
+    start = time.perf_counter()
+    for offset in range(0, pending, chunk):
+        count = min(chunk, pending - offset)
+        # Due from a day out, so nothing fires while measuring
+        scheduler.schedule([("send_message", {"phone_number": "+358400000000", "message": "x"})] * count,
+                           now + DAY + offset / pending * 29 * DAY)
+    fill = time.perf_counter() - start
+    latencies = []
+    for i in range(probes):
+        start = time.perf_counter()
+        scheduler.schedule([("send_message", {"phone_number": "+358400000000", "message": "x"})], now + 2 * DAY + i)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "pending": pending,
+        "fill_sends_per_second": round(pending / fill),
+        "schedule_p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "schedule_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "heap_size": scheduler.heap_size(),
+        "db_mb": round(os.path.getsize(scheduler.path) / 1e6, 1),
+    }
+
+
+# `sends` sends all scheduled for the same moment, with and without jitter:
+# how late they reach the send queue and the most queued in any 100 ms
+def burst(directory, sends, jitter):
+    recorder = Recorder()
+    scheduler = Scheduler(path=os.path.join(directory, f"burst-{jitter:g}.db"), jitter=jitter, poll_interval=0.5)
+    scheduler.bind(recorder.submit)
+    due_at = time.time() + 1.0
+    scheduled = scheduler.schedule(
+        [("send_message", {"phone_number": f"+35840{i:07d}", "message": "x"}) for i in range(sends)], due_at
+    )
+    deadline = due_at + jitter + 30.0
+    while len(recorder.times) < sends and time.time() < deadline:
+        time.sleep(0.05)
+    lags = sorted(fired - due for fired, due in zip(sorted(recorder.times), sorted(due for _, due in scheduled)))
+    windows = Counter(int(t * 10) for t in recorder.times)
+    return {
+        "sends": sends,
+        "jitter": jitter,
+        "fired": len(recorder.times),
+        "spread_seconds": round(max(recorder.times) - min(recorder.times), 3),
+        "peak_per_100ms": max(windows.values()),
+        "lag_p50_ms": round(percentile(lags, 0.5) * 1000, 1),
+        "lag_p99_ms": round(percentile(lags, 0.99) * 1000, 1),
+    }
+
+
+# Cost of the scheduler: schedule() with many sends already pending (the
+# due-time index keeps it O(log n)), and a burst of sends due at the same
+# moment with and without jitter, measured against a stand-in for the send
+# queue.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pending", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--chunk", type=int, default=10000, help="sends per schedule() call while filling")
+    parser.add_argument("--probes", type=int, default=500, help="single schedule() calls timed")
+    parser.add_argument("--burst", type=int, default=5000)
+    parser.add_argument("--jitter", type=float, nargs="+", default=[0.0, 5.0])
+    parser.add_argument("--dir", help="directory of the database files (default: a temporary one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        inserts = [insert_cost(directory, pending, args.chunk, args.probes) for pending in args.pending]
+        bursts = [burst(directory, args.burst, jitter) for jitter in args.jitter]
+
+    print(json.dumps({"config": vars(args), "schedule": inserts, "burst": bursts}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
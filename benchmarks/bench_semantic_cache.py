@@ -0,0 +1,76 @@
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from whatsapp_bot import semantic_cache
+from whatsapp_bot.semantic_cache import HashingEmbedder, SemanticCache
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "p50_ms": round(pick(0.50) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "p99_ms": round(pick(0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+# Fill a SemanticCache with `entries` random unit vectors and time lookups.
+# Vectors are random rather than embedded questions so that filling 100k
+# entries takes seconds; the search cost only depends on count and dim.
+def bench(entries, dim, queries, use_ann):
+    rng = np.random.default_rng(0)
+    cache = SemanticCache(
+        HashingEmbedder(dim),
+        max_entries=entries,
+        ann_min_entries=entries if use_ann else entries + 1,
+    )
+    vectors = rng.standard_normal((entries, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for i, vector in enumerate(vectors):
+        cache.store("model", "prompt", vector, f"answer {i}")
+    index = cache._indexes[("model", "prompt")]
+
+    search = []
+    for vector in vectors[rng.integers(0, entries, queries)]:
+        start = time.perf_counter()
+        index.search(vector, time.time())
+        search.append(time.perf_counter() - start)
+
+    lookup = []
+    for i in range(queries):
+        start = time.perf_counter()
+        cache.lookup("model", "prompt", f"what are your opening hours on day {i}?")
+        lookup.append(time.perf_counter() - start)
+
+    return {
+        "entries": entries,
+        "dim": dim,
+        "index": "hnsw" if index.ann is not None else "numpy",
+        "search": percentiles(search),
+        "lookup_with_local_embedding": percentiles(lookup),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    results = []
+    for entries in args.entries:
+        results.append(bench(entries, args.dim, args.queries, use_ann=False))
+        if semantic_cache._hnswlib() is not None:
+            results.append(bench(entries, args.dim, args.queries, use_ann=True))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
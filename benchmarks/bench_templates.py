@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.stub_graph import StubGraphServer
+from whatsapp_bot.bulk import build_bulk_items, fan_out
+from whatsapp_bot.graph_client import get_graph_client
+from whatsapp_bot.payloads import template_payload
+from whatsapp_bot.templates import TemplateError, TemplateRegistry, get_template_registry
+
+TEMPLATES = [
+    {"name": "hello_world", "language": "en_US", "status": "APPROVED", "components": [
+        {"type": "HEADER", "format": "TEXT", "text": "Hello World"},
+        {"type": "BODY", "text": "Welcome and congratulations!"},
+    ]},
+    {"name": "order_shipped", "language": "en_US", "status": "APPROVED", "components": [
+        {"type": "BODY", "text": "Hi {{1}}, your order {{2}} is on its way and arrives {{3}}."},
+        {"type": "BUTTONS", "buttons": [{"type": "URL", "text": "Track", "url": "https://example.com/t/{{1}}"}]},
+    ]},
+]
+
+
+# Time and memory to build the payloads of a campaign of `count` sends.
+# build(numbers) returns them as a list. Timed without tracemalloc, which
+# slows allocations down, and measured in a second run.
+def build_cost(build, count):
+    numbers = [f"+35840{i:07d}" for i in range(count)]
+    start = time.perf_counter()
+    build(numbers)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    payloads = build(numbers)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del payloads
+    return {"us_per_payload": round(seconds / count * 1e6, 3), "bytes_per_payload": round(memory / count)}
+
+
+# The same template content to every number: a dict built per send (the
+# old /send_bulk), checked and built per send (the registry without
+# sharing), and checked once with the "template" object shared
+# (/send_bulk now)
+def campaign(count, template_name, parameters=None, buttons=None):
+    registry = get_template_registry()
+    data = {"template_name": template_name, "parameters": parameters, "buttons": buttons}
+    return {
+        "dict_per_send": build_cost(
+            lambda numbers: [template_payload(number, template_name, "en_US", parameters) for number in numbers],
+            count,
+        ),
+        "checked_per_send": build_cost(
+            lambda numbers: [registry.render(number, template_name, "en_US", parameters, None, buttons)
+                             for number in numbers],
+            count,
+        ),
+        "checked_once": build_cost(
+            lambda numbers: [payload for _, payload, _ in build_bulk_items({**data, "recipients": numbers})],
+            count,
+        ),
+    }
+
+
+# `count` sends with a misspelt template name: refused by the Graph API
+# after a round trip each (no definitions), or refused locally
+def bad_sends(graph, registry, count, concurrency):
+    def send(number):
+        try:
+            payload = registry.render(number, "order_shiped", "en_US", ["Anna", "#1042", "tomorrow"])
+        except TemplateError:
+            return False
+        return get_graph_client().send_message(payload).status_code == 200
+
+    graph.reset_counters()
+    start = time.perf_counter()
+    sent = sum(fan_out(((f"+35840{i:07d}",) for i in range(count)), send, concurrency))
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": round(seconds, 3),
+        "ms_per_refusal": round(seconds / count * 1000, 3),
+        "sent": sent,
+        "graph_requests": graph.requests,
+    }
+
+
+# What the template registry saves: building the payloads of a template
+# campaign (see campaign()), and refusing bad template sends against a stub
+# Graph API (a round trip each vs. no request at all).
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payloads", type=int, default=100000)
+    parser.add_argument("--bad-sends", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--graph-latency", type=float, default=0.05, help="stub send time in seconds")
+    args = parser.parse_args()
+
+    graph = StubGraphServer(latency=args.graph_latency, templates=TEMPLATES).start()
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, "templates.json")
+    with open(path, "w") as f:
+        json.dump({"data": TEMPLATES}, f)
+    os.environ.update(
+        GRAPH_API_BASE_URL=graph.base_url,
+        WHATSAPP_API_TOKEN="benchmark",
+        WHATSAPP_PHONE_ID="benchmark",
+        GRAPH_POOL_MAXSIZE=str(args.concurrency),
+        TEMPLATES_PATH=path,
+    )
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    registry = get_template_registry()
+    unchecked = TemplateRegistry()
+
+    try:
+        build = {
+            "no_parameters": campaign(args.payloads, "hello_world"),
+            "parameters": campaign(args.payloads, "order_shipped", ["Anna", "#1042", "tomorrow"], ["1042"]),
+        }
+        refusals = {
+            "graph_round_trip": bad_sends(graph, unchecked, args.bad_sends, args.concurrency),
+            "registry": bad_sends(graph, registry, args.bad_sends, args.concurrency),
+        }
+    finally:
+        graph.stop()
+        directory.cleanup()
+
+    print(json.dumps({"config": vars(args), "build": build, "bad_sends": refusals}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+import collections
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+# ASGI/WSGI server each mode is served with
+SERVERS = {"threaded": "gunicorn", "asgi": "uvicorn"}
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "p50_ms": round(pick(0.50) * 1000, 1),
+        "p95_ms": round(pick(0.95) * 1000, 1),
+        "p99_ms": round(pick(0.99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 1),
+        "max_ms": round(samples[-1] * 1000, 1),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode, app, port, threads=32, workers=1):
+    if mode == "threaded":
+        return [
+            sys.executable, "-m", "gunicorn", f"{app}:app",
+            "--worker-class", "gthread", "--workers", str(workers), "--threads", str(threads),
+            "--bind", f"127.0.0.1:{port}", "--log-level", "warning",
+        ]
+    return [
+        sys.executable, "-m", "uvicorn", f"{app}:asgi_app", "--workers", str(workers),
+        "--port", str(port), "--log-level", "warning", "--no-access-log",
+    ]
+
+
+# Start the app under `mode`'s server and wait until it answers
+def start_server(mode, app, env, threads=32, workers=1, timeout=20.0):
+    port = free_port()
+    process = subprocess.Popen(server_command(mode, app, port, threads, workers), env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + "/metrics", timeout=1.0)
+            return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait()
+
+
+# Send `requests` requests with `concurrency` in flight at a time.
+# `make_request(i)` returns the httpx.AsyncClient.request arguments for the
+# i-th request. Statuses are counted by code; transport errors by exception
+# name.
+async def drive(base_url, make_request, requests, concurrency, timeout=120.0):
+    latencies = []
+    statuses = collections.Counter()
+    counter = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(**make_request(i))
+                    status = str(response.status_code)
+                except httpx.TransportError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": dict(sorted(statuses.items())),
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency": percentiles(latencies),
+    }
+
+
+def run_drive(base_url, make_request, requests, concurrency):
+    return asyncio.run(drive(base_url, make_request, requests, concurrency))
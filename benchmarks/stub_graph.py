@@ -0,0 +1,141 @@
+import itertools
+import re
+import time
+
+from benchmarks.stub_server import StubHandler, StubServer
+
+# Graph API error bodies for the injected failures
+ERRORS = {
+    400: {"error": {"message": "(#131053) Media upload error", "type": "OAuthException", "code": 131053}},
+    404: {"error": {"message": "(#132001) Template name does not exist in the translation", "type": "OAuthException",
+                    "code": 132001}},
+    422: {"error": {"message": "(#132000) Number of parameters does not match the expected number of params",
+                    "type": "OAuthException", "code": 132000}},
+    429: {"error": {"message": "(#130429) Rate limit hit", "type": "OAuthException", "code": 130429}},
+    500: {"error": {"message": "An unexpected error has occurred.", "type": "OAuthException", "code": 2}},
+}
+
+
+# Minimal stand-in for the Graph API /{phone_id}/messages and
+# /{phone_id}/media endpoints. Speaks HTTP/1.1 keep-alive and counts
+# accepted TCP connections so benchmarks can show how many handshakes a
+# client actually performed, and counts media uploads and their bytes.
+#
+# With `templates` (message template definitions) it also serves
+# /{account_id}/message_templates and refuses template sends of unknown
+# templates or with the wrong number of body parameters, as the Graph API
+# does.
+class StubGraphServer(StubServer):
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, templates=None, **faults):
+        super().__init__(_GraphHandler, host, port, latency, **faults)
+        self.templates = templates or []
+        # (name, language) -> number of body parameters
+        self._body_params = {
+            (template["name"], template["language"]): sum(
+                len(set(re.findall(r"\{\{\s*(\w+)\s*\}\}", component.get("text", ""))))
+                for component in template.get("components", []) if component.get("type") == "BODY"
+            )
+            for template in self.templates
+        }
+        self._ids = itertools.count(1)
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.media_ids = set()
+
+    # Forget every upload, as the Graph API does after 30 days: sends that
+    # still reference one fail
+    def expire_media(self):
+        with self._lock:
+            self.media_ids.clear()
+
+    def reset_counters(self):
+        super().reset_counters()
+        with self._lock:
+            self.uploads = 0
+            self.upload_bytes = 0
+
+
+class _GraphHandler(StubHandler):
+    def do_GET(self):
+        if "/message_templates" not in self.path:
+            self.send_json({"error": {"message": "Unknown path", "type": "OAuthException", "code": 803}}, 404)
+            return
+        self.send_json({"data": self.server.templates, "paging": {}})
+
+    # 404/422 body for a template send the Graph API would refuse, else None
+    def _template_error(self, payload):
+        if payload.get("type") != "template" or not self.server.templates:
+            return None
+        template = payload.get("template") or {}
+        key = (template.get("name"), (template.get("language") or {}).get("code"))
+        if key not in self.server._body_params:
+            return 404
+        sent = sum(len(component.get("parameters", [])) for component in template.get("components", [])
+                   if component.get("type") == "body")
+        return 422 if sent != self.server._body_params[key] else None
+
+    def do_POST(self):
+        if self.path.endswith("/media"):
+            self._upload()
+            return
+        payload = self.read_json()
+        if self.send_fault(ERRORS):
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        status = self._template_error(payload)
+        if status is not None:
+            self.send_json(ERRORS[status], 400)
+            return
+        media = payload.get(payload.get("type"))
+        if isinstance(media, dict) and "id" in media and media["id"] not in self.server.media_ids:
+            self.send_json(ERRORS[400], 400)
+            return
+        with self.server._lock:
+            message_id = next(self.server._ids)
+
+        self.send_json({
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": payload.get("to"), "wa_id": str(payload.get("to", "")).lstrip("+")}],
+            "messages": [{"id": f"wamid.stub{message_id}"}],
+        })
+
+    # multipart/form-data upload with "messaging_product", "type" and a
+    # final "file" part. Only the start of the body is kept; the file itself
+    # is read in chunks and counted, so big uploads cost the stub no memory.
+    def _upload(self):
+        length = int(self.headers.get("Content-Length", 0))
+        head = self.rfile.read(min(length, 65536))
+        remaining = length - len(head)
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        if self.send_fault(ERRORS):
+            return
+
+        delimiter = b"--" + self.headers.get_param("boundary", "").encode()
+        fields, file_size, offset = {}, None, 0
+        for part in head.split(delimiter)[1:]:
+            offset = head.index(part, offset)
+            header, _, value = part.partition(b"\r\n\r\n")
+            name = re.search(rb'name="([^"]*)"', header)
+            if name is None:
+                continue
+            if b"filename=" in header:
+                file_size = length - (offset + len(header) + 4) - len(b"\r\n" + delimiter + b"--\r\n")
+                break
+            fields[name.group(1).decode()] = value[:-2].decode()
+        if fields.get("messaging_product") != "whatsapp" or not fields.get("type") or not file_size:
+            self.send_json({"error": {"message": "(#100) Invalid parameter", "type": "OAuthException", "code": 100}},
+                           400)
+            return
+        with self.server._lock:
+            media_id = f"media.stub{next(self.server._ids)}"
+            self.server.media_ids.add(media_id)
+            self.server.uploads += 1
+            self.server.upload_bytes += file_size
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_json({"id": media_id})
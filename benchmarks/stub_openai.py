@@ -0,0 +1,228 @@
+import itertools
+import json
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+
+from benchmarks.stub_server import StubHandler, StubServer
+
+ANSWER = (
+    "Thanks for your message! We are open from nine to five on weekdays. "
+    "On weekends the shop is closed, but you can still order online."
+)
+
+# OpenAI error bodies for the injected failures
+ERRORS = {
+    429: {"error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}},
+    500: {"error": {"message": "The server had an error while processing your request.", "type": "server_error", "code": None}},
+}
+
+
+# Minimal stand-in for the OpenAI /v1/chat/completions endpoint, plain or
+# streamed (server-sent events). `latency` is the time to the full answer;
+# streamed answers spread it over their chunks.
+#
+# It also fakes the Files and Batch APIs: an uploaded JSONL batch completes
+# `batch_latency` seconds after it was created, with `batch_failure_rate` of
+# its requests answered 500 in the error file.
+class StubOpenAIServer(StubServer):
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, answer=ANSWER, chunk_chars=12,
+                 batch_latency=1.0, batch_failure_rate=0.0, **faults):
+        super().__init__(_OpenAIHandler, host, port, latency, **faults)
+        self.answer = answer
+        self.chunk_chars = chunk_chars
+        self.batch_latency = batch_latency
+        self.batch_failure_rate = batch_failure_rate
+        self.files = {}
+        self.batches = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def base_url(self):
+        return super().base_url + "/v1"
+
+
+def _usage(answer):
+    return {"prompt_tokens": 20, "completion_tokens": len(answer) // 4, "total_tokens": 20 + len(answer) // 4}
+
+
+def _completion(completion_id, model, answer):
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer},
+            "finish_reason": "stop",
+        }],
+        "usage": _usage(answer),
+    }
+
+
+class _OpenAIHandler(StubHandler):
+    def do_POST(self):
+        if self.path.endswith("/files"):
+            self._upload()
+            return
+        body = self.read_json()
+        if self.send_fault(ERRORS):
+            return
+        if self.path.endswith("/batches"):
+            self._create_batch(body)
+            return
+        with self.server._lock:
+            completion_id = f"chatcmpl-stub{next(self.server._ids)}"
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            self._stream(completion_id, body.get("model", "stub"), include_usage)
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_json(_completion(completion_id, body.get("model", "stub"), self.server.answer))
+
+    def do_GET(self):
+        if self.send_fault(ERRORS):
+            return
+        parts = self.path.strip("/").split("/")
+        if parts[-2:-1] == ["batches"] and parts[-1] in self.server.batches:
+            self.send_json(self._finish_batch(parts[-1]))
+        elif parts[-1] == "content" and parts[-2] in self.server.files:
+            data = self.server.files[parts[-2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            self.count(200)
+        else:
+            self.send_json({"error": {"message": "Not found", "type": "invalid_request_error"}}, 404)
+
+    # multipart/form-data upload with a "file" and a "purpose" field
+    def _upload(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if self.send_fault(ERRORS):
+            return
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + raw
+        )
+        fields = {}
+        for part in message.iter_parts():
+            fields[part.get_param("name", header="content-disposition")] = (
+                part.get_filename(), part.get_payload(decode=True)
+            )
+        filename, content = fields["file"]
+        purpose = fields.get("purpose", (None, b"batch"))[1].decode()
+        self.send_json(self._store_file(filename, content, purpose))
+
+    def _store_file(self, filename, content, purpose):
+        with self.server._lock:
+            file_id = f"file-stub{next(self.server._ids)}"
+        file = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        self.server.files[file_id] = {**file, "content": content}
+        return file
+
+    def _create_batch(self, body):
+        with self.server._lock:
+            batch_id = f"batch_stub{next(self.server._ids)}"
+        requests = self.server.files[body["input_file_id"]]["content"].decode().splitlines()
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(requests), "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        self.server.batches[batch_id] = {**batch, "started": time.monotonic()}
+        self.send_json(batch)
+
+    # Answers the whole batch the first time it is seen after batch_latency
+    def _finish_batch(self, batch_id):
+        batch = self.server.batches[batch_id]
+        if batch["status"] == "in_progress" and time.monotonic() - batch["started"] >= self.server.batch_latency:
+            output, errors = [], []
+            for line in self.server.files[batch["input_file_id"]]["content"].decode().splitlines():
+                request = json.loads(line)
+                with self.server._lock:
+                    failed = self.server._random.random() < self.server.batch_failure_rate
+                    request_id = f"req_stub{next(self.server._ids)}"
+                if failed:
+                    response = {"status_code": 500, "request_id": request_id, "body": ERRORS[500]}
+                    errors.append(json.dumps({"id": request_id, "custom_id": request["custom_id"],
+                                              "response": response, "error": None}))
+                else:
+                    body = _completion(f"chatcmpl-{request_id}", request["body"].get("model", "stub"),
+                                       self.server.answer)
+                    response = {"status_code": 200, "request_id": request_id, "body": body}
+                    output.append(json.dumps({"id": request_id, "custom_id": request["custom_id"],
+                                              "response": response, "error": None}))
+            if output:
+                batch["output_file_id"] = self._store_file(
+                    f"{batch_id}_output.jsonl", "\n".join(output).encode(), "batch_output")["id"]
+            if errors:
+                batch["error_file_id"] = self._store_file(
+                    f"{batch_id}_errors.jsonl", "\n".join(errors).encode(), "batch_output")["id"]
+            batch["request_counts"] = {
+                "total": len(output) + len(errors), "completed": len(output), "failed": len(errors)
+            }
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+        return {name: value for name, value in batch.items() if name != "started"}
+
+    def _stream(self, completion_id, model, include_usage=False):
+        answer = self.server.answer
+        size = self.server.chunk_chars
+        pieces = [answer[i:i + size] for i in range(0, len(answer), size)]
+        delay = self.server.latency / max(1, len(pieces))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.count(200)
+        for piece in pieces:
+            if delay:
+                time.sleep(delay)
+            self._write_event({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            })
+        if include_usage:
+            self._write_event({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": _usage(answer),
+            })
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_event(self, data):
+        self._write_chunk(f"data: {json.dumps(data)}\n\n".encode())
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
@@ -0,0 +1,120 @@
+import collections
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Common part of the upstream stand-ins: a threaded HTTP/1.1 server that
+# counts connections, requests and response statuses, and fails a share of
+# requests on purpose. `throttle_rate` of the requests get a 429 with a
+# Retry-After of `retry_after` seconds, `error_rate` get a 500. `seed` makes
+# the sequence of injected failures repeatable across runs.
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, handler, host="127.0.0.1", port=0, latency=0.0,
+                 error_rate=0.0, throttle_rate=0.0, retry_after=1.0, seed=None):
+        super().__init__((host, port), handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.connections = 0
+        self.requests = 0
+        self.statuses = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_counters(self):
+        with self._lock:
+            self.connections = 0
+            self.requests = 0
+            self.statuses.clear()
+
+    # Counters as a JSON-friendly dict
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            }
+
+    # Counts a request and picks its fate: 429 or 500 to fail it, None to
+    # answer it normally
+    def draw_fault(self):
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    # Says so when the connection closes after this response (the request
+    # asked for it), so the client does not reuse the socket meanwhile. Every
+    # response, send_json or hand-written, passes through here.
+    def end_headers(self):
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, data, status=200, headers=None):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        self.count(status)
+
+    def count(self, status):
+        with self.server._lock:
+            self.server.statuses[status] += 1
+
+    # Answer with the injected failure, if any. `errors` maps the status to
+    # the upstream's error body.
+    def send_fault(self, errors):
+        status = self.server.draw_fault()
+        if status is None:
+            return False
+        headers = {"Retry-After": str(self.server.retry_after)} if status == 429 else None
+        self.send_json(errors[status], status, headers)
+        return True
+
+    def log_message(self, format, *args):
+        pass
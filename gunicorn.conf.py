@@ -0,0 +1,66 @@
+# Production settings, picked up automatically by `gunicorn main_en:app` (or
+# main:app) when started from the project directory. Every value can be
+# overridden with the environment variables below or on the command line.
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+from whatsapp_bot.config import env_bool, env_float, env_int
+
+# The app loads .env itself, but these settings are read before it is imported
+load_dotenv()
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# One process per core; the work is mostly waiting on OpenAI and the Graph
+# API, so each process serves many requests at once on threads (gthread) or
+# on an event loop (SERVER_MODE=asgi, serve main_en:asgi_app).
+workers = env_int("WEB_CONCURRENCY", multiprocessing.cpu_count())
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    worker_class = "gthread"
+    threads = env_int("GUNICORN_THREADS", 16)
+
+# Import the app once in the master before forking, so configuration and
+# the OpenAI client are set up once and shared copy-on-write. Connection
+# pools and send queue threads are created lazily inside each worker.
+preload_app = env_bool("GUNICORN_PRELOAD", True)
+
+# An AI answer can take a while (generation plus retries), so a worker is
+# only considered hung after `timeout` seconds without a heartbeat
+timeout = env_int("GUNICORN_TIMEOUT", 120)
+graceful_timeout = env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = env_int("GUNICORN_KEEPALIVE", 5)
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+# Start the send queue in each worker as soon as it is up: with the durable
+# outbox (SEND_QUEUE_BACKEND=sqlite) this replays the jobs a crashed worker
+# left unfinished instead of waiting for the next request. Unfinished AI
+# batches and scheduled sends that are due are picked up the same way.
+def post_worker_init(worker):
+    from whatsapp_bot.ai_batch import start_ai_batches
+    from whatsapp_bot.scheduler import start_scheduler
+    from whatsapp_bot.send_queue import start_send_queue
+
+    start_send_queue()
+    start_ai_batches()
+    start_scheduler()
+
+
+# On SIGTERM gunicorn stops accepting connections and lets in-flight
+# requests finish; after that, finish the sends still waiting on the
+# background queue. The drain has to end before graceful_timeout, when the
+# master kills the worker.
+def worker_exit(server, worker):
+    from whatsapp_bot.send_queue import shutdown_send_queue
+
+    drain_timeout = env_float("SEND_QUEUE_DRAIN_TIMEOUT", max(1.0, graceful_timeout - 5.0))
+    left = shutdown_send_queue(timeout=drain_timeout)
+    if left:
+        server.log.warning(f"Worker {worker.pid} exited with {left} queued sends not delivered")
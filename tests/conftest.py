@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from benchmarks.stub_graph import StubGraphServer
+from benchmarks.stub_openai import StubOpenAIServer
+
+
+# The app reads its settings when whatsapp_bot.core is imported, so the
+# stubs it talks to are started and the environment is set up before any
+# test imports it
+@pytest.fixture(scope="session")
+def stubs(tmp_path_factory):
+    data = tmp_path_factory.mktemp("data")
+    graph = StubGraphServer().start()
+    openai = StubOpenAIServer().start()
+    os.environ.update(
+        GRAPH_API_BASE_URL=graph.base_url,
+        OPENAI_BASE_URL=openai.base_url,
+        OPENAI_API_KEY="test",
+        WHATSAPP_API_TOKEN="test",
+        WHATSAPP_PHONE_ID="test",
+        RATE_LIMIT_ENABLED="false",
+        AI_CACHE_ENABLED="false",
+        SEMANTIC_CACHE_ENABLED="false",
+        LOG_LEVEL="WARNING",
+        MEDIA_DIR=str(data),
+        SCHEDULE_PATH=str(data / "schedule.db"),
+        AI_BATCH_PATH=str(data / "ai_batches.db"),
+    )
+    yield {"graph": graph, "openai": openai, "data": data}
+    graph.stop()
+    openai.stop()
+
+
+@pytest.fixture(scope="session")
+def core(stubs):
+    from whatsapp_bot.locales import load_app
+
+    return load_app("en")
+
+
+@pytest.fixture
+def client(core, stubs):
+    stubs["graph"].reset_counters()
+    return core.app.test_client()
+
+
+# Fake time for the clock= arguments: stands still until a test moves `now`
+# (or calls sleep, for the sleep= arguments)
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return Clock()
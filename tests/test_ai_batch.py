@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import time
+from types import SimpleNamespace
+
+from openai import OpenAI
+
+from whatsapp_bot.ai_batch import SCHEMA, SENDING, SUBMITTED, AIBatchRunner
+from whatsapp_bot.rate_limit import RateLimited
+
+
+class Sends:
+    def __init__(self):
+        self.messages = []
+
+    def __call__(self, phone_number, answer):
+        self.messages.append((phone_number, answer))
+        return True
+
+
+def messages(question):
+    return [{"role": "user", "content": question}]
+
+
+def finished(runner, batch_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while (batch := runner.get(batch_id))["status"] not in ("completed", "failed"):
+        assert time.monotonic() < deadline, batch
+        time.sleep(0.02)
+    return batch
+
+
+# A batch as a runner that stopped in `status` left it; items are
+# (phone_number, answer, item status)
+def store_batch(path, status, items, openai_batch_id=None, owner=None):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript(SCHEMA)
+    now = time.time()
+    conn.execute(
+        "INSERT INTO ai_batches (id, status, route, params, openai_batch_id, owner, lease_until, created_at, "
+        "updated_at) VALUES ('b1', ?, 'standard', ?, ?, ?, ?, ?, ?)",
+        (status, json.dumps({"model": "gpt-4o-mini"}), openai_batch_id, owner, now + 300.0 if owner else 0, now, now),
+    )
+    conn.executemany(
+        "INSERT INTO ai_batch_items (batch_id, seq, phone_number, question, answer, status) "
+        "VALUES ('b1', ?, ?, 'When are you open?', ?, ?)",
+        [(seq, *item) for seq, item in enumerate(items)],
+    )
+    conn.close()
+
+
+def item_states(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT status, error FROM ai_batch_items ORDER BY seq").fetchall()
+    finally:
+        conn.close()
+
+
+def test_batch_is_submitted_collected_and_delivered_in_order(stubs, tmp_path, monkeypatch):
+    monkeypatch.setattr(stubs["openai"], "batch_latency", 0.1)
+    runner = AIBatchRunner(path=str(tmp_path / "ai_batches.db"), poll_interval=0.05, send_concurrency=1)
+    sends = Sends()
+    runner.bind(OpenAI(api_key="test", base_url=stubs["openai"].base_url, max_retries=0), messages, sends)
+
+    batch_id = runner.create([("+358401", "When are you open?"), ("+358402", "Do you ship to Sweden?")])
+    batch = finished(runner, batch_id)
+
+    assert batch["status"] == "completed"
+    assert batch["openai_status"] == "completed"
+    assert batch["recipients"] == {"pending": 0, "answered": 0, "sent": 2, "failed": 0}
+    assert sends.messages == [("+358401", stubs["openai"].answer), ("+358402", stubs["openai"].answer)]
+
+
+def test_reopened_runner_sends_only_the_answers_not_sent_yet(tmp_path):
+    path = str(tmp_path / "ai_batches.db")
+    store_batch(path, SENDING, [
+        ("+358401", "Nine to five.", "sent"), ("+358402", "Nine to five.", "answered"),
+        ("+358403", None, "failed"), ("+358404", "Nine to five.", "answered"),
+    ], owner=f"{os.getpid()}:previous")
+    runner = AIBatchRunner(path=path, poll_interval=0.05)
+    sends = Sends()
+    runner.bind(object(), messages, sends)
+
+    runner.start()
+
+    assert finished(runner, "b1")["recipients"]["sent"] == 3
+    assert sorted(sends.messages) == [("+358402", "Nine to five."), ("+358404", "Nine to five.")]
+
+
+def test_completion_without_content_fails_only_its_recipient(tmp_path):
+    path = str(tmp_path / "ai_batches.db")
+    store_batch(path, SUBMITTED, [("+358401", None, "pending"), ("+358402", None, "pending")],
+                openai_batch_id="batch_1")
+    output = "\n".join(json.dumps({
+        "custom_id": str(seq),
+        "response": {"status_code": 200, "body": {"choices": [{"message": {"role": "assistant", "content": content}}]}},
+    }) for seq, content in enumerate(["Nine to five.", None]))
+    client = SimpleNamespace(
+        batches=SimpleNamespace(retrieve=lambda batch_id: SimpleNamespace(
+            status="completed", output_file_id="file_1", error_file_id=None, errors=None)),
+        files=SimpleNamespace(content=lambda file_id: SimpleNamespace(text=output)),
+    )
+    runner = AIBatchRunner(path=path, poll_interval=0.05)
+    sends = Sends()
+    runner.bind(client, messages, sends)
+
+    runner.start()
+
+    assert finished(runner, "b1")["status"] == "completed"
+    assert item_states(path) == [("sent", None), ("failed", "empty answer")]
+    assert sends.messages == [("+358401", "Nine to five.")]
+
+
+def test_send_waiting_out_a_rate_limit_is_given_up_with_the_lease(tmp_path, monkeypatch):
+    runner = AIBatchRunner(path=str(tmp_path / "ai_batches.db"))
+
+    def send(phone_number, answer):
+        raise RateLimited(0.0)
+
+    runner.bind(object(), messages, send)
+    monkeypatch.setattr(runner, "_claim", lambda batch_id: False)
+
+    assert runner._send_item("b1", 0, "+358401", "Nine to five.") == (0, None, "lease lost")
+
+
+def test_send_ai_batch_retry_with_same_idempotency_key_is_replayed(client):
+    body = {"recipients": ["358401", "358402"], "question": "When are you open?"}
+    headers = {"Idempotency-Key": "ai-batch-campaign-1"}
+
+    first = client.post("/send_ai_batch", json=body, headers=headers)
+    replay = client.post("/send_ai_batch", json=body, headers=headers)
+
+    assert first.status_code == replay.status_code == 202
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.get_json()["batch_id"] == first.get_json()["batch_id"]
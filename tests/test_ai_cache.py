@@ -0,0 +1,37 @@
+from whatsapp_bot.ai_cache import MemoryBackend, ResponseCache, cache_key, normalize_question
+
+
+def test_questions_differing_in_case_spacing_and_punctuation_share_a_key():
+    assert normalize_question("  What are your OPENING   hours?? ") == "what are your opening hours"
+    assert cache_key("gpt-4o", "prompt", "Opening hours?") == cache_key("gpt-4o", "prompt", "opening hours")
+    assert cache_key("gpt-4o", "prompt", "Opening hours?") != cache_key("gpt-4o-mini", "prompt", "opening hours")
+    assert cache_key("gpt-4o", "prompt", "Opening hours?") != cache_key("gpt-4o", "other prompt", "opening hours")
+
+
+def test_answers_are_served_until_they_expire(clock):
+    cache = ResponseCache(MemoryBackend(clock=clock), ttl=60.0)
+
+    cache.set("gpt-4o", "prompt", "When are you open?", "Nine to five.")
+
+    assert cache.get("gpt-4o", "prompt", "when are you open") == "Nine to five."
+    clock.now = 61.0
+    assert cache.get("gpt-4o", "prompt", "when are you open") is None
+
+
+def test_least_recently_used_entries_go_over_the_limits():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", "1", 60.0)
+    backend.set("b", "2", 60.0)
+    backend.get("a")
+    backend.set("c", "3", 60.0)
+
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == ("1", None, "3")
+
+    backend = MemoryBackend(max_bytes=500)
+    backend.set("a", "x" * 100, 60.0)
+    backend.set("b", "x" * 100, 60.0)
+    backend.set("huge", "x" * 1000, 60.0)
+
+    assert backend.get("a") is None
+    assert backend.get("huge") is None
+    assert backend.bytes <= 500
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+
+# One request to the ASGI app, as an ASGI server would make it: (status,
+# headers, body)
+async def call(app, method, path, body=None, headers=None, query=b""):
+    data = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+        + [(b"content-type", b"application/json")],
+    }
+    messages = [{"type": "http.request", "body": data, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = sent[0]
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return start["status"], {name.decode(): value.decode() for name, value in start["headers"]}, body
+
+
+def run(core, requests):
+    async def main():
+        try:
+            return [await call(core.asgi_app, *request) for request in requests]
+        finally:
+            await core.close_async_graph_client()
+    return asyncio.run(main())
+
+
+def test_retry_with_same_idempotency_key_is_replayed_without_a_second_send(core, stubs):
+    stubs["graph"].reset_counters()
+    body = {"phone_number": "358401", "message": "Hello"}
+    headers = {"Idempotency-Key": "asgi-send-1"}
+
+    (status, _, first), (replay_status, replay_headers, replay) = run(core, [
+        ("POST", "/send_message", body, headers),
+        ("POST", "/send_message", body, headers),
+    ])
+
+    assert status == 200
+    assert replay_status == 200
+    assert replay_headers["idempotent-replayed"] == "true"
+    assert replay == first
+    assert stubs["graph"].requests == 1
+
+
+def test_same_idempotency_key_with_another_body_is_refused(core):
+    headers = {"Idempotency-Key": "asgi-send-2"}
+
+    (status, _, _), (mismatch, _, _) = run(core, [
+        ("POST", "/send_message", {"phone_number": "358401", "message": "Hello"}, headers),
+        ("POST", "/send_message", {"phone_number": "358401", "message": "Goodbye"}, headers),
+    ])
+
+    assert status == 200
+    assert mismatch == 422
+
+
+def test_async_send_is_queued_and_its_job_can_be_looked_up(core, stubs):
+    (status, _, body), = run(core, [
+        ("POST", "/send_message", {"phone_number": "358401", "message": "Hello", "async": True}),
+    ])
+    assert status == 202
+    job_id = json.loads(body)["job_id"]
+
+    (status, _, body), = run(core, [("GET", f"/jobs/{job_id}")])
+    assert status == 200
+    assert json.loads(body)["job_id"] == job_id
+
+    (status, _, _), = run(core, [("GET", "/jobs/no-such-job")])
+    assert status == 404
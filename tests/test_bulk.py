@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+
+from whatsapp_bot.bulk import build_bulk_items, bulk_concurrency, fan_out
+
+
+def test_fan_out_keeps_at_most_concurrency_sends_in_flight():
+    in_flight = peak = 0
+    lock = threading.Lock()
+
+    def send(number):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return number
+
+    results = list(fan_out(((i,) for i in range(20)), send, concurrency=4))
+
+    assert sorted(results) == list(range(20))
+    assert peak == 4
+
+
+def test_recipients_can_override_the_shared_message():
+    items = list(build_bulk_items({
+        "recipients": ["358401", {"phone_number": "+358402", "message": "Hei Anna!"}, {"message": "nobody"}],
+        "message": "Hello!",
+    }))
+
+    assert [(number, payload and payload["text"]["body"]) for number, payload, _ in items] == [
+        ("+358401", "Hello!"), ("+358402", "Hei Anna!"), (None, None),
+    ]
+
+
+def test_template_content_is_shared_by_recipients_without_overrides():
+    items = list(build_bulk_items({
+        "recipients": ["358401", "358402", {"phone_number": "358403", "parameters": ["Anna"]}],
+        "template_name": "order_shipped",
+        "parameters": ["Ville"],
+    }))
+
+    templates = [payload["template"] for _, payload, _ in items]
+    assert templates[0] is templates[1]
+    assert templates[2]["components"][0]["parameters"][0]["text"] == "Anna"
+
+
+def test_bulk_concurrency_is_clamped(monkeypatch):
+    monkeypatch.setenv("BULK_MAX_CONCURRENCY", "8")
+
+    assert [bulk_concurrency(value) for value in (0, 4, 100, "lots")] == [1, 4, 8, 8]
+
+
+def test_send_bulk_streams_one_line_per_recipient_and_a_summary(client, stubs):
+    response = client.post("/send_bulk", json={"recipients": ["358401", "358402", {"message": "no number"}],
+                                               "message": "Hello!"})
+
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line["success"] for line in lines[:-1]) == [False, True, True]
+    assert lines[-1] == {"summary": {"total": 3, "sent": 2, "failed": 1}}
+    assert stubs["graph"].requests == 2
+
+
+def test_send_bulk_refuses_missing_or_too_many_recipients(client, monkeypatch):
+    monkeypatch.setenv("BULK_MAX_RECIPIENTS", "2")
+
+    assert client.post("/send_bulk", json={"message": "Hello!"}).status_code == 400
+    assert client.post("/send_bulk", json={"recipients": ["1", "2", "3"], "message": "Hello!"}).status_code == 400
+
+
+def test_send_bulk_retry_with_same_idempotency_key_is_replayed(client, stubs):
+    body = {"recipients": ["358401", "358402", "358403"], "message": "Hello!"}
+    headers = {"Idempotency-Key": "bulk-campaign-1"}
+
+    first = client.post("/send_bulk", json=body, headers=headers)
+    lines = first.get_data(as_text=True).splitlines()
+    replay = client.post("/send_bulk", json=body, headers=headers)
+
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.mimetype == "application/x-ndjson"
+    assert replay.get_data(as_text=True).splitlines() == lines
+    assert stubs["graph"].requests == 3
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+from whatsapp_bot.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from whatsapp_bot.retry import RetryPolicy
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", failure_rate=0.5, min_calls=4, window=10.0, open_seconds=30.0, clock=clock)
+
+
+def test_opens_once_enough_calls_fail_and_fails_fast(breaker):
+    for healthy in (True, False, True):
+        breaker.record(healthy)
+    assert breaker.state == CLOSED
+
+    breaker.record(False)
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as error:
+        breaker.allow()
+    assert error.value.retry_after == pytest.approx(30.0)
+
+
+def test_old_outcomes_leave_the_window(breaker, clock):
+    breaker.record(False)
+    breaker.record(False)
+    clock.now += 11.0
+    breaker.record(True)
+    breaker.record(False)
+    breaker.record(True)
+
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls"] == 3
+
+
+def test_calls_that_never_reached_the_upstream_do_not_count(breaker):
+    for _ in range(10):
+        breaker.record(None)
+
+    assert breaker.snapshot()["calls"] == 0
+
+
+def test_half_open_probe_closes_or_reopens_the_circuit(breaker, clock):
+    for _ in range(4):
+        breaker.record(False)
+    clock.now += 31.0
+
+    probe = breaker.allow()
+    assert probe is True
+    assert breaker.state == HALF_OPEN
+    # One probe at a time
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record(False, probe)
+    assert breaker.state == OPEN
+
+    clock.now += 31.0
+    breaker.record(True, breaker.allow())
+    assert breaker.state == CLOSED
+    assert breaker.allow() is False
+
+
+def test_retry_policy_reports_outages_to_its_breaker(breaker):
+    policy = RetryPolicy("test", max_attempts=1, breaker=breaker)
+
+    for _ in range(4):
+        policy.call(lambda: SimpleNamespace(status_code=503, headers={}))
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        policy.call(lambda: pytest.fail("called while the circuit is open"))
+
+
+def test_disabled_breaker_lets_everything_through(clock):
+    breaker = CircuitBreaker("test", min_calls=1, enabled=False, clock=clock)
+
+    breaker.record(False)
+
+    assert breaker.allow() is False
+    assert breaker.snapshot()["state"] == "disabled"
@@ -0,0 +1,35 @@
+from whatsapp_bot import conversations
+from whatsapp_bot.conversations import ASSISTANT, USER, ConversationStore
+
+
+def test_memory_is_off_unless_enabled(monkeypatch):
+    monkeypatch.delenv("CONVERSATION_MEMORY_ENABLED", raising=False)
+    assert conversations.get_conversation_store() is None
+
+    monkeypatch.setenv("CONVERSATION_MEMORY_ENABLED", "true")
+    assert isinstance(conversations.get_conversation_store(), ConversationStore)
+
+
+def test_history_keeps_the_newest_exchanges_within_the_budget():
+    store = ConversationStore(token_budget=1000, max_turns=10)
+    store.append("+358401", "When are you open?", "Nine to five.")
+    store.append("358401", "And tomorrow?", "Tomorrow too.")
+
+    summary, turns = store.history("358401")
+
+    assert summary == ""
+    assert turns == [(USER, "When are you open?"), (ASSISTANT, "Nine to five."),
+                     (USER, "And tomorrow?"), (ASSISTANT, "Tomorrow too.")]
+    assert store.history("358402") == ("", [])
+
+
+def test_old_exchanges_are_folded_into_the_summary():
+    store = ConversationStore(token_budget=1000, max_turns=2)
+    needs_compact = [store.append("358401", f"question {i}", f"answer {i}") for i in range(3)]
+    assert needs_compact == [False, False, True]
+
+    store.compact("358401", lambda summary, turns: "asked " + ", ".join(text for role, text in turns if role == USER))
+
+    summary, turns = store.history("358401")
+    assert summary == "asked question 0, question 1"
+    assert turns == [(USER, "question 2"), (ASSISTANT, "answer 2")]
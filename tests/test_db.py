@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+from whatsapp_bot.db import Database
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS sends (id INTEGER PRIMARY KEY, status TEXT NOT NULL);"
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "test.db"), SCHEMA, synchronous="NORMAL")
+
+
+def test_statements_of_a_transaction_commit_together(db):
+    db.transaction([
+        ("INSERT INTO sends (id, status) VALUES (?, ?)", [(1, "pending"), (2, "pending")]),
+        ("UPDATE sends SET status = ? WHERE id = ?", [("sent", 1)]),
+    ])
+
+    assert db.query("SELECT id, status FROM sends ORDER BY id") == [(1, "sent"), (2, "pending")]
+    assert db.update("UPDATE sends SET status = 'sent' WHERE status = 'pending'") == 1
+
+
+def test_failed_transaction_is_rolled_back(db):
+    with pytest.raises(sqlite3.IntegrityError):
+        db.transaction([
+            ("INSERT INTO sends (id, status) VALUES (?, ?)", [(1, "pending")]),
+            ("INSERT INTO sends (id, status) VALUES (?, ?)", [(1, "duplicate")]),
+        ])
+
+    with pytest.raises(RuntimeError):
+        with db.begin() as conn:
+            conn.execute("INSERT INTO sends (id, status) VALUES (2, 'pending')")
+            raise RuntimeError("submit failed")
+
+    assert db.query("SELECT COUNT(*) FROM sends") == [(0,)]
+
+
+def test_reopened_database_sees_committed_rows(db):
+    db.update("INSERT INTO sends (id, status) VALUES (1, 'pending')")
+
+    assert Database(db.path, SCHEMA).query("SELECT status FROM sends") == [("pending",)]
@@ -0,0 +1,54 @@
+import io
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.stub_graph import StubGraphServer
+from whatsapp_bot.graph_client import GraphClient, MultipartStream, is_throttled, sent_message_id
+from whatsapp_bot.payloads import text_payload
+
+
+@pytest.fixture
+def graph():
+    server = StubGraphServer().start()
+    yield server
+    server.stop()
+
+
+def response(status, body):
+    return SimpleNamespace(status_code=status, json=lambda: body)
+
+
+@pytest.mark.parametrize("keep_alive, connections", [(True, 1), (False, 10)])
+def test_sends_reuse_pooled_connections(graph, keep_alive, connections):
+    client = GraphClient("token", "phone", base_url=graph.base_url, keep_alive=keep_alive)
+
+    responses = [client.send_message(text_payload(f"+35840{i}", "Hello")) for i in range(10)]
+
+    assert [r.status_code for r in responses] == [200] * 10
+    assert sent_message_id(responses[0]).startswith("wamid.")
+    assert graph.requests == 10
+    assert graph.connections == connections
+    client.close()
+
+
+def test_throttling_is_recognised_by_its_error_code():
+    assert is_throttled(response(400, {"error": {"code": 131056}}))
+    assert is_throttled(response(429, {"error": {"code": 130429}}))
+    assert not is_throttled(response(400, {"error": {"code": 131053}}))
+    assert not is_throttled(response(200, {"messages": [{"id": "wamid.1"}]}))
+
+
+def test_multipart_body_is_read_in_blocks_with_its_length_up_front():
+    body = MultipartStream({"type": "image/png"}, "file", 'lo"go.png', io.BytesIO(b"x" * 5000), "image/png", 5000)
+
+    blocks = []
+    while block := body.read(1024):
+        blocks.append(block)
+    data = b"".join(blocks)
+
+    assert len(data) == len(body)
+    assert max(map(len, blocks)) <= 1024
+    assert b'filename="lo%22go.png"' in data
+    assert b"x" * 5000 in data
+    assert body.content_type.startswith("multipart/form-data; boundary=")
@@ -0,0 +1,74 @@
+from whatsapp_bot.idempotency import DONE, PENDING, IdempotencyStore, MemoryBackend, get_idempotency_store
+
+
+def test_key_is_claimed_once_and_completed_with_its_record():
+    store = IdempotencyStore(MemoryBackend(), ttl=60.0, pending_ttl=10.0)
+
+    assert store.claim("k", fingerprint="a") is None
+    assert store.claim("k", fingerprint="a") == {"state": PENDING, "fingerprint": "a"}
+
+    store.complete("k", {"fingerprint": "a", "status": 200, "body": "{}"})
+    assert store.claim("k") == {"fingerprint": "a", "status": 200, "body": "{}", "state": DONE}
+
+
+def test_released_and_expired_claims_can_be_claimed_again(clock):
+    store = IdempotencyStore(MemoryBackend(clock=clock), ttl=60.0, pending_ttl=10.0)
+
+    store.claim("failed")
+    store.release("failed")
+    assert store.claim("failed") is None
+
+    # A worker that died mid-request does not block its key for longer than
+    # pending_ttl, and completed keys are kept for ttl
+    store.claim("crashed")
+    store.claim("done")
+    store.complete("done", {"status": 200})
+    clock.now = 11.0
+    assert store.claim("crashed") is None
+    assert store.claim("done")["state"] == DONE
+    clock.now = 72.0
+    assert store.claim("done") is None
+
+
+def test_oldest_keys_go_over_the_cap():
+    backend = MemoryBackend(max_entries=2)
+    store = IdempotencyStore(backend)
+    for key in ("a", "b", "c"):
+        store.claim(key)
+
+    assert len(backend) == 2
+    assert store.claim("a") is None
+
+
+def test_retry_with_same_key_is_replayed_without_a_second_send(client, stubs):
+    body = {"phone_number": "358401", "message": "Hello"}
+    headers = {"Idempotency-Key": "flask-send-1"}
+
+    first = client.post("/send_message", json=body, headers=headers)
+    replay = client.post("/send_message", json=body, headers=headers)
+
+    assert first.status_code == 200
+    assert replay.status_code == 200
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.get_json() == first.get_json()
+    assert stubs["graph"].requests == 1
+
+
+def test_same_key_with_another_body_is_refused(client, stubs):
+    headers = {"Idempotency-Key": "flask-send-2"}
+
+    client.post("/send_message", json={"phone_number": "358401", "message": "Hello"}, headers=headers)
+    mismatch = client.post("/send_message", json={"phone_number": "358401", "message": "Goodbye"}, headers=headers)
+
+    assert mismatch.status_code == 422
+    assert stubs["graph"].requests == 1
+
+
+def test_same_key_while_the_first_request_runs_is_refused(client, stubs):
+    get_idempotency_store().claim("/send_message:flask-send-3")
+
+    response = client.post("/send_message", json={"phone_number": "358401", "message": "Hello"},
+                           headers={"Idempotency-Key": "flask-send-3"})
+
+    assert response.status_code == 409
+    assert stubs["graph"].requests == 0
@@ -0,0 +1,34 @@
+import json
+import os
+import string
+
+import pytest
+
+from whatsapp_bot.locales import DEFAULT_LOCALE, LOCALES_DIR
+
+
+def read(name):
+    with open(os.path.join(LOCALES_DIR, f"{name}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def fields(text):
+    return {name for _, name, _, _ in string.Formatter().parse(text) if name is not None}
+
+
+LOCALES = sorted(name[:-5] for name in os.listdir(LOCALES_DIR)
+                 if name.endswith(".json") and name[:-5] != DEFAULT_LOCALE)
+
+
+# A key missing from a locale would silently fall back to English
+@pytest.mark.parametrize("locale", LOCALES)
+def test_locale_has_the_same_keys_as_english(locale):
+    assert set(read(locale)) == set(read(DEFAULT_LOCALE))
+
+
+@pytest.mark.parametrize("locale", LOCALES)
+def test_locale_strings_take_the_same_placeholders(locale):
+    english = read(DEFAULT_LOCALE)
+    strings = read(locale)
+    assert {key: fields(text) for key, text in strings.items()} == \
+        {key: fields(english[key]) for key in strings if key in english}
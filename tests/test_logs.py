@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+
+import pytest
+
+from whatsapp_bot import logs
+
+
+# Puts back the root logger and the background handler (the app's, if it
+# has been imported) that configure_logging() replaces
+@pytest.fixture
+def configured(monkeypatch):
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    root = logging.getLogger()
+    level, handlers = root.level, list(root.handlers)
+    state = {name: getattr(logs, name) for name in ("_queue_handler", "_handlers", "_queue_size")}
+    running = logs._listener is not None
+    yield
+    logs._stop_listener()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+    for name, value in state.items():
+        setattr(logs, name, value)
+    if running:
+        logs._start_listener()
+
+
+def test_queued_records_are_written_when_the_listener_stops(configured, capsys):
+    logs.configure_logging()
+    for i in range(500):
+        logging.getLogger("test").info("record %d", i, extra={"seq": i})
+
+    logs._stop_listener()
+
+    lines = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert [line["seq"] for line in lines] == list(range(500))
+    assert lines[0]["msg"] == "record 0"
+    assert lines[0]["logger"] == "test"
+
+
+def test_records_still_queued_at_exit_are_written():
+    code = (
+        "import logging\n"
+        "from whatsapp_bot.logs import configure_logging\n"
+        "configure_logging()\n"
+        "for i in range(1000):\n"
+        "    logging.info('record %d', i)\n"
+    )
+
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            env={**os.environ, "LOG_FORMAT": "json", "LOG_LEVEL": "INFO", "LOG_QUEUE": "true"})
+
+    assert [json.loads(line)["msg"] for line in result.stderr.splitlines()] == [f"record {i}" for i in range(1000)]
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = logs._BackgroundHandler(queue.Queue(1))
+    dropped = logs.DROPPED.value()
+
+    for i in range(3):
+        handler.handle(logging.makeLogRecord({"msg": f"record {i}"}))
+
+    assert handler.queue.get_nowait().msg == "record 0"
+    assert logs.DROPPED.value() == dropped + 2
+
+
+def test_text_format_appends_the_extra_fields():
+    record = logging.makeLogRecord({"msg": "Message sent", "levelname": "INFO", "name": "root", "to": "+358401"})
+
+    assert logs.TextFormatter().format(record) == "INFO:root:Message sent to=+358401"
@@ -0,0 +1,109 @@
+import io
+import json
+import os
+
+import pytest
+
+from whatsapp_bot.media import MediaError, MediaStore, MemoryBackend
+
+
+def write_png(directory, name="logo.png"):
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(b"\x89PNG" + os.urandom(1000))
+    return name
+
+
+def test_multi_recipient_send_streams_and_replays_with_idempotency_key(client, stubs):
+    name = write_png(stubs["data"], "idempotent.png")
+    body = {"recipients": ["358401", "358402", "358403"], "type": "image", "media_path": name}
+    headers = {"Idempotency-Key": "media-campaign-1"}
+
+    first = client.post("/send_media", json=body, headers=headers)
+    assert first.is_streamed
+    assert first.mimetype == "application/x-ndjson"
+    lines = first.get_data(as_text=True).splitlines()
+    assert json.loads(lines[-1]) == {"summary": {"total": 3, "sent": 3, "failed": 0}}
+    sends = stubs["graph"].requests
+
+    replay = client.post("/send_media", json=body, headers=headers)
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.mimetype == "application/x-ndjson"
+    assert replay.get_data(as_text=True).splitlines() == lines
+    assert stubs["graph"].requests == sends
+
+
+def test_same_file_is_uploaded_once_and_then_sent_by_id(client, stubs):
+    name = write_png(stubs["data"], "once.png")
+
+    first = client.post("/send_media", json={"phone_number": "358401", "type": "image", "media_path": name})
+    second = client.post("/send_media", json={"phone_number": "358402", "type": "image", "media_path": name})
+
+    assert first.status_code == second.status_code == 200
+    assert first.get_json()["media_id"] == second.get_json()["media_id"]
+    assert stubs["graph"].uploads == 1
+
+
+def test_expired_media_id_is_uploaded_again(client, stubs):
+    name = write_png(stubs["data"], "expired.png")
+    body = {"phone_number": "358401", "type": "image", "media_path": name}
+    client.post("/send_media", json=body)
+
+    stubs["graph"].expire_media()
+    response = client.post("/send_media", json=body)
+
+    assert response.status_code == 200
+    assert stubs["graph"].uploads == 2
+
+
+def test_multipart_upload_is_sent(client, stubs):
+    response = client.post("/send_media", data={
+        "phone_number": "358401",
+        "type": "document",
+        "file": (io.BytesIO(b"%PDF-1.4 price list"), "prices.pdf", "application/pdf"),
+    })
+
+    assert response.status_code == 200
+    assert stubs["graph"].uploads == 1
+
+
+def test_multipart_upload_with_idempotency_key_is_fingerprinted_by_its_file(client, stubs):
+    def upload(content):
+        return client.post("/send_media", headers={"Idempotency-Key": "price-list-1"}, data={
+            "phone_number": "358401",
+            "type": "document",
+            "file": (io.BytesIO(content), "prices.pdf", "application/pdf"),
+        })
+
+    first = upload(b"%PDF-1.4 campaign price list")
+    replay = upload(b"%PDF-1.4 campaign price list")
+    changed = upload(b"%PDF-1.4 new price list")
+
+    assert first.status_code == replay.status_code == 200
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.get_json() == first.get_json()
+    assert changed.status_code == 422
+    assert stubs["graph"].uploads == 1
+
+
+@pytest.mark.parametrize("body", [
+    {"type": "image", "media_path": "../conftest.py"},
+    {"type": "image", "media_path": "missing.png"},
+    {"type": "video", "media_path": "logo.png"},
+    {"type": "document", "media_path": "logo.png"},
+])
+def test_unusable_files_are_refused_without_an_upload(client, stubs, body):
+    write_png(stubs["data"])
+
+    response = client.post("/send_media", json={"phone_number": "358401", **body})
+
+    assert response.status_code == 400
+    assert stubs["graph"].uploads == 0
+
+
+def test_oversized_and_empty_files_are_refused(stubs, core):
+    store = MediaStore(MemoryBackend(), media_dir=str(stubs["data"]))
+
+    with pytest.raises(MediaError):
+        store.media_id("image", fileobj=io.BytesIO(b""), filename="empty.png")
+    with pytest.raises(MediaError):
+        store.media_id("image", fileobj=io.BytesIO(b"\0" * (5 * 1024 * 1024 + 1)), filename="big.png")
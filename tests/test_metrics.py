@@ -0,0 +1,79 @@
+from whatsapp_bot.metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+
+
+def test_counter_is_rendered_with_help_and_type():
+    registry = Registry()
+    sends = registry.get_or_create(Counter, "sends_total", "Messages sent")
+    sends.inc()
+    sends.inc(2)
+
+    assert registry.render() == (
+        "# HELP sends_total Messages sent\n"
+        "# TYPE sends_total counter\n"
+        "sends_total 3\n"
+    )
+
+
+def test_labelled_counter_has_a_sample_per_label_set():
+    registry = Registry()
+    requests = registry.get_or_create(Counter, "requests_total", "Requests", ["route", "status"])
+    requests.inc(route="/send_message", status=200)
+    requests.inc(route="/send_message", status=200)
+    requests.inc(route="/send_message", status=429)
+
+    assert registry.render().splitlines()[2:] == [
+        'requests_total{route="/send_message",status="200"} 2',
+        'requests_total{route="/send_message",status="429"} 1',
+    ]
+    assert requests.value(route="/send_message", status="200") == 2
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    messages = registry.get_or_create(Counter, "messages_total", "Messages", ["type"])
+    messages.inc(type='te"xt\\\n')
+
+    assert registry.render().splitlines()[2] == 'messages_total{type="te\\"xt\\\\\\n"} 1'
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    registry = Registry()
+    latency = registry.get_or_create(Histogram, "latency_seconds", "Latency", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value, route="/askAI")
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/askAI",le="0.1"} 2',
+        'latency_seconds_bucket{route="/askAI",le="1.0"} 3',
+        'latency_seconds_bucket{route="/askAI",le="+Inf"} 4',
+        'latency_seconds_sum{route="/askAI"} 2.65',
+        'latency_seconds_count{route="/askAI"} 4',
+    ]
+    assert latency.count(route="/askAI") == 4
+
+
+def test_gauge_can_read_its_value_at_scrape_time():
+    registry = Registry()
+    depth = registry.get_or_create(Gauge, "queue_depth", "Queued jobs")
+    depth.set_function(lambda: 7)
+
+    assert registry.render().splitlines()[2] == "queue_depth 7"
+
+
+def test_metrics_are_registered_once_by_name():
+    registry = Registry()
+
+    first = registry.get_or_create(Counter, "sends_total", "Messages sent")
+
+    assert registry.get_or_create(Counter, "sends_total", "Messages sent") is first
+
+
+def test_metrics_route_serves_the_registry(client):
+    client.get("/health")
+
+    response = client.get("/metrics")
+
+    assert response.headers["Content-Type"] == CONTENT_TYPE
+    assert "# TYPE http_requests_total counter" in response.get_data(as_text=True)
@@ -0,0 +1,48 @@
+import pytest
+
+from whatsapp_bot.model_routing import ModelRoute, ModelRouter, Rule
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(
+        [ModelRoute("fast", "gpt-4o-mini", 150), ModelRoute("standard", "gpt-4o", 300)],
+        [Rule("standard", history=True), Rule("fast", max_chars=120)],
+    )
+
+
+def test_short_questions_take_the_fast_route_unless_there_is_history(router):
+    assert router.choose("When are you open?").name == "fast"
+    assert router.choose("When are you open?", has_history=True).name == "standard"
+    assert router.choose("x" * 200).name == "standard"
+
+
+def test_overrides_pick_a_route_and_replace_its_settings(router):
+    overrides = router.parse_overrides({"route": "fast", "model": "gpt-4o", "max_tokens": "50", "temperature": "0.5"})
+
+    route = router.choose("x" * 200, overrides=overrides)
+
+    assert (route.name, route.model, route.max_tokens, route.temperature) == ("fast", "gpt-4o", 50, 0.5)
+    assert router.parse_overrides({}) is None
+
+
+@pytest.mark.parametrize("values", [
+    {"route": "slow"},
+    {"route": ["fast"]},
+    {"route": {"name": "fast"}},
+    {"model": "gpt-5"},
+    {"model": ["gpt-4o"]},
+    {"max_tokens": "many"},
+    {"max_tokens": 5000},
+    {"temperature": [1]},
+    {"temperature": 3},
+])
+def test_bad_overrides_raise_value_error(router, values):
+    with pytest.raises(ValueError):
+        router.parse_overrides(values)
+
+
+def test_send_ai_message_with_a_bad_route_type_is_a_bad_request(client):
+    response = client.post("/send_ai_message", json={"phone_number": "358401", "question": "Hi", "route": ["fast"]})
+
+    assert response.status_code == 400
@@ -0,0 +1,50 @@
+import pytest
+
+from whatsapp_bot.rate_limit import RateLimited, RateLimiter
+
+
+def test_burst_goes_out_at_once_then_sends_are_spaced_at_the_rate(clock):
+    limiter = RateLimiter(rate=10.0, burst=3, recipient_interval=0, clock=clock)
+
+    assert [limiter.reserve() for _ in range(5)] == pytest.approx([0.0, 0.0, 0.0, 0.1, 0.2])
+    clock.now = 1.0
+    assert limiter.reserve() == 0.0
+
+
+def test_acquire_sleeps_for_its_reservation(clock):
+    limiter = RateLimiter(rate=10.0, burst=1, recipient_interval=0, clock=clock, sleep=clock.sleep)
+
+    limiter.acquire()
+    assert limiter.acquire() == pytest.approx(0.1)
+    assert clock.now == pytest.approx(0.1)
+
+
+def test_each_recipient_has_its_own_pair_rate(clock):
+    limiter = RateLimiter(rate=0, recipient_interval=6.0, recipient_burst=2, clock=clock)
+
+    assert limiter.reserve("+358401") == 0.0
+    assert limiter.reserve("358401") == 0.0
+    assert limiter.reserve("358401") == pytest.approx(6.0)
+    assert limiter.reserve("358402") == 0.0
+
+
+def test_wait_over_max_wait_is_refused_without_using_a_slot(clock):
+    limiter = RateLimiter(rate=1.0, burst=1, recipient_interval=0, max_wait=1.5, clock=clock)
+
+    limiter.reserve()
+    limiter.reserve()
+    with pytest.raises(RateLimited) as error:
+        limiter.reserve()
+    assert error.value.retry_after == pytest.approx(2.0)
+    clock.now = 1.0
+    assert limiter.reserve() == pytest.approx(1.0)
+
+
+def test_idle_recipients_are_forgotten(clock):
+    limiter = RateLimiter(rate=0, recipient_interval=6.0, recipient_burst=1, clock=clock)
+
+    limiter.reserve("358401")
+    clock.now = 7.0
+    limiter.reserve("358402")
+
+    assert list(limiter.recipients) == ["358402"]
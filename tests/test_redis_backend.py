@@ -0,0 +1,62 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from whatsapp_bot import idempotency
+from whatsapp_bot.redis_backend import RedisBackend
+
+
+# Enough of redis.Redis for the backends: bytes values, SET with NX and EX
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value.encode("utf-8")
+        self.ttls[key] = ex
+        return True
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    server = FakeRedis()
+    monkeypatch.setitem(sys.modules, "redis", SimpleNamespace(Redis=SimpleNamespace(from_url=lambda url: server)))
+    return server
+
+
+def test_values_are_strings_with_a_whole_second_ttl(redis):
+    backend = RedisBackend("redis://localhost", "MEDIA_CACHE_BACKEND", prefix="media:")
+
+    backend.set("logo", "wamid.1", 0.2)
+
+    assert backend.get("logo") == "wamid.1"
+    assert redis.ttls == {"media:logo": 1}
+    backend.delete("logo")
+    assert backend.get("logo") is None
+
+
+def test_idempotency_backend_stores_json_records_and_adds_once(redis):
+    backend = idempotency.RedisBackend("redis://localhost")
+
+    assert backend.add("k", {"state": "pending"}, 10.0) is None
+    assert backend.add("k", {"state": "pending"}, 10.0) == {"state": "pending"}
+    backend.set("k", {"state": "done", "status": 200}, 60.0)
+    assert backend.add("k", {"state": "pending"}, 10.0) == {"state": "done", "status": 200}
+    assert list(redis.values) == ["idem:k"]
+
+
+def test_missing_package_names_the_setting(monkeypatch):
+    monkeypatch.setitem(sys.modules, "redis", None)
+
+    with pytest.raises(RuntimeError, match="AI_CACHE_BACKEND=redis needs the redis package"):
+        RedisBackend("redis://localhost", "AI_CACHE_BACKEND")
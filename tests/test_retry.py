@@ -0,0 +1,109 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from whatsapp_bot.retry import RetryPolicy, parse_retry_after
+
+
+def response(status, headers=None):
+    return SimpleNamespace(status_code=status, headers=headers or {})
+
+
+# Like OpenAI's APIStatusError
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+class Upstream:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleeps():
+    return []
+
+
+@pytest.fixture
+def policy(sleeps):
+    return RetryPolicy("test", max_attempts=3, base_delay=0.5, max_delay=8.0, sleep=sleeps.append, rand=lambda: 1.0)
+
+
+def test_transient_failures_are_retried_with_exponential_backoff(policy, sleeps):
+    upstream = Upstream(ConnectionError(), response(503), response(200))
+
+    assert policy.call(upstream).status_code == 200
+    assert upstream.calls == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_last_failure_is_returned_or_raised_after_max_attempts(policy, sleeps):
+    assert policy.call(Upstream(response(500), response(502), response(503))).status_code == 503
+    with pytest.raises(TimeoutError):
+        policy.call(Upstream(TimeoutError(), TimeoutError(), TimeoutError()))
+
+
+def test_final_outcomes_are_not_retried(policy, sleeps):
+    upstream = Upstream(response(400))
+    assert policy.call(upstream).status_code == 400
+    with pytest.raises(ValueError):
+        policy.call(Upstream(ValueError()))
+    # An API error with a status is retried on that status only
+    with pytest.raises(StatusError):
+        policy.call(Upstream(StatusError(401)))
+    assert sleeps == []
+    assert policy.call(Upstream(StatusError(429), response(200))).status_code == 200
+
+
+def test_retry_after_is_honoured_up_to_its_cap(sleeps):
+    policy = RetryPolicy("test", max_retry_after=5.0, sleep=sleeps.append, rand=lambda: 1.0)
+
+    policy.call(Upstream(response(429, {"Retry-After": "2"}), response(429, {"Retry-After": "60"}), response(200)))
+
+    assert sleeps == [2.0, 5.0]
+
+
+def test_retry_if_retries_throttling_hidden_in_a_400(sleeps):
+    policy = RetryPolicy("test", retry_if=lambda r: r.headers.get("code") == "130429", sleep=sleeps.append)
+
+    assert policy.call(Upstream(response(400, {"code": "130429"}), response(200))).status_code == 200
+    assert len(sleeps) == 1
+
+
+def test_backoff_is_capped_and_jittered():
+    policy = RetryPolicy("test", base_delay=0.5, max_delay=8.0, rand=lambda: 0.5)
+
+    assert [policy.backoff(attempt) for attempt in (1, 2, 5, 10)] == [0.25, 0.5, 4.0, 4.0]
+
+
+@pytest.mark.parametrize("value, seconds", [("3", 3.0), ("-1", 0.0), ("", None), ("soon", None)])
+def test_parse_retry_after(value, seconds):
+    assert parse_retry_after(value) == seconds
+
+
+def test_async_calls_retry_the_same_way(monkeypatch):
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    policy = RetryPolicy("test", rand=lambda: 1.0)
+    upstream = Upstream(ConnectionError(), response(200))
+
+    async def call():
+        return upstream()
+
+    assert asyncio.run(policy.acall(call)).status_code == 200
+    assert waits == [0.5]
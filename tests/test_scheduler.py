@@ -0,0 +1,106 @@
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from whatsapp_bot.scheduler import CANCELLED, FIRED, Scheduler, parse_duration, parse_timezone
+
+
+def epoch(text):
+    return datetime.fromisoformat(text).timestamp()
+
+
+def utc(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return Scheduler(path=str(tmp_path / "schedule.db"), jitter=0.0, timezone="Europe/Helsinki")
+
+
+@pytest.mark.parametrize("value, seconds", [
+    (90, 90.0), ("90", 90.0), ("1.5", 1.5), ("23h", 82800.0), ("1h30m", 5400.0), ("2d", 172800.0), ("1h 30m", 5400.0),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == seconds
+
+
+@pytest.mark.parametrize("value", ["soon", "1h soon", "h", ""])
+def test_parse_duration_refuses_other_text(value):
+    with pytest.raises(ValueError):
+        parse_duration(value)
+
+
+def test_parse_timezone_refuses_unknown_names():
+    assert str(parse_timezone("Europe/Helsinki")) == "Europe/Helsinki"
+    with pytest.raises(ValueError):
+        parse_timezone("Europe/Atlantis")
+
+
+def test_delay_is_counted_from_now(scheduler):
+    now = epoch("2026-03-28T10:00:00+02:00")
+    assert scheduler.parse({"delay": "23h"}, now) == (now + 82800.0, 0.0)
+    assert scheduler.parse({"delay": 0, "jitter": "1m"}, now) == (now, 60.0)
+
+
+def test_time_of_day_is_today_until_it_has_passed(scheduler):
+    now = epoch("2026-03-28T07:00:00+02:00")
+    assert utc(scheduler.parse({"send_at": "09:00"}, now)[0]) == "2026-03-28T07:00:00+00:00"
+    assert utc(scheduler.parse({"send_at": "9:00", "timezone": "UTC"}, now)[0]) == "2026-03-28T09:00:00+00:00"
+
+
+def test_time_of_day_tomorrow_keeps_the_wall_clock_across_dst(scheduler):
+    # Summer time starts in Helsinki on the night of 2026-03-29, so 09:00
+    # tomorrow is 22 hours away, not 23
+    now = epoch("2026-03-28T10:00:00+02:00")
+    due_at, _ = scheduler.parse({"send_at": "09:00"}, now)
+    assert utc(due_at) == "2026-03-29T06:00:00+00:00"
+    assert due_at - now == 22 * 3600
+
+
+def test_iso_times_use_their_offset_or_the_timezone(scheduler):
+    now = epoch("2026-03-28T10:00:00+02:00")
+    assert utc(scheduler.parse({"send_at": "2026-04-01T12:00:00Z"}, now)[0]) == "2026-04-01T12:00:00+00:00"
+    assert utc(scheduler.parse({"send_at": "2026-04-01T12:00:00"}, now)[0]) == "2026-04-01T09:00:00+00:00"
+
+
+@pytest.mark.parametrize("data", [
+    {},
+    {"send_at": "09:00", "delay": 60},
+    {"send_at": "25:00"},
+    {"send_at": "tomorrow"},
+    {"send_at": "2026-03-27T10:00:00+02:00"},
+    {"delay": -1},
+    {"delay": "31d"},
+    {"delay": 60, "jitter": -1},
+    {"delay": 60, "timezone": "Mars/Olympus"},
+])
+def test_parse_refuses_bad_requests(scheduler, data):
+    with pytest.raises(ValueError):
+        scheduler.parse(data, epoch("2026-03-28T10:00:00+02:00"))
+
+
+def test_due_send_is_handed_to_the_send_queue(scheduler):
+    submitted = []
+    scheduler.bind(lambda task, **kwargs: submitted.append((task, kwargs)) or SimpleNamespace(id="job-1"))
+
+    [(schedule_id, _)] = scheduler.schedule([("send_message", {"phone_number": "+358401", "message": "Hi"})],
+                                            time.time())
+
+    deadline = time.monotonic() + 5.0
+    while scheduler.get(schedule_id)["status"] != FIRED and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert scheduler.get(schedule_id)["job_id"] == "job-1"
+    assert submitted == [("send_message", {"phone_number": "+358401", "message": "Hi"})]
+
+
+def test_pending_send_can_be_cancelled(scheduler):
+    scheduler.bind(lambda task, **kwargs: pytest.fail("cancelled send was queued"))
+
+    [(schedule_id, _)] = scheduler.schedule([("send_message", {"phone_number": "+358401", "message": "Hi"})],
+                                            time.time() + 3600)
+
+    assert scheduler.cancel(schedule_id)["status"] == CANCELLED
+    assert scheduler.cancel("no-such-send") is None
@@ -0,0 +1,70 @@
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from whatsapp_bot.semantic_cache import HashingEmbedder, SemanticCache, VectorIndex  # noqa: E402
+
+
+@pytest.fixture
+def cache(clock):
+    return SemanticCache(HashingEmbedder(), threshold=0.8, ttl=60.0, clock=clock)
+
+
+def remember(cache, question, answer, model="gpt-4o"):
+    answer_found, vector = cache.lookup(model, "prompt", question)
+    assert answer_found is None
+    cache.store(model, "prompt", vector, answer)
+
+
+def test_near_duplicate_questions_share_an_answer(cache):
+    remember(cache, "What are your opening hours on weekdays?", "Nine to five.")
+
+    assert cache.lookup("gpt-4o", "prompt", "what are your opening hours on weekdays")[0] == "Nine to five."
+    assert cache.lookup("gpt-4o", "prompt", "What are your opening hours on weekday?")[0] == "Nine to five."
+    assert cache.lookup("gpt-4o", "prompt", "Do you ship to Sweden?")[0] is None
+
+
+def test_answers_are_kept_per_model_and_prompt(cache):
+    remember(cache, "What are your opening hours?", "Nine to five.")
+
+    assert cache.lookup("gpt-4o-mini", "prompt", "What are your opening hours?")[0] is None
+    assert cache.lookup("gpt-4o", "other prompt", "What are your opening hours?")[0] is None
+
+
+def test_expired_answers_are_not_served(cache, clock):
+    remember(cache, "What are your opening hours?", "Nine to five.")
+    clock.now = 61.0
+
+    assert cache.lookup("gpt-4o", "prompt", "What are your opening hours?")[0] is None
+
+
+def test_failed_embedding_is_a_miss():
+    def embedder(texts):
+        raise ConnectionError("embeddings are down")
+
+    cache = SemanticCache(embedder)
+
+    assert cache.lookup("gpt-4o", "prompt", "Hi") == (None, None)
+
+
+def test_full_index_overwrites_its_oldest_row():
+    index = VectorIndex(dim=2, capacity=2)
+    for answer, vector in (("a", [1.0, 0.0]), ("b", [0.0, 1.0]), ("c", [0.6, 0.8])):
+        index.add(np.array(vector, dtype=np.float32), answer, expires_at=100.0)
+
+    assert index.size == 2
+    assert sorted(index.answers) == ["b", "c"]
+    row, score = index.search(np.array([1.0, 0.0], dtype=np.float32), now=0.0)
+    assert index.answers[row] == "c"
+    assert score == pytest.approx(0.6)
+
+
+def test_numpy_is_only_imported_once_a_cache_is_built():
+    code = "import sys, whatsapp_bot.semantic_cache; print('numpy' in sys.modules)"
+
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,194 @@
+import sqlite3
+import time
+
+import pytest
+
+from whatsapp_bot.circuit_breaker import CircuitOpen
+from whatsapp_bot.outbox import SqliteBackend
+from whatsapp_bot.send_queue import (
+    FAILED, RUNNING, SUCCEEDED, Job, JobFailed, MemoryBackend, QueueFull, SendQueue, wants_async,
+)
+
+
+# Status of a job on disk once the outbox writer has committed it
+def disk_status(path, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        row = sqlite3.connect(path).execute(
+            "SELECT status FROM outbox WHERE id = ? AND finished_at IS NOT NULL", (job_id,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        time.sleep(0.01)
+    return None
+
+
+# A job once a worker has finished it
+def finished(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job.finished_at is not None:
+            return job
+        time.sleep(0.01)
+    return None
+
+
+@pytest.fixture
+def send_queue(tmp_path):
+    queue = SendQueue(workers=1, backend=SqliteBackend(path=str(tmp_path / "outbox.db")))
+    queue.register("send_message", lambda phone_number, message: {"to": phone_number})
+    return queue
+
+
+def test_journal_marks_finished_send_succeeded(send_queue):
+    with send_queue.journal("send_message", phone_number="+358401", message="hi") as job:
+        pass
+    assert send_queue.get(job.id).status == SUCCEEDED
+    assert disk_status(send_queue.backend.path, job.id) == SUCCEEDED
+
+
+def test_journal_marks_send_that_returned_false_failed(send_queue):
+    with send_queue.journal("send_message", phone_number="+358401", message="hi") as job:
+        sent = False
+        if not sent:
+            send_queue.fail_journal(job, "Message sending failed")
+    assert send_queue.get(job.id).status == FAILED
+    assert send_queue.get(job.id).error == "Message sending failed"
+    assert disk_status(send_queue.backend.path, job.id) == FAILED
+
+
+def test_journal_marks_send_that_raised_failed(send_queue):
+    with pytest.raises(RuntimeError):
+        with send_queue.journal("send_message", phone_number="+358401", message="hi") as job:
+            raise RuntimeError("boom")
+    assert send_queue.get(job.id).status == FAILED
+    assert disk_status(send_queue.backend.path, job.id) == FAILED
+
+
+def test_journal_is_a_no_op_without_a_durable_backend():
+    queue = SendQueue(workers=1)
+    queue.register("send_message", lambda phone_number, message: None)
+    with queue.journal("send_message", phone_number="+358401", message="hi") as job:
+        queue.fail_journal(job, "ignored")
+    assert job is None
+
+
+def test_unfinished_journal_is_replayed_by_the_next_process(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    crashed = SqliteBackend(path=path)
+    job = Job("send_message", {"phone_number": "+358401", "message": "left over"})
+    job.status = RUNNING
+    crashed.record(job)
+
+    # A second backend in this process stands in for the restarted server:
+    # our own pid never counts as a live owner
+    restarted = SqliteBackend(path=path)
+    replayed = restarted.get(timeout=1.0)
+    assert replayed is not None
+    assert replayed.id == job.id
+    assert replayed.kwargs == {"phone_number": "+358401", "message": "left over"}
+    assert restarted.get(timeout=0.1) is None
+
+
+def test_finished_journal_is_not_replayed(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    queue = SendQueue(workers=1, backend=SqliteBackend(path=path))
+    queue.register("send_message", lambda phone_number, message: None)
+    with queue.journal("send_message", phone_number="+358401", message="hi") as job:
+        queue.fail_journal(job, "Message sending failed")
+    assert disk_status(path, job.id) == FAILED
+
+    restarted = SqliteBackend(path=path)
+    assert restarted.get(timeout=0.1) is None
+    assert restarted.load(job.id).status == FAILED
+
+
+def test_submitted_job_runs_on_a_worker():
+    queue = SendQueue(workers=2)
+    queue.register("send_message", lambda phone_number, message: {"to": phone_number})
+
+    job = queue.submit("send_message", phone_number="+358401", message="hi")
+
+    done = finished(queue, job.id)
+    assert (done.status, done.result) == (SUCCEEDED, {"to": "+358401"})
+    assert done.to_dict()["job_id"] == job.id
+
+
+def test_failed_tasks_are_recorded_with_their_error():
+    def send_message(phone_number, message):
+        raise RuntimeError("boom")
+
+    def send_ai_message(phone_number, question):
+        raise JobFailed("Message sending failed", result={"ai_response": "Hello"})
+
+    queue = SendQueue(workers=1)
+    queue.register("send_message", send_message)
+    queue.register("send_ai_message", send_ai_message)
+
+    raised = finished(queue, queue.submit("send_message", phone_number="+358401", message="hi").id)
+    reported = finished(queue, queue.submit("send_ai_message", phone_number="+358401", question="hi").id)
+
+    assert (raised.status, raised.error) == (FAILED, "boom")
+    assert (reported.status, reported.error, reported.result) == (
+        FAILED, "Message sending failed", {"ai_response": "Hello"})
+
+
+def test_job_hitting_an_open_circuit_is_run_again_later():
+    calls = []
+
+    def send_message(phone_number, message):
+        calls.append(phone_number)
+        if len(calls) == 1:
+            raise CircuitOpen("graph", 0.05)
+
+    queue = SendQueue(workers=1)
+    queue.register("send_message", send_message)
+
+    job = finished(queue, queue.submit("send_message", phone_number="+358401", message="hi").id)
+
+    assert job.status == SUCCEEDED
+    assert len(calls) == 2
+
+
+def test_full_or_stopped_queue_refuses_jobs():
+    queue = SendQueue(workers=0, backend=MemoryBackend(maxsize=1))
+    queue.register("send_message", lambda phone_number, message: None)
+
+    queue.submit("send_message", phone_number="+358401", message="hi")
+    with pytest.raises(QueueFull):
+        queue.submit("send_message", phone_number="+358401", message="hi")
+    with pytest.raises(KeyError):
+        queue.submit("send_fax", phone_number="+358401")
+
+    queue.shutdown(timeout=1.0)
+    with pytest.raises(QueueFull):
+        queue.submit("send_message", phone_number="+358401", message="hi")
+
+
+def test_shutdown_drains_queued_jobs():
+    queue = SendQueue(workers=1)
+    queue.register("send_message", lambda phone_number, message: time.sleep(0.01))
+    jobs = [queue.submit("send_message", phone_number="+358401", message=str(i)) for i in range(5)]
+
+    queue.shutdown(timeout=5.0)
+
+    assert [queue.get(job.id).status for job in jobs] == [SUCCEEDED] * 5
+
+
+@pytest.mark.parametrize("value, expected", [(True, True), ("1", True), ("yes", True), ("false", False), (0, False)])
+def test_wants_async(value, expected):
+    assert wants_async(value) is expected
+
+
+def test_async_request_is_queued_and_reported_by_jobs(client, stubs):
+    response = client.post("/send_message", json={"phone_number": "358401", "message": "Hello", "async": True})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    deadline = time.monotonic() + 5.0
+    while client.get(f"/jobs/{job_id}").get_json()["status"] != SUCCEEDED and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.get(f"/jobs/{job_id}").get_json()["status"] == SUCCEEDED
+    assert stubs["graph"].requests == 1
+    assert client.get("/jobs/no-such-job").status_code == 404
@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+
+from whatsapp_bot.single_flight import AsyncSingleFlight, SingleFlight, flight_key
+
+
+# A function that counts its calls and, until `release` is set, blocks in
+# the first one
+class Blocking:
+    def __init__(self, result="Nine to five.", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls == 1:
+            self.release.wait(5.0)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+# Runs flight.do(key, fn) in `count` threads, the first being the leader,
+# and returns their outcomes: (result, shared) or the exception raised
+def concurrently(flight, fn, count):
+    outcomes = [None] * count
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do("key", fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    threads[0].start()
+    while not fn.calls:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    fn.release.set()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_key_ignores_case_spacing_and_punctuation_of_the_question():
+    params = {"model": "gpt-4o", "temperature": 0.2}
+
+    assert flight_key(params, "prompt", "When are you OPEN?") == flight_key(params, "prompt", " when are you open ")
+    assert flight_key(params, "prompt", "When are you open?") != flight_key(params, "other", "When are you open?")
+    assert flight_key(params, "prompt", "Open?") != flight_key({**params, "temperature": 0.7}, "prompt", "Open?")
+
+
+def test_concurrent_callers_share_the_leaders_call():
+    fn = Blocking()
+
+    outcomes = concurrently(SingleFlight(), fn, 5)
+
+    assert fn.calls == 1
+    assert outcomes == [("Nine to five.", False)] + [("Nine to five.", True)] * 4
+
+
+def test_leaders_error_is_raised_to_every_follower():
+    error = ConnectionError("OpenAI is down")
+    fn = Blocking(error=error)
+
+    outcomes = concurrently(SingleFlight(), fn, 3)
+
+    assert fn.calls == 1
+    assert outcomes == [error] * 3
+
+
+def test_follower_that_waited_too_long_runs_the_call_itself():
+    fn = Blocking()
+
+    outcomes = concurrently(SingleFlight(timeout=0.01), fn, 2)
+
+    assert fn.calls == 2
+    assert outcomes == [("Nine to five.", False)] * 2
+
+
+def test_finished_calls_are_not_shared_and_disabled_flights_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == (1, False)
+    assert flight.do("key", lambda: 2) == (2, False)
+
+    fn = Blocking()
+    assert concurrently(SingleFlight(enabled=False), fn, 2) == [("Nine to five.", False)] * 2
+    assert fn.calls == 2
+
+
+class AsyncBlocking:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        if self.calls == 1:
+            await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return "Nine to five."
+
+
+def test_async_followers_share_the_leaders_call():
+    async def main():
+        flight, fn = AsyncSingleFlight(), AsyncBlocking()
+        callers = [asyncio.ensure_future(flight.do("key", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        fn.release.set()
+        return await asyncio.gather(*callers), fn.calls
+
+    outcomes, calls = asyncio.run(main())
+
+    assert calls == 1
+    assert outcomes == [("Nine to five.", False), ("Nine to five.", True), ("Nine to five.", True)]
+
+
+def test_async_leaders_error_is_raised_to_every_follower():
+    async def main():
+        flight, fn = AsyncSingleFlight(), AsyncBlocking(error=ConnectionError("OpenAI is down"))
+        callers = [asyncio.ensure_future(flight.do("key", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        fn.release.set()
+        return await asyncio.gather(*callers, return_exceptions=True), fn.calls
+
+    outcomes, calls = asyncio.run(main())
+
+    assert calls == 1
+    assert [type(outcome) for outcome in outcomes] == [ConnectionError] * 3
+
+
+def test_async_follower_that_waited_too_long_runs_the_call_itself():
+    async def main():
+        flight, fn = AsyncSingleFlight(timeout=0.01), AsyncBlocking()
+        leader = asyncio.ensure_future(flight.do("key", fn))
+        await asyncio.sleep(0)
+        follower = await flight.do("key", fn)
+        fn.release.set()
+        return await leader, follower, fn.calls
+
+    leader, follower, calls = asyncio.run(main())
+
+    assert calls == 2
+    assert leader == follower == ("Nine to five.", False)
+
+
+def test_cancelled_callers_do_not_cancel_the_shared_call():
+    async def main():
+        flight, fn = AsyncSingleFlight(), AsyncBlocking()
+        leader = asyncio.ensure_future(flight.do("key", fn))
+        follower = asyncio.ensure_future(flight.do("key", fn))
+        await asyncio.sleep(0)
+        # The client of the leader went away, and then the follower's
+        leader.cancel()
+        follower.cancel()
+        await asyncio.sleep(0)
+        late = asyncio.ensure_future(flight.do("key", fn))
+        await asyncio.sleep(0)
+        fn.release.set()
+        return leader, follower, await late, fn.calls
+
+    leader, follower, late, calls = asyncio.run(main())
+
+    assert leader.cancelled() and follower.cancelled()
+    assert late == ("Nine to five.", True)
+    assert calls == 1
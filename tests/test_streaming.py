@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from whatsapp_bot.streaming import RecipientLocks, split_chunks, wants_stream
+
+
+def deltas(text, size=3):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+@pytest.mark.parametrize("text, chunks", [
+    ("First sentence is here. Second one! Third?", ["First sentence is here. ", "Second one! ", "Third?"]),
+    ('He said "Hi." Then he left. ', ['He said "Hi." ', "Then he left. "]),
+    ("Line one\n\nLine two", ["Line one\n\n", "Line two"]),
+    # Sentences shorter than min_chars are kept together
+    ("Hi. Ok. Then more text. End", ["Hi. Ok. Then more text. ", "End"]),
+])
+def test_chunks_end_at_sentences_and_paragraphs(text, chunks):
+    assert list(split_chunks(deltas(text), min_chars=10, max_chars=100)) == chunks
+
+
+def test_text_without_sentences_is_split_at_whitespace_then_anywhere():
+    assert list(split_chunks(deltas("word " * 6), min_chars=5, max_chars=12)) == ["word word ", "word word ", "word word "]
+    assert list(split_chunks(deltas("x" * 50), min_chars=5, max_chars=20)) == ["x" * 20, "x" * 20, "x" * 10]
+
+
+# Streamed in small deltas, or all at once as a non-streamed answer is
+@pytest.mark.parametrize("size", [7, 1000])
+def test_chunks_stay_within_the_sizes_and_keep_the_whole_text(size):
+    text = "a" * 30 + " " + "b" * 40 + ". Short. " + "Another sentence that goes on for a while. " * 5 + "word " * 40
+
+    chunks = list(split_chunks(deltas(text, size), min_chars=20, max_chars=60))
+
+    assert "".join(chunks) == text
+    assert all(20 <= len(chunk) <= 60 for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 60
+
+
+def test_holders_of_one_recipient_take_turns():
+    locks = RecipientLocks()
+    events = []
+    held, release = threading.Event(), threading.Event()
+
+    def first():
+        with locks.hold("+358401"):
+            events.append("first")
+            held.set()
+            release.wait(5.0)
+            events.append("first done")
+
+    def second():
+        with locks.hold("358401"):
+            events.append("second")
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    threads[0].start()
+    held.wait(5.0)
+    threads[1].start()
+    time.sleep(0.05)
+    assert events == ["first"]
+
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert events == ["first", "first done", "second"]
+    assert locks._locks == {}
+
+
+def test_other_recipients_are_not_held_up():
+    locks = RecipientLocks()
+    other = threading.Event()
+
+    def send_to_other():
+        with locks.hold("358402"):
+            other.set()
+
+    with locks.hold("358401"):
+        thread = threading.Thread(target=send_to_other)
+        thread.start()
+        assert other.wait(5.0)
+    thread.join()
+
+
+@pytest.mark.parametrize("value, expected", [(True, True), ("yes", True), ("0", False), ("off", False)])
+def test_wants_stream(value, expected):
+    assert wants_stream(value) is expected
@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+from whatsapp_bot.templates import TemplateError, TemplateRegistry
+
+TEMPLATES = [
+    {"name": "hello_world", "language": "en_US", "status": "APPROVED", "components": [
+        {"type": "BODY", "text": "Welcome and congratulations!"},
+    ]},
+    {"name": "order_shipped", "language": "en_US", "status": "APPROVED", "components": [
+        {"type": "HEADER", "format": "IMAGE"},
+        {"type": "BODY", "text": "Hi {{1}}, your order {{2}} is on its way."},
+        {"type": "BUTTONS", "buttons": [
+            {"type": "QUICK_REPLY", "text": "Stop"},
+            {"type": "URL", "text": "Track", "url": "https://example.com/t/{{1}}"},
+        ]},
+    ]},
+    {"name": "order_shipped", "language": "fi", "status": "APPROVED", "components": [
+        {"type": "BODY", "text": "Hei {{first_name}}, tilauksesi {{order}} on matkalla."},
+    ]},
+    {"name": "draft", "language": "en_US", "status": "PENDING", "components": []},
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "templates.json"
+    path.write_text(json.dumps({"data": TEMPLATES}))
+    return path
+
+
+@pytest.fixture
+def registry(path):
+    return TemplateRegistry(path=str(path))
+
+
+def test_template_without_parameters_is_shared_as_is(registry):
+    payload = registry.render("+358401", "hello_world", "en_US")
+
+    assert payload == {"messaging_product": "whatsapp", "to": "+358401", "type": "template",
+                       "template": {"name": "hello_world", "language": {"code": "en_US"}}}
+    assert registry.prepare("hello_world", "en_US") is registry.prepare("hello_world", "en_US")
+
+
+def test_header_body_and_button_parameters_are_filled_in(registry):
+    template = registry.prepare("order_shipped", "en_US", ["Anna", "#1042"], {"link": "https://example.com/a.png"},
+                                [None, "1042"])
+
+    assert template["components"] == [
+        {"type": "header", "parameters": [{"type": "image", "image": {"link": "https://example.com/a.png"}}]},
+        {"type": "body", "parameters": [{"type": "text", "text": "Anna"}, {"type": "text", "text": "#1042"}]},
+        {"type": "button", "sub_type": "url", "index": "1", "parameters": [{"type": "text", "text": "1042"}]},
+    ]
+
+
+def test_named_parameters_are_given_as_an_object(registry):
+    template = registry.prepare("order_shipped", "fi", {"order": "#1042", "first_name": "Anna"})
+
+    assert template["components"] == [{"type": "body", "parameters": [
+        {"type": "text", "text": "Anna", "parameter_name": "first_name"},
+        {"type": "text", "text": "#1042", "parameter_name": "order"},
+    ]}]
+
+
+@pytest.mark.parametrize("name, language, parameters, header, buttons, error", [
+    ("order_shiped", "en_US", None, None, None, "no approved template"),
+    ("draft", "en_US", None, None, None, "no approved template"),
+    ("order_shipped", "sv", None, None, None, "use one of en_US, fi"),
+    ("order_shipped", "en_US", ["Anna"], {"id": "1"}, [None, "1"], "takes 2 parameters, got 1"),
+    ("order_shipped", "en_US", "Anna, #1042", {"id": "1"}, [None, "1"], "must be a list"),
+    ("order_shipped", "en_US", ["Anna\nB", "#1042"], {"id": "1"}, [None, "1"], "new lines"),
+    ("order_shipped", "en_US", ["Anna", "#1042"], None, [None, "1"], "image header"),
+    ("order_shipped", "en_US", ["Anna", "#1042"], {"id": "1"}, None, "button 1 needs a parameter"),
+    ("order_shipped", "en_US", ["Anna", "#1042"], {"id": "1"}, [None, "1", "2"], "got 3"),
+    ("order_shipped", "fi", ["Anna", "#1042"], None, None, "give an object of first_name, order"),
+    ("order_shipped", "fi", {"first_name": "Anna"}, None, None, "needs parameters first_name, order"),
+    ("hello_world", "en_US", ["extra"], None, None, "takes 0 parameters"),
+])
+def test_sends_that_do_not_fit_the_template_are_refused(registry, name, language, parameters, header, buttons, error):
+    with pytest.raises(TemplateError, match=error):
+        registry.prepare(name, language, parameters, header, buttons)
+
+
+def test_without_definitions_templates_are_sent_unchecked():
+    registry = TemplateRegistry()
+
+    template = registry.prepare("anything", "en_US", ["Anna"])
+
+    assert template["name"] == "anything"
+    with pytest.raises(TemplateError):
+        registry.prepare("anything", "en_US", buttons=["1"])
+
+
+@pytest.mark.parametrize("parameters", ["abc", {"first_name": "Anna"}, 42])
+def test_without_definitions_body_parameters_must_still_be_a_list(parameters):
+    with pytest.raises(TemplateError, match="body parameters must be a list"):
+        TemplateRegistry().prepare("anything", "en_US", parameters)
+
+
+def test_failed_load_is_retried_and_refresh_picks_up_new_templates(path, clock):
+    path.write_text("not json")
+    registry = TemplateRegistry(path=str(path), refresh_interval=300.0, retry_interval=60.0, clock=clock)
+
+    # Until a load succeeds, sends go out unchecked
+    assert registry.get("hello_world", "en_US") is None
+    path.write_text(json.dumps(TEMPLATES[:1]))
+    clock.now = 30.0
+    assert registry.get("hello_world", "en_US") is None
+    clock.now = 61.0
+    assert registry.get("hello_world", "en_US").name == "hello_world"
+
+    path.write_text(json.dumps(TEMPLATES))
+    with pytest.raises(TemplateError):
+        registry.get("order_shipped", "fi")
+    clock.now = 400.0
+    assert registry.get("order_shipped", "fi").language == "fi"
+
+
+def test_send_template_route_refuses_a_bad_send_without_calling_graph(core, client, stubs, path, monkeypatch):
+    monkeypatch.setattr(core, "templates", TemplateRegistry(path=str(path)))
+
+    response = client.post("/send_template", json={"phone_number": "358401", "template_name": "order_shiped"})
+
+    assert response.status_code == 400
+    assert stubs["graph"].requests == 0
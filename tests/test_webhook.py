@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from whatsapp_bot.webhook import iter_messages, message_text, verify_signature, verify_subscription
+
+
+def sign(secret, body):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def text_message(message_id, body="When are you open?"):
+    return {"from": "358401", "id": message_id, "type": "text", "text": {"body": body}}
+
+
+def payload(*messages):
+    return {"entry": [{"changes": [{"field": "messages", "value": {"messages": list(messages)}}]}]}
+
+
+def test_signature_must_be_the_hmac_of_the_body():
+    body = b'{"entry": []}'
+
+    assert verify_signature("secret", body, sign("secret", body))
+    assert not verify_signature("secret", body, sign("other", body))
+    assert not verify_signature("secret", body + b" ", sign("secret", body))
+    assert not verify_signature("secret", body, sign("secret", body)[len("sha256="):])
+    assert not verify_signature("", body, sign("", body))
+    assert not verify_signature("secret", body, None)
+
+
+def test_subscription_answers_the_challenge_only_for_the_verify_token():
+    args = {"hub.mode": "subscribe", "hub.verify_token": "token", "hub.challenge": "1158201444"}
+
+    assert verify_subscription(args, "token") == "1158201444"
+    assert verify_subscription(args, "other") is None
+    assert verify_subscription({**args, "hub.mode": "unsubscribe"}, "token") is None
+    assert verify_subscription(args, None) is None
+
+
+def test_messages_are_collected_from_every_entry_and_change():
+    data = payload(text_message("wamid.1"), text_message("wamid.2"))
+    data["entry"].append({"changes": [
+        {"field": "statuses", "value": {"messages": [text_message("wamid.status")]}},
+        {"field": "messages", "value": {"statuses": [{"id": "wamid.1", "status": "read"}]}},
+        {"field": "messages", "value": {"messages": [text_message("wamid.3")]}},
+    ]})
+
+    assert [message["id"] for message in iter_messages(data)] == ["wamid.1", "wamid.2", "wamid.3"]
+
+
+@pytest.mark.parametrize("data", [
+    None, [], "entry", {"entry": "x"}, {"entry": ["x"]}, {"entry": [{"changes": "x"}]},
+    {"entry": [{"changes": [None, {"field": "messages", "value": "x"}]}]},
+    {"entry": [{"changes": [{"field": "messages", "value": {"messages": ["x", 1, None]}}]}]},
+])
+def test_malformed_payloads_have_no_messages(data):
+    assert list(iter_messages(data)) == []
+
+
+@pytest.mark.parametrize("message, text", [
+    (text_message("wamid.1", "Hi"), "Hi"),
+    ({"type": "button", "button": {"text": "Yes"}}, "Yes"),
+    ({"type": "interactive", "interactive": {"list_reply": {"title": "Opening hours"}}}, "Opening hours"),
+    ({"type": "image", "image": {"id": "1"}}, None),
+    ({"type": "text", "text": "Hi"}, None),
+    ({"type": "text", "text": {"body": ["Hi"]}}, None),
+])
+def test_message_text(message, text):
+    assert message_text(message) == text
+
+
+@pytest.fixture
+def webhook(client, core, monkeypatch):
+    monkeypatch.setenv("WHATSAPP_APP_SECRET", "secret")
+    submitted = []
+
+    def submit(name, **kwargs):
+        submitted.append(kwargs)
+        return SimpleNamespace(id=f"job{len(submitted)}")
+
+    monkeypatch.setattr(core.send_queue, "submit", submit)
+
+    def post(data):
+        body = json.dumps(data).encode()
+        return client.post("/webhook", data=body, content_type="application/json",
+                           headers={"X-Hub-Signature-256": sign("secret", body)})
+
+    post.submitted = submitted
+    return post
+
+
+def test_redelivered_messages_are_answered_once(webhook):
+    first = webhook(payload(text_message("wamid.dedupe1"), text_message("wamid.dedupe2")))
+    again = webhook(payload(text_message("wamid.dedupe2"), text_message("wamid.dedupe3")))
+
+    assert first.status_code == again.status_code == 200
+    assert [job["message_id"] for job in webhook.submitted] == ["wamid.dedupe1", "wamid.dedupe2", "wamid.dedupe3"]
+
+
+def test_malformed_webhook_is_accepted_and_ignored(webhook):
+    response = webhook({"entry": ["x"]})
+
+    assert response.status_code == 200
+    assert webhook.submitted == []
+
+
+def test_unsigned_webhook_is_refused(client, monkeypatch):
+    monkeypatch.setenv("WHATSAPP_APP_SECRET", "secret")
+
+    response = client.post("/webhook", json=payload(text_message("wamid.unsigned")),
+                           headers={"X-Hub-Signature-256": sign("other", b"{}")})
+
+    assert response.status_code == 403
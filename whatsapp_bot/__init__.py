@@ -0,0 +1,2 @@
+# The WhatsApp chatbot app (core.py) and its building blocks. main.py and
+# main_en.py start it in Finnish and English.
@@ -0,0 +1,408 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from whatsapp_bot.bulk import fan_out, normalize_phone
+from whatsapp_bot.circuit_breaker import CircuitOpen
+from whatsapp_bot.config import env_float, env_int
+from whatsapp_bot.db import Database
+from whatsapp_bot.metrics import counter
+from whatsapp_bot.model_routing import get_model_router
+from whatsapp_bot.outbox import process_alive
+from whatsapp_bot.rate_limit import RateLimited
+
+BATCH_ITEMS = counter("ai_batch_items_total", "AI batch recipients by outcome", ["status"])
+BATCH_TOKENS = counter("ai_batch_tokens_total", "Tokens used by OpenAI batch completions", ["model", "kind"])
+
+# Batch states: stored but not uploaded yet, running at OpenAI, answers in
+# and being sent, done
+PREPARING = "preparing"
+SUBMITTED = "submitted"
+SENDING = "sending"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Recipient states
+PENDING = "pending"
+ANSWERED = "answered"
+SENT = "sent"
+
+# OpenAI batch states after which no more answers come
+OPENAI_DONE = ("completed", "failed", "expired", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_batches (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    route TEXT NOT NULL,
+    params TEXT NOT NULL,
+    openai_batch_id TEXT,
+    openai_status TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ai_batches_open ON ai_batches (created_at) WHERE status NOT IN ('completed', 'failed');
+CREATE TABLE IF NOT EXISTS ai_batch_items (
+    batch_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    phone_number TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (batch_id, seq)
+);
+"""
+
+
+# Turn the /send_ai_batch body into (phone_number, question) pairs.
+# Recipients are plain numbers sharing "question" or objects with their
+# own. Raises ValueError naming the first recipient without either.
+def build_batch_items(data):
+    items = []
+    for i, recipient in enumerate(data.get("recipients") or []):
+        if not isinstance(recipient, dict):
+            recipient = {"phone_number": recipient}
+        phone_number = recipient.get("phone_number")
+        question = recipient.get("question", data.get("question"))
+        if not phone_number or not question:
+            raise ValueError(f"recipient {i} has no phone number or question")
+        items.append((normalize_phone(phone_number), question))
+    return items
+
+
+# The answer text of a chat completion body; None when there is none, as for
+# a refusal or a tool call
+def _answer(body):
+    content = ((body.get("choices") or [{}])[0].get("message") or {}).get("content")
+    if isinstance(content, str) and content.strip():
+        return content.strip()
+    return None
+
+
+# Answers questions for many recipients through the OpenAI Batch API (half
+# the price of regular completions, done within the completion window
+# instead of seconds) and sends them in order once they are in.
+#
+# Everything is kept in SQLite: a batch moves preparing -> submitted ->
+# sending -> completed, and every recipient pending -> answered -> sent (or
+# failed). Each step is committed as it happens, so a restarted process
+# picks up where the last one stopped: it uploads a batch that never was,
+# polls one that is running and sends only the answers not sent yet.
+#
+# One runner thread per process does the work. A process works on a batch
+# only while it holds its lease, so several gunicorn workers sharing the
+# database do not send the same batch twice; a lease that is not renewed
+# (the process died) expires and another process takes the batch over.
+class AIBatchRunner:
+    def __init__(self, path="ai_batches.db", route="standard", completion_window="24h", poll_interval=30.0,
+                 lease=300.0, send_concurrency=8, max_recipients=50000):
+        self.path = path
+        self.route = route
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.send_concurrency = send_concurrency
+        self.max_recipients = max_recipients
+        self._client = None
+        self._messages = None
+        self._send = None
+        self._pid = None
+        self._open_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("AI_BATCH_PATH", "ai_batches.db"),
+            route=os.getenv("AI_BATCH_ROUTE", "standard"),
+            completion_window=os.getenv("AI_BATCH_COMPLETION_WINDOW", "24h"),
+            poll_interval=env_float("AI_BATCH_POLL_INTERVAL", 30.0),
+            lease=env_float("AI_BATCH_LEASE", 300.0),
+            send_concurrency=env_int("AI_BATCH_SEND_CONCURRENCY", 8),
+            max_recipients=env_int("AI_BATCH_MAX_RECIPIENTS", 50000),
+        )
+
+    # The app's OpenAI client, its question -> chat messages function
+    # (system prompt included) and its WhatsApp send function
+    def bind(self, client, messages, send):
+        self._client = client
+        self._messages = messages
+        self._send = send
+
+    # Resume unfinished batches right away; without a database there is
+    # nothing to resume and no thread is started
+    def start(self):
+        if os.path.exists(self.path):
+            self._open()
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        with self._open_lock:
+            if self._pid == os.getpid():
+                return
+            self._db = Database(self.path, SCHEMA)
+            self._wake = threading.Event()
+            self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            threading.Thread(target=self._run, name="ai-batch-runner", daemon=True).start()
+            self._pid = os.getpid()
+
+    # Stores a batch of (phone_number, question) pairs and returns its id.
+    # `ai_options` (ModelRouter.parse_overrides) can pick another route or
+    # replace its model settings; one batch uses one model throughout.
+    def create(self, items, ai_options=None):
+        if self._client is None:
+            raise RuntimeError("AIBatchRunner.bind() has not been called")
+        route = get_model_router().choose("", overrides={"route": self.route, **(ai_options or {})})
+        self._open()
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        self._db.transaction([
+            (
+                "INSERT INTO ai_batches (id, status, route, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(batch_id, PREPARING, route.name, json.dumps(route.params()), now, now)],
+            ),
+            (
+                "INSERT INTO ai_batch_items (batch_id, seq, phone_number, question, status) VALUES (?, ?, ?, ?, ?)",
+                [(batch_id, seq, phone_number, question, PENDING) for seq, (phone_number, question) in enumerate(items)],
+            ),
+        ])
+        self._wake.set()
+        return batch_id
+
+    # Progress of a batch for /ai_batches/<batch_id>, None if unknown
+    def get(self, batch_id):
+        if self._pid != os.getpid() and not os.path.exists(self.path):
+            return None
+        self._open()
+        rows = self._db.query(
+            "SELECT status, route, params, openai_batch_id, openai_status, error, created_at, updated_at "
+            "FROM ai_batches WHERE id = ?",
+            (batch_id,),
+        )
+        if not rows:
+            return None
+        status, route, params, openai_batch_id, openai_status, error, created_at, updated_at = rows[0]
+        counts = dict(self._db.query(
+            "SELECT status, COUNT(*) FROM ai_batch_items WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ))
+        return {
+            "batch_id": batch_id,
+            "status": status,
+            "route": route,
+            "model": json.loads(params)["model"],
+            "openai_batch_id": openai_batch_id,
+            "openai_status": openai_status,
+            "error": error,
+            "total": sum(counts.values()),
+            "recipients": {state: counts.get(state, 0) for state in (PENDING, ANSWERED, SENT, FAILED)},
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def _run(self):
+        while True:
+            try:
+                for (batch_id,) in self._db.query(
+                    "SELECT id FROM ai_batches WHERE status NOT IN (?, ?) ORDER BY created_at", (COMPLETED, FAILED)
+                ):
+                    if self._claim(batch_id):
+                        self._advance(batch_id)
+            except Exception:
+                logging.exception("AI batch runner failed")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    # Takes or renews the lease; False when another live process holds it
+    def _claim(self, batch_id):
+        now = time.time()
+        if self._db.update(
+            "UPDATE ai_batches SET owner = ?, lease_until = ? WHERE id = ? AND (owner = ? OR lease_until < ?)",
+            (self.owner, now + self.lease, batch_id, self.owner, now),
+        ):
+            return True
+        # The holder died before its lease ran out (a restart on this host)
+        owner = self._db.query("SELECT owner FROM ai_batches WHERE id = ?", (batch_id,))[0][0]
+        if process_alive(int(owner.split(":")[0])):
+            return False
+        return self._db.update(
+            "UPDATE ai_batches SET owner = ?, lease_until = ? WHERE id = ? AND owner = ?",
+            (self.owner, now + self.lease, batch_id, owner),
+        ) == 1
+
+    def _set_status(self, batch_id, status, **fields):
+        fields["status"] = status
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._db.update(f"UPDATE ai_batches SET {columns} WHERE id = ?", (*fields.values(), batch_id))
+
+    def _advance(self, batch_id):
+        status, params, openai_batch_id = self._db.query(
+            "SELECT status, params, openai_batch_id FROM ai_batches WHERE id = ?", (batch_id,)
+        )[0]
+        try:
+            if status == PREPARING:
+                self._submit(batch_id, json.loads(params))
+            elif status == SUBMITTED:
+                self._collect(batch_id, openai_batch_id, json.loads(params)["model"])
+            elif status == SENDING:
+                self._deliver(batch_id)
+        except Exception as e:
+            # Tried again on the next poll
+            logging.error("AI batch %s: %s failed: %s", batch_id, status, e)
+            self._db.update(
+                "UPDATE ai_batches SET error = ?, updated_at = ? WHERE id = ?", (str(e), time.time(), batch_id)
+            )
+
+    # One chat completion request per recipient, uploaded as a JSONL file.
+    # custom_id is the recipient's position in the batch.
+    def _submit(self, batch_id, params):
+        lines = [
+            json.dumps({
+                "custom_id": str(seq),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {**params, "messages": self._messages(question)},
+            })
+            for seq, question in self._db.query(
+                "SELECT seq, question FROM ai_batch_items WHERE batch_id = ? ORDER BY seq", (batch_id,)
+            )
+        ]
+        upload = self._client.files.create(
+            file=(f"ai-batch-{batch_id}.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = self._client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+            metadata={"ai_batch_id": batch_id},
+        )
+        self._set_status(batch_id, SUBMITTED, openai_batch_id=batch.id, openai_status=batch.status, error=None)
+        logging.info("AI batch %s submitted as %s with %d requests", batch_id, batch.id, len(lines))
+
+    # Once OpenAI is done, stores the answers (and the errors of the
+    # requests that failed) and moves on to sending
+    def _collect(self, batch_id, openai_batch_id, model):
+        batch = self._client.batches.retrieve(openai_batch_id)
+        if batch.status not in OPENAI_DONE:
+            self._set_status(batch_id, SUBMITTED, openai_status=batch.status)
+            return
+
+        answered, failed = [], []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self._client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                seq = int(result["custom_id"])
+                response = result.get("response") or {}
+                body = response.get("body") or {}
+                if response.get("status_code") == 200:
+                    usage = body.get("usage") or {}
+                    BATCH_TOKENS.inc(usage.get("prompt_tokens") or 0, model=model, kind="prompt")
+                    BATCH_TOKENS.inc(usage.get("completion_tokens") or 0, model=model, kind="completion")
+                    answer = _answer(body)
+                    if answer:
+                        answered.append((answer, batch_id, seq))
+                    else:
+                        failed.append(("empty answer", batch_id, seq))
+                else:
+                    error = result.get("error") or body.get("error") or {}
+                    failed.append((error.get("message") or f"status {response.get('status_code')}", batch_id, seq))
+
+        errors = getattr(batch, "errors", None)
+        reason = errors.data[0].message if errors and errors.data else f"OpenAI batch {batch.status}"
+        self._db.transaction([
+            ("UPDATE ai_batch_items SET answer = ?, status = 'answered' WHERE batch_id = ? AND seq = ?", answered),
+            ("UPDATE ai_batch_items SET error = ?, status = 'failed' WHERE batch_id = ? AND seq = ?", failed),
+            # Requests the output does not mention (batch failed or expired)
+            ("UPDATE ai_batch_items SET error = ?, status = 'failed' WHERE batch_id = ? AND status = 'pending'",
+             [(reason, batch_id)]),
+        ])
+        BATCH_ITEMS.inc(len(answered), status=ANSWERED)
+        missing = self._db.query(
+            "SELECT COUNT(*) FROM ai_batch_items WHERE batch_id = ? AND status = 'failed'", (batch_id,)
+        )[0][0]
+        BATCH_ITEMS.inc(missing, status=FAILED)
+        self._set_status(batch_id, SENDING, openai_status=batch.status, error=None)
+        self._deliver(batch_id)
+
+    # Sends the answers not sent yet in recipient order, through the same
+    # rate limiter and retries as every other send. Each outcome is
+    # committed as it comes, so a restart only sends the rest; a message
+    # whose send was in flight when the process died is sent again.
+    def _deliver(self, batch_id):
+        items = self._db.query(
+            "SELECT seq, phone_number, answer FROM ai_batch_items WHERE batch_id = ? AND status = 'answered' "
+            "ORDER BY seq",
+            (batch_id,),
+        )
+        renewed = time.monotonic()
+        lost = False
+        for seq, ok, error in fan_out(
+            ((batch_id, seq, phone_number, answer) for seq, phone_number, answer in items),
+            self._send_item,
+            self.send_concurrency,
+        ):
+            # Not sent; the process that took the batch over sends it
+            if ok is None:
+                lost = True
+                continue
+            self._db.update(
+                "UPDATE ai_batch_items SET status = ?, error = ? WHERE batch_id = ? AND seq = ?",
+                (SENT if ok else FAILED, error, batch_id, seq),
+            )
+            BATCH_ITEMS.inc(status=SENT if ok else "send_failed")
+            if time.monotonic() - renewed > self.lease / 3:
+                if not self._claim(batch_id):
+                    return
+                renewed = time.monotonic()
+        if lost:
+            return
+
+        sent = self._db.query("SELECT COUNT(*) FROM ai_batch_items WHERE batch_id = ? AND status = 'sent'", (batch_id,))
+        self._set_status(batch_id, COMPLETED if sent[0][0] else FAILED)
+        logging.info("AI batch %s finished, %d messages sent", batch_id, sent[0][0])
+
+    # Waits out rate limits and open circuits instead of failing the
+    # recipient; the batch is not urgent. Gives the recipient up (ok None)
+    # when another process took the batch over meanwhile.
+    def _send_item(self, batch_id, seq, phone_number, answer):
+        while True:
+            try:
+                if self._send(phone_number, answer):
+                    return seq, True, None
+                return seq, False, "message sending failed"
+            except (RateLimited, CircuitOpen) as e:
+                if not self._claim(batch_id):
+                    return seq, None, "lease lost"
+                time.sleep(e.retry_after)
+            except Exception as e:
+                return seq, False, str(e)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_ai_batch_runner():
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = AIBatchRunner.from_env()
+    return _runner
+
+
+# Called after the fork in every server worker, like start_send_queue
+def start_ai_batches():
+    if _runner is not None and _runner._client is not None:
+        _runner.start()
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from whatsapp_bot.config import env_bool, env_float, env_int
+from whatsapp_bot.metrics import counter
+from whatsapp_bot.redis_backend import RedisBackend
+
+CACHE_REQUESTS = counter("ai_cache_requests_total", "AI response cache lookups", ["cache", "result"])
+CACHE_EVICTIONS = counter("ai_cache_evictions_total", "Entries dropped from the AI response cache", ["reason"])
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Rough per-entry bookkeeping cost (OrderedDict node, tuple, key string)
+_ENTRY_OVERHEAD = 200
+
+
+# "  What are your OPENING hours?? " -> "what are your opening hours"
+def normalize_question(text):
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _WHITESPACE.sub(" ", text)
+    return text.strip(" .!?¿¡,;:")
+
+
+def cache_key(model, system_prompt, question):
+    raw = "\x1f".join((model, system_prompt, normalize_question(question)))
+    return "ai:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# In-process backend with TTL expiry and LRU eviction, bounded both by entry
+# count and by approximate memory use.
+class MemoryBackend:
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, size = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.bytes -= size
+                CACHE_EVICTIONS.inc(reason="expired")
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        size = len(value.encode("utf-8")) + len(key) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (self.clock() + ttl, value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                CACHE_EVICTIONS.inc(reason="lru")
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Cache in front of the chat completion call, keyed on the model, the system
+# prompt and the normalized question.
+class ResponseCache:
+    def __init__(self, backend, ttl=3600.0, name="exact"):
+        self.backend = backend
+        self.ttl = ttl
+        self.name = name
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("AI_CACHE_BACKEND", "memory") == "redis":
+            # Every worker process sees the same hits. Size and LRU limits
+            # are left to Redis itself (maxmemory + allkeys-lru).
+            backend = RedisBackend(os.getenv("AI_CACHE_REDIS_URL", "redis://localhost:6379/0"), "AI_CACHE_BACKEND")
+        else:
+            backend = MemoryBackend(
+                max_entries=env_int("AI_CACHE_MAX_ENTRIES", 10000),
+                max_bytes=env_int("AI_CACHE_MAX_BYTES", 16 * 1024 * 1024),
+            )
+        return cls(backend, ttl=env_float("AI_CACHE_TTL", 3600.0))
+
+    def get(self, model, system_prompt, question):
+        value = self.backend.get(cache_key(model, system_prompt, question))
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if value is None else "hit")
+        return value
+
+    def set(self, model, system_prompt, question, answer):
+        self.backend.set(cache_key(model, system_prompt, question), answer, self.ttl)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# The shared cache, or None when AI_CACHE_ENABLED is off
+def get_ai_cache():
+    global _cache
+    if not env_bool("AI_CACHE_ENABLED", False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache.from_env()
+    return _cache
@@ -0,0 +1,179 @@
+import json
+import logging
+import re
+import time
+from urllib.parse import parse_qsl
+
+
+# What an ASGI handler hands back: body bytes, status, and headers
+class Response:
+    def __init__(self, body=b"", status=200, content_type="application/json", headers=None):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.status = status
+        self.headers = dict(headers or {})
+        self.headers.setdefault("Content-Type", content_type)
+
+
+def json_response(data, status=200, headers=None):
+    return Response(json.dumps(data), status, headers=headers)
+
+
+def text_response(body, status=200, content_type="text/plain; charset=utf-8"):
+    return Response(body, status, content_type=content_type)
+
+
+# Just the request details the routes need: path, query arguments,
+# headers (lower-cased names) and the JSON body
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                        for name, value in scope.get("headers", [])}
+        self.body = body
+        # Path of the matched route, None for unknown paths, and the values
+        # of its <name> segments
+        self.route = None
+        self.view_args = {}
+
+    def json(self):
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+# Minimal ASGI application with Flask-style @route / @errorhandler
+# decorators, so the async routes read like the Flask ones without adding a
+# framework dependency. Serve it with any ASGI server (uvicorn, hypercorn).
+# A path segment written <name> matches any one segment and is passed to
+# the handler as a keyword argument.
+class AsgiApp:
+    def __init__(self):
+        self._routes = {}
+        self._patterns = []
+        self._error_handlers = {}
+        self._startup = []
+        self._shutdown = []
+        self._after_request = []
+
+    def route(self, path, methods=("GET",)):
+        def register(handler):
+            if "<" in path:
+                pattern = re.compile("^" + re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", path) + "$")
+                for method in methods:
+                    self._patterns.append((method, pattern, path, handler))
+                return handler
+            for method in methods:
+                self._routes[(method, path)] = handler
+            return handler
+        return register
+
+    # (handler, route path, path arguments, whether the path has a route)
+    # for a request; the handler is None when nothing matches the method
+    def _match(self, method, path):
+        handler = self._routes.get((method, path))
+        if handler is not None:
+            return handler, path, {}, True
+        allowed = any(route_path == path for _, route_path in self._routes)
+        for route_method, pattern, route_path, route_handler in self._patterns:
+            match = pattern.match(path)
+            if match is None:
+                continue
+            if route_method == method:
+                return route_handler, route_path, match.groupdict(), True
+            allowed = True
+        return None, None, {}, allowed
+
+    def errorhandler(self, exc_type):
+        def register(handler):
+            self._error_handlers[exc_type] = handler
+            return handler
+        return register
+
+    # Functions called with (request, response, seconds) after every request,
+    # before the response is sent (metrics)
+    def after_request(self, fn):
+        self._after_request.append(fn)
+        return fn
+
+    # Coroutine functions run when the server starts, before it accepts
+    # requests (starting the send queue)
+    def on_startup(self, fn):
+        self._startup.append(fn)
+        return fn
+
+    # Coroutine functions run when the server shuts down (closing pools)
+    def on_shutdown(self, fn):
+        self._shutdown.append(fn)
+        return fn
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                for fn in self._startup:
+                    try:
+                        await fn()
+                    except Exception:
+                        logging.exception("ASGI startup hook failed")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for fn in self._shutdown:
+                    try:
+                        await fn()
+                    except Exception:
+                        logging.exception("ASGI shutdown hook failed")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        request = Request(scope, b"".join(chunks))
+        start = time.perf_counter()
+
+        handler, route, view_args, allowed = self._match(request.method, request.path)
+        if handler is None:
+            response = json_response(
+                {"status": "error", "message": "Method not allowed" if allowed else "Not found"},
+                405 if allowed else 404,
+            )
+        else:
+            request.route = route
+            request.view_args = view_args
+            response = await self._handle(handler, request)
+
+        elapsed = time.perf_counter() - start
+        for fn in self._after_request:
+            try:
+                fn(request, response, elapsed)
+            except Exception:
+                logging.exception("ASGI after_request hook failed")
+
+        headers = [(name.lower().encode("latin-1"), str(value).encode("latin-1"))
+                   for name, value in response.headers.items()]
+        headers.append((b"content-length", str(len(response.body)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": response.status, "headers": headers})
+        await send({"type": "http.response.body", "body": response.body})
+
+    async def _handle(self, handler, request):
+        try:
+            return await handler(request, **request.view_args)
+        except Exception as e:
+            for exc_type, error_handler in self._error_handlers.items():
+                if isinstance(e, exc_type):
+                    return error_handler(e)
+            logging.exception("Error handling %s %s", request.method, request.path)
+            return json_response({"status": "error", "message": "Internal server error"}, 500)
@@ -0,0 +1,124 @@
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from whatsapp_bot.config import env_int
+from whatsapp_bot.graph_client import get_graph_client
+from whatsapp_bot.payloads import text_payload
+from whatsapp_bot.templates import TemplateError, get_template_registry, template_message
+
+
+def max_recipients():
+    return env_int("BULK_MAX_RECIPIENTS", 10000)
+
+
+# Requested concurrency, clamped to 1..BULK_MAX_CONCURRENCY
+def bulk_concurrency(requested=None):
+    limit = env_int("BULK_MAX_CONCURRENCY", 32)
+    try:
+        value = int(requested) if requested is not None else env_int("BULK_CONCURRENCY", 16)
+    except (TypeError, ValueError):
+        value = env_int("BULK_CONCURRENCY", 16)
+    return max(1, min(value, limit))
+
+
+def normalize_phone(phone_number):
+    phone_number = str(phone_number)
+    return phone_number if phone_number.startswith('+') else '+' + phone_number
+
+
+# Recipient keys that override the shared template content
+TEMPLATE_OVERRIDES = ("language_code", "parameters", "header", "buttons")
+
+
+# Turn the /send_bulk body into (phone_number, payload, error) items.
+# Recipients are either plain numbers or objects that override the shared
+# "message" / "parameters" / "header" / "buttons" for that recipient. A
+# template send that does not fit its template gets the reason as `error`
+# and is never sent. The shared template content is checked and built once,
+# every recipient without overrides only gets its own outer payload.
+def build_bulk_items(data):
+    template_name = data.get("template_name")
+    templates = get_template_registry()
+    shared = None
+
+    # ("template" object, None) or (None, why it cannot be sent)
+    def prepare(recipient):
+        try:
+            return templates.prepare(
+                template_name,
+                recipient.get("language_code", data.get("language_code", "en_US")),
+                recipient.get("parameters", data.get("parameters")),
+                recipient.get("header", data.get("header")),
+                recipient.get("buttons", data.get("buttons")),
+            ), None
+        except TemplateError as e:
+            return None, str(e)
+
+    for recipient in data.get("recipients") or []:
+        if not isinstance(recipient, dict):
+            recipient = {"phone_number": recipient}
+        phone_number = recipient.get("phone_number")
+        if not phone_number:
+            yield None, None, None
+            continue
+        phone_number = normalize_phone(phone_number)
+
+        if template_name:
+            if any(key in recipient for key in TEMPLATE_OVERRIDES):
+                template, error = prepare(recipient)
+            else:
+                if shared is None:
+                    shared = prepare({})
+                template, error = shared
+            yield phone_number, (template_message(phone_number, template) if template else None), error
+        else:
+            message = recipient.get("message", data.get("message"))
+            yield phone_number, (text_payload(phone_number, message) if message else None), None
+
+
+def send_bulk_item(phone_number, payload, error=None):
+    if payload is None:
+        return {"phone_number": phone_number, "success": False, "error": error or "missing phone number or message"}
+    try:
+        response = get_graph_client().send_message(payload)
+    except Exception as e:
+        return {"phone_number": phone_number, "success": False, "error": str(e)}
+
+    if response.status_code == 200:
+        messages = response.json().get("messages") or [{}]
+        return {"phone_number": phone_number, "success": True, "message_id": messages[0].get("id")}
+    return {
+        "phone_number": phone_number,
+        "success": False,
+        "status_code": response.status_code,
+        "error": response.text,
+    }
+
+
+# Run send(*item) for every item with at most `concurrency` sends in flight
+# and yield the results in completion order. Items are pulled lazily, so a
+# huge recipient list never turns into a huge pile of pending futures.
+def fan_out(items, send, concurrency=16):
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+        for item in items:
+            in_flight.add(pool.submit(send, *item))
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(in_flight):
+            yield future.result()
+
+
+# NDJSON lines for the /send_bulk response: one per recipient, then a summary
+def stream_bulk_results(items, concurrency=16):
+    sent = failed = 0
+    for result in fan_out(items, send_bulk_item, concurrency):
+        if result["success"]:
+            sent += 1
+        else:
+            failed += 1
+        yield json.dumps(result) + "\n"
+    yield json.dumps({"summary": {"total": sent + failed, "sent": sent, "failed": failed}}) + "\n"
@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from whatsapp_bot.config import env_bool, env_float, env_int
+from whatsapp_bot.metrics import counter, gauge
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Gauge values of the states
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = gauge(
+    "circuit_breaker_state", "Circuit breaker state per upstream: 0 closed, 1 half-open, 2 open", ["upstream"]
+)
+TRANSITIONS = counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes by the state entered", ["upstream", "state"]
+)
+REJECTED = counter("circuit_breaker_rejected_total", "Calls failed fast while the circuit was open", ["upstream"])
+
+
+class CircuitOpen(Exception):
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} circuit is open, retry after {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+# Failure-rate circuit breaker for one upstream API.
+#
+# Closed: calls go through and their outcomes are counted in one-second
+# buckets over the last `window` seconds. Once at least `min_calls` calls
+# have been seen and `failure_rate` of them failed, the circuit opens.
+# Open: calls fail at once with CircuitOpen for `open_seconds`.
+# Half-open: up to `half_open_calls` probe calls go through; a healthy probe
+# closes the circuit, a failed one opens it again.
+#
+# Outcomes are reported by the caller: True (the upstream answered), False
+# (it is failing) or None (the call never reached it), see RetryPolicy.
+class CircuitBreaker:
+    def __init__(self, name, failure_rate=0.5, min_calls=20, window=30.0, open_seconds=30.0,
+                 half_open_calls=1, enabled=True, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(1, half_open_calls)
+        self.enabled = enabled
+        self.clock = clock
+        self.state = CLOSED
+        self._buckets = deque()
+        self._calls = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(STATE_VALUES[CLOSED], upstream=name)
+
+    @classmethod
+    def from_env(cls, name):
+        return cls(
+            name,
+            failure_rate=env_float("CIRCUIT_FAILURE_RATE", 0.5),
+            min_calls=env_int("CIRCUIT_MIN_CALLS", 20),
+            window=env_float("CIRCUIT_WINDOW", 30.0),
+            open_seconds=env_float("CIRCUIT_OPEN_SECONDS", 30.0),
+            half_open_calls=env_int("CIRCUIT_HALF_OPEN_CALLS", 1),
+            enabled=env_bool("CIRCUIT_BREAKER_ENABLED", True),
+        )
+
+    # Raises CircuitOpen when the call may not go through. Returns whether
+    # the call is a half-open probe; pass that back to record().
+    def allow(self):
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self.state == OPEN:
+                wait = self._opened_at + self.open_seconds - self.clock()
+                if wait > 0:
+                    REJECTED.inc(upstream=self.name)
+                    raise CircuitOpen(self.name, wait)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    REJECTED.inc(upstream=self.name)
+                    raise CircuitOpen(self.name, 1.0)
+                self._probes += 1
+                return True
+            return False
+
+    # Like allow() but without taking a probe slot, for work that is only
+    # worth doing when the upstream can be called (cache embeddings, an AI
+    # answer that could not be sent)
+    def check(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                wait = self._opened_at + self.open_seconds - self.clock()
+                if wait > 0:
+                    REJECTED.inc(upstream=self.name)
+                    raise CircuitOpen(self.name, wait)
+
+    def record(self, healthy, probe=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            if probe:
+                self._probes -= 1
+                if self.state == HALF_OPEN and healthy is not None:
+                    self._transition(CLOSED if healthy else OPEN)
+                return
+            # Calls that started before the circuit opened say nothing new
+            if healthy is None or self.state != CLOSED:
+                return
+            now = self.clock()
+            second = int(now)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            self._calls += 1
+            if not healthy:
+                bucket[2] += 1
+                self._failures += 1
+            self._expire(now)
+            if self._calls >= self.min_calls and self._failures >= self.failure_rate * self._calls:
+                self._transition(OPEN)
+
+    def _expire(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            _, calls, failures = self._buckets.popleft()
+            self._calls -= calls
+            self._failures -= failures
+
+    def _transition(self, state):
+        if state == OPEN:
+            self._opened_at = self.clock()
+            logging.warning("%s circuit opened for %.0fs", self.name, self.open_seconds)
+        elif state == CLOSED:
+            self._buckets.clear()
+            self._calls = self._failures = 0
+            if self.state != CLOSED:
+                logging.warning("%s circuit closed", self.name)
+        self.state = state
+        BREAKER_STATE.set(STATE_VALUES[state], upstream=self.name)
+        TRANSITIONS.inc(upstream=self.name, state=state)
+
+    # State for the health endpoint
+    def snapshot(self):
+        with self._lock:
+            self._expire(self.clock())
+            snapshot = {
+                "state": self.state if self.enabled else "disabled",
+                "calls": self._calls,
+                "failure_rate": round(self._failures / self._calls, 3) if self._calls else 0.0,
+            }
+            if self.state == OPEN:
+                snapshot["retry_after"] = round(max(0.0, self._opened_at + self.open_seconds - self.clock()), 1)
+            return snapshot
+
+
+# Upstreams the app calls, reported by health() even before their first call
+UPSTREAMS = ("openai", "graph")
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+# Process-wide breaker per upstream; the sync and async clients of an
+# upstream share one
+def get_circuit_breaker(name):
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker.from_env(name)
+    return breaker
+
+
+# "ok" when every circuit is closed, "degraded" otherwise, with the state of
+# each upstream
+def health():
+    upstreams = {name: get_circuit_breaker(name).snapshot() for name in UPSTREAMS}
+    degraded = any(upstream["state"] in (OPEN, HALF_OPEN) for upstream in upstreams.values())
+    return {"status": "degraded" if degraded else "ok", "upstreams": upstreams}
+
+
+# The retry policies keep their breakers, so the breakers stay and only get
+# new locks
+def _reset_after_fork():
+    global _breakers_lock
+    _breakers_lock = threading.Lock()
+    for breaker in _breakers.values():
+        breaker._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from whatsapp_bot.config import env_bool, env_float, env_int
+from whatsapp_bot.metrics import counter
+
+CONVERSATION_EVICTIONS = counter(
+    "conversation_evictions_total", "Conversations dropped from memory", ["reason"]
+)
+CONVERSATION_SUMMARIES = counter(
+    "conversation_summaries_total", "Older conversation turns folded into a summary", ["result"]
+)
+
+USER = "user"
+ASSISTANT = "assistant"
+
+
+# Rough token count (about four bytes of UTF-8 per token plus the per-message
+# overhead of the chat format). Good enough for a budget, and needs no
+# tokenizer.
+def estimate_tokens(data):
+    return len(data) // 4 + 4
+
+
+# One user's history. Turns are stored as UTF-8 bytes, alternating user and
+# assistant, with their token estimates in a 2-byte array, so a short
+# exchange costs little more than its text.
+class Conversation:
+    __slots__ = ("summary", "turns", "tokens", "updated", "summarizing")
+
+    def __init__(self, now):
+        self.summary = b""
+        self.turns = []
+        self.tokens = array("H")
+        self.updated = now
+        self.summarizing = False
+
+    def summary_tokens(self):
+        return estimate_tokens(self.summary) if self.summary else 0
+
+    def total_tokens(self):
+        return self.summary_tokens() + sum(self.tokens)
+
+    def drop_oldest(self, count):
+        del self.turns[:count]
+        del self.tokens[:count]
+
+
+# Rolling per-phone-number history for prompts. Each prompt gets the running
+# summary plus as many recent turns as fit in `token_budget`. Once the
+# history outgrows the budget (or `max_turns` exchanges), append() asks the
+# caller to run compact(), which folds the oldest turns into the summary.
+# Conversations idle for `ttl` seconds, or beyond `max_entries`, are evicted
+# least recently used first.
+class ConversationStore:
+    def __init__(self, token_budget=1000, max_turns=10, max_entries=100000, ttl=21600.0,
+                 summarize=True, clock=time.monotonic):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.summarize = summarize
+        self.clock = clock
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            token_budget=env_int("CONVERSATION_TOKEN_BUDGET", 1000),
+            max_turns=env_int("CONVERSATION_MAX_TURNS", 10),
+            max_entries=env_int("CONVERSATION_MAX_ENTRIES", 100000),
+            ttl=env_float("CONVERSATION_TTL", 21600.0),
+            summarize=env_bool("CONVERSATION_SUMMARIZE", True),
+        )
+
+    def _get(self, key, now):
+        conversation = self._conversations.get(key)
+        if conversation is not None and now - conversation.updated > self.ttl:
+            del self._conversations[key]
+            CONVERSATION_EVICTIONS.inc(reason="expired")
+            return None
+        return conversation
+
+    # (summary, [(role, text), ...]) to put in front of the next question:
+    # the newest whole exchanges that fit in the budget next to the summary
+    def history(self, phone_number):
+        with self._lock:
+            conversation = self._get(phone_number.lstrip('+'), self.clock())
+            if conversation is None:
+                return "", []
+            budget = self.token_budget - conversation.summary_tokens()
+            start = len(conversation.turns)
+            while start >= 2:
+                cost = conversation.tokens[start - 2] + conversation.tokens[start - 1]
+                if cost > budget:
+                    break
+                budget -= cost
+                start -= 2
+            summary = conversation.summary.decode("utf-8")
+            turns = conversation.turns[start:]
+        roles = (USER, ASSISTANT)
+        return summary, [(roles[i % 2], text.decode("utf-8")) for i, text in enumerate(turns)]
+
+    # Record one exchange. Returns True when the caller should run compact()
+    # for this number (at most once until that compact() has finished).
+    def append(self, phone_number, question, answer):
+        key = phone_number.lstrip('+')
+        with self._lock:
+            now = self.clock()
+            conversation = self._get(key, now)
+            if conversation is None:
+                conversation = self._conversations[key] = Conversation(now)
+            self._conversations.move_to_end(key)
+            conversation.updated = now
+            for text in (question, answer):
+                data = text.encode("utf-8")
+                conversation.turns.append(data)
+                conversation.tokens.append(min(estimate_tokens(data), 0xFFFF))
+            self._evict(now)
+
+            over_budget = (
+                conversation.total_tokens() > self.token_budget
+                or len(conversation.turns) > 2 * self.max_turns
+            )
+            if not over_budget:
+                return False
+            if not self.summarize:
+                self._trim(conversation)
+                return False
+            # Hard cap in case summaries keep failing or lag far behind
+            if len(conversation.turns) > 4 * self.max_turns:
+                conversation.drop_oldest(len(conversation.turns) - 2 * self.max_turns)
+            if conversation.summarizing:
+                return False
+            conversation.summarizing = True
+            return True
+
+    # Without summaries the oldest exchanges are simply forgotten
+    def _trim(self, conversation):
+        while len(conversation.turns) > 2 and (
+            conversation.total_tokens() > self.token_budget or len(conversation.turns) > 2 * self.max_turns
+        ):
+            conversation.drop_oldest(2)
+
+    def _evict(self, now):
+        while self._conversations:
+            key, conversation = next(iter(self._conversations.items()))
+            if len(self._conversations) > self.max_entries:
+                CONVERSATION_EVICTIONS.inc(reason="lru")
+            elif now - conversation.updated > self.ttl:
+                CONVERSATION_EVICTIONS.inc(reason="expired")
+            else:
+                break
+            del self._conversations[key]
+
+    # Fold the oldest exchanges into the summary with summarizer(summary,
+    # [(role, text), ...]) -> new summary, until the history is back to half
+    # the budget. The (slow) summarizer runs without holding the lock.
+    def compact(self, phone_number, summarizer):
+        key = phone_number.lstrip('+')
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                return
+            target = self.token_budget // 2
+            remaining = conversation.total_tokens()
+            count = 0
+            while count + 2 < len(conversation.turns) and (
+                remaining > target or len(conversation.turns) - count > self.max_turns
+            ):
+                remaining -= conversation.tokens[count] + conversation.tokens[count + 1]
+                count += 2
+            folded = conversation.turns[:count]
+            summary = conversation.summary.decode("utf-8")
+
+        try:
+            if folded:
+                roles = (USER, ASSISTANT)
+                turns = [(roles[i % 2], text.decode("utf-8")) for i, text in enumerate(folded)]
+                summary = summarizer(summary, turns)
+                if not summary:
+                    raise ValueError("empty summary")
+        except Exception as e:
+            logging.warning("Conversation summary failed: %s", e)
+            CONVERSATION_SUMMARIES.inc(result="error")
+            summary = None
+
+        with self._lock:
+            conversation.summarizing = False
+            # Appends only add at the end, but the hard cap may have dropped
+            # the folded turns in the meantime
+            if summary is None or conversation.turns[:len(folded)] != folded:
+                return
+            conversation.drop_oldest(len(folded))
+            conversation.summary = summary.encode("utf-8")
+        if folded:
+            CONVERSATION_SUMMARIES.inc(result="ok")
+
+    def clear(self, phone_number):
+        with self._lock:
+            self._conversations.pop(phone_number.lstrip('+'), None)
+
+    def __len__(self):
+        return len(self._conversations)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# The shared conversation store, or None unless CONVERSATION_MEMORY_ENABLED
+# is on. Off by default: with history, answers are no longer shared through
+# the response caches and question coalescing, and phone numbers' messages
+# are kept in memory.
+def get_conversation_store():
+    global _store
+    if not env_bool("CONVERSATION_MEMORY_ENABLED", False):
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore.from_env()
+    return _store
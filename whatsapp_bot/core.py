@@ -0,0 +1,1360 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+
+from dotenv import load_dotenv
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from openai import APIConnectionError, AsyncOpenAI, OpenAI
+
+from whatsapp_bot.ai_batch import build_batch_items, get_ai_batch_runner, start_ai_batches
+from whatsapp_bot.ai_cache import get_ai_cache
+from whatsapp_bot.asgi import AsgiApp, json_response, text_response
+from whatsapp_bot.bulk import build_bulk_items, bulk_concurrency, max_recipients, normalize_phone, stream_bulk_results
+from whatsapp_bot.circuit_breaker import CircuitOpen, get_circuit_breaker, health
+from whatsapp_bot.config import env_float
+from whatsapp_bot.conversations import get_conversation_store
+from whatsapp_bot.graph_client import close_async_graph_client, get_async_graph_client, get_graph_client, sent_message_id
+from whatsapp_bot.idempotency import PENDING, get_idempotency_store
+from whatsapp_bot.instrumentation import AI_RESPONSE_LATENCY, SEND_LATENCY, observe_request, record_token_usage
+from whatsapp_bot.locales import current_locale, load_strings
+from whatsapp_bot.logs import configure_logging, log_success
+from whatsapp_bot.media import (
+    MediaError, MediaUploadFailed, file_sha256, get_media_store, is_media_id_error, media_limits
+)
+from whatsapp_bot.metrics import CONTENT_TYPE, REGISTRY
+from whatsapp_bot.model_routing import get_model_router
+from whatsapp_bot.payloads import media_payload, text_payload
+from whatsapp_bot.rate_limit import RateLimited
+from whatsapp_bot.retry import RetryPolicy
+from whatsapp_bot.scheduler import get_scheduler, start_scheduler
+from whatsapp_bot.semantic_cache import get_semantic_cache
+from whatsapp_bot.send_queue import JobFailed, QueueFull, get_send_queue, start_send_queue, wants_async
+from whatsapp_bot.single_flight import flight_key, get_async_single_flight, get_single_flight
+from whatsapp_bot.streaming import recipient_locks, split_chunks, wants_stream
+from whatsapp_bot.templates import TemplateError, get_template_registry
+from whatsapp_bot.webhook import WEBHOOK_MESSAGES, iter_messages, message_text, verify_signature, verify_subscription
+
+# Load environment variables from .env file
+load_dotenv()
+
+# User-facing strings in the locale the entry point picked (main.py: Finnish,
+# main_en.py: English), see whatsapp_bot/locales
+STRINGS = load_strings(current_locale())
+
+# Initialize API keys and URLs
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Seconds an OpenAI call may take. The client default is ten minutes, which
+# would hold a worker for a whole outage.
+OPENAI_TIMEOUT = env_float("OPENAI_TIMEOUT", 30.0)
+
+# Initialize OpenAI client
+client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=OPENAI_TIMEOUT)
+ai_retry = RetryPolicy.from_env("openai", retry_on=(APIConnectionError,))
+
+# Model for conversation summaries (answers use the model routes, see
+# whatsapp_bot/model_routing.py) and the system prompt, part of the cache key
+AI_MODEL = "gpt-4.1-mini-2025-04-14"
+SYSTEM_PROMPT = STRINGS["system_prompt"]
+
+# Reply when no answer can be generated
+AI_FALLBACK_REPLY = STRINGS["fallback_reply"]
+
+# Prompt for folding older turns into the conversation summary
+SUMMARY_PROMPT = STRINGS["summary_prompt"]
+
+# Initialize Flask application
+app = Flask(__name__)
+configure_logging()
+
+# Earlier turns with this number as chat messages, the summary of older turns first
+def conversation_messages(phone_number):
+    conversations = get_conversation_store()
+    if conversations is None or not phone_number:
+        return []
+    summary, turns = conversations.history(phone_number)
+    messages = [{"role": "system", "content": STRINGS["conversation_summary"].format(summary=summary)}] if summary else []
+    messages.extend({"role": role, "content": text} for role, text in turns)
+    return messages
+
+# Chat messages for a question
+def ai_messages(message_text, history=()):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": message_text}
+    ]
+
+# Cached answer for the question, plus the question's embedding for store_ai_response
+def cached_ai_response(message_text, model):
+    # Answer from the response cache if the same question was asked recently
+    ai_cache = get_ai_cache()
+    if ai_cache is not None:
+        cached = ai_cache.get(model, SYSTEM_PROMPT, message_text)
+        if cached is not None:
+            return cached, None
+    
+    # Otherwise try a cached answer to a near-identical question
+    semantic_cache = get_semantic_cache(client)
+    if semantic_cache is not None:
+        return semantic_cache.lookup(model, SYSTEM_PROMPT, message_text)
+    return None, None
+
+# Only real answers are cached, never the fallback message
+def store_ai_response(message_text, question_vector, ai_response, model):
+    if not ai_response:
+        return
+    ai_cache = get_ai_cache()
+    if ai_cache is not None:
+        ai_cache.set(model, SYSTEM_PROMPT, message_text, ai_response)
+    semantic_cache = get_semantic_cache(client)
+    if semantic_cache is not None:
+        semantic_cache.store(model, SYSTEM_PROMPT, question_vector, ai_response)
+
+# OpenAI is known to be down (its circuit is open): answer at once with a
+# cached answer to the question, even for a follow-up, or the fallback reply
+def degraded_ai_response(message_text, phone_number, model, looked_up):
+    cached = None if looked_up else cached_ai_response(message_text, model)[0]
+    if cached is None:
+        return AI_FALLBACK_REPLY
+    remember_ai_response(phone_number, message_text, cached)
+    return cached
+
+# Fold older turns into the running summary of a conversation
+def summarize_conversation(summary, turns):
+    transcript = "\n".join(f"{role}: {text}" for role, text in turns)
+    if summary:
+        transcript = STRINGS["summary_so_far"].format(summary=summary) + f"\n\n{transcript}"
+    response = ai_retry.call(
+        client.chat.completions.create,
+        model=AI_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript}
+        ],
+        max_tokens=200,
+    )
+    record_token_usage(AI_MODEL, response.usage)
+    return response.choices[0].message.content
+
+# Add the exchange to the conversation memory; once it outgrows the token
+# budget the oldest turns are summarized on the send queue
+def remember_ai_response(phone_number, message_text, ai_response):
+    conversations = get_conversation_store()
+    if conversations is None or not phone_number or not ai_response:
+        return
+    if conversations.append(phone_number, message_text, ai_response):
+        try:
+            send_queue.submit("summarize_conversation", phone_number=phone_number)
+        except QueueFull:
+            conversations.compact(phone_number, summarize_conversation)
+
+# Generate AI response using OpenAI
+def generate_ai_response(message_text, phone_number=None, ai_options=None):
+    start = time.perf_counter()
+    history = conversation_messages(phone_number)
+    route = get_model_router().choose(message_text, bool(history), ai_options)
+    # Cached answers only fit questions asked without earlier context or per-request AI options
+    use_cache = not history and not ai_options
+    cached, question_vector = cached_ai_response(message_text, route.model) if use_cache else (None, None)
+    if cached is not None:
+        remember_ai_response(phone_number, message_text, cached)
+        AI_RESPONSE_LATENCY.observe(time.perf_counter() - start, source="cache")
+        return cached
+    
+    # Identical questions asked at the same time share one completion (see
+    # whatsapp_bot/single_flight.py); each caller remembers and sends its own copy
+    def complete():
+        # Use the new client method
+        response = ai_retry.call(
+            client.chat.completions.create,
+            messages=ai_messages(message_text, history),
+            **route.params(),
+        )
+        ai_response = response.choices[0].message.content
+        log_success(
+            "AI response generated",
+            completion_id=response.id,
+            route=route.name,
+            chars=len(ai_response or ""),
+            ms=round((time.perf_counter() - start) * 1000, 1),
+            body=ai_response,
+        )
+        record_token_usage(route.model, response.usage)
+        get_model_router().record(route, time.perf_counter() - start, response.usage)
+        if use_cache:
+            store_ai_response(message_text, question_vector, ai_response, route.model)
+        return ai_response
+    
+    try:
+        key = None if history else flight_key(route.params(), SYSTEM_PROMPT, message_text)
+        ai_response, shared = get_single_flight().do(key, complete)
+        remember_ai_response(phone_number, message_text, ai_response)
+        AI_RESPONSE_LATENCY.observe(time.perf_counter() - start, source="coalesced" if shared else "openai")
+        return ai_response
+    except CircuitOpen:
+        ai_response = degraded_ai_response(message_text, phone_number, route.model, use_cache)
+        AI_RESPONSE_LATENCY.observe(time.perf_counter() - start, source="degraded")
+        return ai_response
+    except Exception as e:
+        logging.error("Error in AI response: %s", e)
+        AI_RESPONSE_LATENCY.observe(time.perf_counter() - start, source="error")
+        return AI_FALLBACK_REPLY
+
+# Streamed variant of generate_ai_response: yields the answer as it is generated
+def stream_ai_response(message_text, phone_number=None, ai_options=None):
+    history = conversation_messages(phone_number)
+    route = get_model_router().choose(message_text, bool(history), ai_options)
+    # Cached answers only fit questions asked without earlier context or per-request AI options
+    use_cache = not history and not ai_options
+    cached, question_vector = cached_ai_response(message_text, route.model) if use_cache else (None, None)
+    if cached is not None:
+        remember_ai_response(phone_number, message_text, cached)
+        yield cached
+        return
+    
+    parts = []
+    try:
+        stream = ai_retry.call(
+            client.chat.completions.create,
+            messages=ai_messages(message_text, history),
+            stream=True,
+            stream_options={"include_usage": True},
+            **route.params(),
+        )
+        for event in stream:
+            if event.usage:
+                record_token_usage(route.model, event.usage)
+                get_model_router().record(route, usage=event.usage)
+            if event.choices and event.choices[0].delta.content:
+                parts.append(event.choices[0].delta.content)
+                yield event.choices[0].delta.content
+    except CircuitOpen:
+        yield degraded_ai_response(message_text, phone_number, route.model, use_cache)
+        return
+    except Exception as e:
+        logging.error("Error in AI response: %s", e)
+        if not parts:
+            yield AI_FALLBACK_REPLY
+        return
+    
+    ai_response = "".join(parts)
+    log_success("AI response generated", route=route.name, chars=len(ai_response), body=ai_response)
+    if use_cache:
+        store_ai_response(message_text, question_vector, ai_response, route.model)
+    remember_ai_response(phone_number, message_text, ai_response)
+
+# Send WhatsApp message
+def send_whatsapp_message(phone_number, message):
+    payload = text_payload(phone_number, message)
+    
+    start = time.perf_counter()
+    response = get_graph_client().send_message(payload)
+    elapsed = time.perf_counter() - start
+    SEND_LATENCY.observe(elapsed, result="sent" if response.status_code == 200 else "failed")
+    
+    if response.status_code == 200:
+        log_success(
+            "Message sent successfully",
+            message_id=lambda: sent_message_id(response),
+            ms=round(elapsed * 1000, 1),
+            body=lambda: response.text,
+        )
+        return True
+    else:
+        logging.error("Error sending message: %s", response.text)
+        return False
+
+# Send an uploaded image, document or audio by its media id. Returns the
+# Graph API response, so that a refused media id can be told apart.
+def send_whatsapp_media(phone_number, media_type, media_id, caption=None, filename=None):
+    payload = media_payload(phone_number, media_type, media_id, caption, filename)
+    
+    start = time.perf_counter()
+    response = get_graph_client().send_message(payload)
+    elapsed = time.perf_counter() - start
+    SEND_LATENCY.observe(elapsed, result="sent" if response.status_code == 200 else "failed")
+    
+    if response.status_code == 200:
+        log_success(
+            "Media message sent successfully",
+            media_type=media_type,
+            message_id=lambda: sent_message_id(response),
+            ms=round(elapsed * 1000, 1),
+            body=lambda: response.text,
+        )
+    else:
+        logging.error("Error sending media message: %s", response.text)
+    return response
+
+# Send the AI answer in chunks: every complete sentence/paragraph group goes
+# out as its own WhatsApp message as soon as it is ready. Returns the full
+# answer and whether every chunk was delivered.
+def send_ai_response_streamed(phone_number, message_text, ai_options=None):
+    chunks = []
+    with recipient_locks.hold(phone_number):
+        for chunk in split_chunks(stream_ai_response(message_text, phone_number, ai_options)):
+            chunks.append(chunk)
+            if chunk.strip() and not send_whatsapp_message(phone_number, chunk.strip()):
+                return "".join(chunks), False
+    return "".join(chunks), True
+
+# Background tasks for async mode
+def send_message_task(phone_number, message):
+    if not send_whatsapp_message(phone_number, message):
+        raise JobFailed(STRINGS["send_failed"])
+    return {"to": phone_number}
+
+def send_ai_message_task(phone_number, question, stream=False, ai_options=None):
+    # An answer that cannot be sent yet is not worth an OpenAI call; the job
+    # waits on the send queue until the Graph circuit may close
+    get_circuit_breaker("graph").check()
+    if stream:
+        ai_response, sent = send_ai_response_streamed(phone_number, question, ai_options)
+    else:
+        ai_response = generate_ai_response(question, phone_number, ai_options)
+        sent = send_whatsapp_message(phone_number, ai_response)
+    result = {"to": phone_number, "ai_response": ai_response}
+    if not sent:
+        raise JobFailed(STRINGS["send_failed"], result)
+    return result
+
+# Approved message templates; template sends are checked and built locally
+templates = get_template_registry()
+
+def send_template_task(phone_number, template_name, language_code="en_US", parameters=None, header=None,
+                       buttons=None):
+    try:
+        payload = templates.render(phone_number, template_name, language_code, parameters, header, buttons)
+    except TemplateError as e:
+        raise JobFailed(STRINGS["invalid_template"].format(error=e), {"to": phone_number})
+    response = get_graph_client().send_message(payload)
+    if response.status_code != 200:
+        raise JobFailed(STRINGS["send_failed"], {"to": phone_number, "error": response.text})
+    return {"to": phone_number, "message_id": sent_message_id(response)}
+
+def send_media_task(phone_number, media_type, media_id, caption=None, filename=None):
+    response = send_whatsapp_media(phone_number, media_type, media_id, caption, filename)
+    if response.status_code != 200:
+        raise JobFailed(STRINGS["send_failed"], {"to": phone_number, "error": response.text})
+    return {"to": phone_number, "message_id": sent_message_id(response)}
+
+# Reply to a message that came in through the webhook
+def reply_to_message_task(phone_number, question, message_id=None):
+    return send_ai_message_task(phone_number, question, stream=wants_stream())
+
+def summarize_conversation_task(phone_number):
+    conversations = get_conversation_store()
+    if conversations is not None:
+        conversations.compact(phone_number, summarize_conversation)
+    return {"to": phone_number}
+
+send_queue = get_send_queue()
+send_queue.register("send_message", send_message_task)
+send_queue.register("send_ai_message", send_ai_message_task)
+send_queue.register("send_template", send_template_task)
+send_queue.register("send_media", send_media_task)
+send_queue.register("reply_to_message", reply_to_message_task)
+send_queue.register("summarize_conversation", summarize_conversation_task)
+
+# Non-urgent AI messages in bulk through the OpenAI Batch API
+ai_batches = get_ai_batch_runner()
+ai_batches.bind(client, ai_messages, send_whatsapp_message)
+
+# Sends at a later time; due sends go through the send queue
+scheduler = get_scheduler()
+scheduler.bind(send_queue.submit)
+
+# Put a job on the send queue and answer 202 right away
+def enqueue_job(task, **kwargs):
+    try:
+        job = send_queue.submit(task, **kwargs)
+    except QueueFull:
+        return jsonify({"status": "error", "message": STRINGS["send_queue_full"]}), 503
+    return jsonify({"status": "queued", "job_id": job.id}), 202
+
+# Passes a streamed response body through and stores it under the
+# Idempotency-Key once the stream has ended; a stream cut short frees the
+# key instead
+def record_stream(chunks, idempotency, key, fingerprint, status, mimetype):
+    body = []
+    try:
+        for chunk in chunks:
+            body.append(chunk if isinstance(chunk, str) else chunk.decode("utf-8"))
+            yield chunk
+    except BaseException:
+        idempotency.release(key)
+        raise
+    idempotency.complete(key, {"fingerprint": fingerprint, "status": status, "body": "".join(body),
+                               "mimetype": mimetype})
+
+# SHA-256 of the request body for Idempotency-Key checks. Multipart uploads
+# are fingerprinted from their form fields and the digest of each file,
+# hashed in chunks from Flask's spooled copy, so a large file is never read
+# into memory.
+def request_fingerprint():
+    if request.mimetype != 'multipart/form-data':
+        return hashlib.sha256(request.get_data()).hexdigest()
+    digest = hashlib.sha256()
+    for name, value in request.form.items(multi=True):
+        digest.update(json.dumps(["field", name, value]).encode("utf-8"))
+    for name, upload in request.files.items(multi=True):
+        digest.update(json.dumps(["file", name, upload.filename, upload.mimetype,
+                                  file_sha256(upload.stream)]).encode("utf-8"))
+    return digest.hexdigest()
+
+# For send routes: a retry that carries the same Idempotency-Key header gets
+# the stored response of the first request instead of sending the message
+# again. Streamed responses (NDJSON results) still stream, and are stored
+# once they have been sent in full.
+def idempotent(route):
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        idempotency = get_idempotency_store()
+        key = request.headers.get('Idempotency-Key')
+        if idempotency is None or not key:
+            return route(*args, **kwargs)
+        
+        key = f"{request.path}:{key}"
+        fingerprint = request_fingerprint()
+        record = idempotency.claim(key, fingerprint=fingerprint)
+        if record is not None:
+            if record["state"] == PENDING:
+                return jsonify({"status": "error", "message": STRINGS["idempotency_in_progress"]}), 409
+            if record["fingerprint"] != fingerprint:
+                return jsonify({"status": "error", "message": STRINGS["idempotency_mismatch"]}), 422
+            response = Response(record["body"], status=record["status"],
+                                mimetype=record.get("mimetype", "application/json"))
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        
+        try:
+            response = app.make_response(route(*args, **kwargs))
+        except Exception:
+            idempotency.release(key)
+            raise
+        # Rate limited or failed sends may be retried with the same key
+        if response.status_code == 429 or response.status_code >= 500:
+            idempotency.release(key)
+        elif response.is_streamed:
+            response.response = record_stream(response.response, idempotency, key, fingerprint,
+                                              response.status_code, response.mimetype)
+        else:
+            idempotency.complete(key, {
+                "fingerprint": fingerprint,
+                "status": response.status_code,
+                "body": response.get_data(as_text=True),
+                "mimetype": response.mimetype
+            })
+        return response
+    return wrapper
+
+# Test message from browser (GET request)
+@app.route('/testmessage', methods=['GET'])
+def test_send_message():
+    recipient = request.args.get('to', '')
+    message = request.args.get('message', STRINGS["test_message"])
+    
+    if not recipient:
+        return jsonify({
+            "error": STRINGS["testmessage_phone_missing"]
+        }), 400
+    
+    # Async mode: hand the work to the send queue
+    if wants_async(request.args.get('async')):
+        return enqueue_job("send_message", phone_number=recipient, message=message)
+    
+    # Try to send the message
+    result = send_whatsapp_message(recipient, message)
+    
+    return jsonify({
+        "success": result,
+        "to": recipient,
+        "message": message
+    })
+
+# Send AI response (GET request)
+@app.route('/askAI', methods=['GET'])
+def ask_ai():
+    recipient = request.args.get('to', '')
+    question = request.args.get('question', '')
+    
+    if not recipient:
+        return jsonify({
+            "error": STRINGS["askai_phone_missing"]
+        }), 400
+    
+    if not question:
+        return jsonify({
+            "error": STRINGS["askai_question_missing"]
+        }), 400
+    
+    try:
+        ai_options = get_model_router().parse_overrides(request.args)
+    except ValueError as e:
+        return jsonify({"error": STRINGS["invalid_ai_options"].format(error=e)}), 400
+    
+    # Async mode: hand the work to the send queue
+    if wants_async(request.args.get('async')):
+        return enqueue_job("send_ai_message", phone_number=recipient, question=question,
+                           stream=wants_stream(request.args.get('stream')), ai_options=ai_options)
+    
+    # Streaming: each chunk is sent as soon as it has been generated
+    if wants_stream(request.args.get('stream')):
+        ai_response, result = send_ai_response_streamed(recipient, question, ai_options)
+    else:
+        # Generate AI response
+        ai_response = generate_ai_response(question, recipient, ai_options)
+        
+        # Send response
+        result = send_whatsapp_message(recipient, ai_response)
+    
+    return jsonify({
+        "success": result,
+        "to": recipient,
+        "question": question,
+        "ai_response": ai_response
+    })
+
+# Route for sending messages (POST request)
+@app.route('/send_message', methods=['POST'])
+@idempotent
+def send_message_route():
+    try:
+        data = request.json
+        phone_number = data.get('phone_number')
+        message = data.get('message')
+        
+        if not phone_number or not message:
+            return jsonify({"status": "error", "message": STRINGS["phone_and_message_required"]}), 400
+        
+        # Ensure the number is in the correct format
+        if not phone_number.startswith('+'):
+            phone_number = '+' + phone_number
+            
+        # Async mode: hand the work to the send queue
+        if wants_async(data.get('async')):
+            return enqueue_job("send_message", phone_number=phone_number, message=message)
+            
+        # Send message; a durable send queue writes it down first, so a send cut
+        # short by a crash is done again
+        with send_queue.journal("send_message", phone_number=phone_number, message=message) as job:
+            result = send_whatsapp_message(phone_number, message)
+            if not result:
+                send_queue.fail_journal(job, STRINGS["send_failed"])
+        
+        if result:
+            return jsonify({"status": "success", "message": STRINGS["message_sent"]}), 200
+        else:
+            return jsonify({"status": "error", "message": STRINGS["send_failed"]}), 500
+    
+    except (RateLimited, CircuitOpen):
+        raise
+    except Exception as e:
+        logging.error("Error sending message: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# Route for sending AI messages (POST request)
+@app.route('/send_ai_message', methods=['POST'])
+@idempotent
+def send_ai_message_route():
+    try:
+        data = request.json
+        phone_number = data.get('phone_number')
+        question = data.get('question')
+        
+        if not phone_number or not question:
+            return jsonify({"status": "error", "message": STRINGS["phone_and_question_required"]}), 400
+        
+        # Ensure the number is in the correct format
+        if not phone_number.startswith('+'):
+            phone_number = '+' + phone_number
+        
+        try:
+            ai_options = get_model_router().parse_overrides(data)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": STRINGS["invalid_ai_options"].format(error=e)}), 400
+        
+        # Async mode: hand the work to the send queue
+        if wants_async(data.get('async')):
+            return enqueue_job("send_ai_message", phone_number=phone_number, question=question,
+                               stream=wants_stream(data.get('stream')), ai_options=ai_options)
+        
+        # Journaled like /send_message
+        with send_queue.journal("send_ai_message", phone_number=phone_number, question=question,
+                                stream=wants_stream(data.get('stream')), ai_options=ai_options) as job:
+            # Streaming: each chunk is sent as soon as it has been generated
+            if wants_stream(data.get('stream')):
+                ai_response, result = send_ai_response_streamed(phone_number, question, ai_options)
+            else:
+                # Generate AI response
+                ai_response = generate_ai_response(question, phone_number, ai_options)
+            
+                # Send message
+                result = send_whatsapp_message(phone_number, ai_response)
+            if not result:
+                send_queue.fail_journal(job, STRINGS["send_failed"])
+        
+        if result:
+            return jsonify({
+                "status": "success", 
+                "message": STRINGS["ai_response_sent"],
+                "ai_response": ai_response
+            }), 200
+        else:
+            return jsonify({"status": "error", "message": STRINGS["send_failed"]}), 500
+    
+    except (RateLimited, CircuitOpen):
+        raise
+    except Exception as e:
+        logging.error("Error sending AI message: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# Route for sending template messages
+@app.route('/send_template', methods=['POST'])
+@idempotent
+def send_template_route():
+    try:
+        data = request.json
+        phone_number = data.get('phone_number')
+        template_name = data.get('template_name')
+        language_code = data.get('language_code', 'en_US')
+        
+        if not phone_number or not template_name:
+            return jsonify({"status": "error", "message": STRINGS["phone_and_template_required"]}), 400
+        
+        # Ensure the number is in the correct format
+        if not phone_number.startswith('+'):
+            phone_number = '+' + phone_number
+        
+        # Checked against the template definition before anything is sent
+        try:
+            payload = templates.render(phone_number, template_name, language_code, data.get('parameters'),
+                                       data.get('header'), data.get('buttons'))
+        except TemplateError as e:
+            return jsonify({"status": "error", "message": STRINGS["invalid_template"].format(error=e)}), 400
+        
+        response = get_graph_client().send_message(payload)
+        
+        if response.status_code == 200:
+            return jsonify({"status": "success", "response": response.json()}), 200
+        else:
+            return jsonify({"status": "error", "message": response.text}), response.status_code
+    
+    except (RateLimited, CircuitOpen):
+        raise
+    except Exception as e:
+        logging.error("Error sending template message: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# Route for image, document and audio messages. The file comes as a
+# multipart upload ("file"), as a name under MEDIA_DIR ("media_path") or as
+# the "media_id" of an earlier upload; each distinct file is uploaded to the
+# Graph API once. With "recipients" the results stream back as NDJSON.
+@app.route('/send_media', methods=['POST'])
+@idempotent
+def send_media_route():
+    try:
+        upload = request.files.get('file')
+        data = request.form if upload is not None else (request.get_json(silent=True) or {})
+        phone_number = data.get('phone_number')
+        recipients = request.form.getlist('recipients') if upload is not None else data.get('recipients')
+        media_type = data.get('type')
+        media_path = data.get('media_path')
+        caption = data.get('caption')
+        filename = data.get('filename') or (upload.filename if upload is not None else None)
+        
+        if not (phone_number or recipients) or not media_type or not (upload or media_path or data.get('media_id')):
+            return jsonify({"status": "error", "message": STRINGS["phone_and_media_required"]}), 400
+        
+        if recipients and not isinstance(recipients, list):
+            return jsonify({"status": "error", "message": STRINGS["recipients_required"]}), 400
+        
+        limit = max_recipients()
+        if recipients and len(recipients) > limit:
+            return jsonify({"status": "error", "message": STRINGS["too_many_recipients"].format(limit=limit)}), 400
+        
+        # Browsers and curl label files they do not know as octet-stream;
+        # the file name tells more then
+        mime_type = data.get('mime_type')
+        if not mime_type and upload is not None and upload.mimetype != 'application/octet-stream':
+            mime_type = upload.mimetype
+        
+        media = get_media_store()
+        
+        def resolve():
+            if data.get('media_id'):
+                return data['media_id'], None, False
+            return media.media_id(media_type, path=media_path, fileobj=upload.stream if upload else None,
+                                  filename=filename, mime_type=mime_type)
+        
+        try:
+            media_limits(media_type)
+            media_id, key, cached = resolve()
+        except MediaError as e:
+            return jsonify({"status": "error", "message": STRINGS["invalid_media"].format(error=e)}), 400
+        except MediaUploadFailed as e:
+            return jsonify({"status": "error", "message": str(e)}), e.status_code
+        
+        if media_path and not filename:
+            filename = os.path.basename(media_path)
+        
+        # Many recipients: the file is uploaded once above, every send only
+        # references its id
+        if recipients:
+            items = (
+                (number, media_payload(number, media_type, media_id, caption, filename), None)
+                for number in map(normalize_phone, recipients)
+            )
+            results = stream_bulk_results(items, bulk_concurrency(data.get('concurrency')))
+            return Response(stream_with_context(results), mimetype="application/x-ndjson")
+        
+        phone_number = normalize_phone(phone_number)
+        
+        # Async mode: hand the send to the send queue, the upload is done
+        if wants_async(data.get('async')):
+            return enqueue_job("send_media", phone_number=phone_number, media_type=media_type, media_id=media_id,
+                               caption=caption, filename=filename)
+        
+        # Journaled like /send_message
+        with send_queue.journal("send_media", phone_number=phone_number, media_type=media_type, media_id=media_id,
+                                caption=caption, filename=filename) as job:
+            response = send_whatsapp_media(phone_number, media_type, media_id, caption, filename)
+            # The cached media id is gone before its time: upload once more
+            if cached and is_media_id_error(response):
+                media.forget(key)
+                media_id, key, cached = resolve()
+                response = send_whatsapp_media(phone_number, media_type, media_id, caption, filename)
+            if response.status_code != 200:
+                send_queue.fail_journal(job, response.text)
+        
+        if response.status_code == 200:
+            return jsonify({"status": "success", "message": STRINGS["message_sent"], "media_id": media_id}), 200
+        else:
+            return jsonify({"status": "error", "message": response.text}), response.status_code
+    
+    except (RateLimited, CircuitOpen):
+        raise
+    except Exception as e:
+        logging.error("Error sending media message: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# Route for bulk/broadcast sends, per-recipient results are streamed back as NDJSON
+@app.route('/send_bulk', methods=['POST'])
+@idempotent
+def send_bulk_route():
+    data = request.json or {}
+    recipients = data.get('recipients')
+    
+    if not recipients or not isinstance(recipients, list):
+        return jsonify({"status": "error", "message": STRINGS["recipients_required"]}), 400
+    
+    limit = max_recipients()
+    if len(recipients) > limit:
+        return jsonify({"status": "error", "message": STRINGS["too_many_recipients"].format(limit=limit)}), 400
+    
+    # An unknown template fails the whole request; parameters that do not
+    # fit fail only their recipient's line
+    if data.get('template_name'):
+        try:
+            templates.get(data['template_name'], data.get('language_code', 'en_US'))
+        except TemplateError as e:
+            return jsonify({"status": "error", "message": STRINGS["invalid_template"].format(error=e)}), 400
+    
+    results = stream_bulk_results(build_bulk_items(data), bulk_concurrency(data.get('concurrency')))
+    return Response(stream_with_context(results), mimetype="application/x-ndjson")
+
+# Route for AI messages to many recipients through the OpenAI Batch API: half
+# the price, but answered within hours, so for campaigns that are not urgent
+@app.route('/send_ai_batch', methods=['POST'])
+@idempotent
+def send_ai_batch_route():
+    data = request.json or {}
+    
+    try:
+        items = build_batch_items(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    try:
+        ai_options = get_model_router().parse_overrides(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": STRINGS["invalid_ai_options"].format(error=e)}), 400
+    
+    if not items:
+        return jsonify({"status": "error", "message": STRINGS["recipients_required"]}), 400
+    
+    limit = ai_batches.max_recipients
+    if len(items) > limit:
+        return jsonify({"status": "error", "message": STRINGS["too_many_recipients"].format(limit=limit)}), 400
+    
+    batch_id = ai_batches.create(items, ai_options)
+    return jsonify({"status": "accepted", "batch_id": batch_id}), 202
+
+# Progress of an AI batch
+@app.route('/ai_batches/<batch_id>', methods=['GET'])
+def ai_batch_status(batch_id):
+    batch = ai_batches.get(batch_id)
+    if batch is None:
+        return jsonify({"status": "error", "message": STRINGS["batch_not_found"]}), 404
+    return jsonify(batch)
+
+# Route for sending a text, AI answer or template later, to one number or to
+# many: at a time of day ("send_at": "09:00", in "timezone"), at an ISO 8601
+# time, or after a delay ("delay": "23h")
+@app.route('/schedule', methods=['POST'])
+@idempotent
+def schedule_route():
+    data = request.json or {}
+    recipients = [data['phone_number']] if data.get('phone_number') else data.get('recipients')
+    
+    if not recipients or not isinstance(recipients, list):
+        return jsonify({"status": "error", "message": STRINGS["recipients_required"]}), 400
+    
+    limit = scheduler.max_recipients
+    if len(recipients) > limit:
+        return jsonify({"status": "error", "message": STRINGS["too_many_recipients"].format(limit=limit)}), 400
+    
+    if data.get('template_name'):
+        task = "send_template"
+        content = {"template_name": data['template_name'], "language_code": data.get('language_code', 'en_US'),
+                   "parameters": data.get('parameters'), "header": data.get('header'), "buttons": data.get('buttons')}
+        # A send that cannot work is refused now, not when it is due
+        try:
+            templates.prepare(**content)
+        except TemplateError as e:
+            return jsonify({"status": "error", "message": STRINGS["invalid_template"].format(error=e)}), 400
+    elif data.get('message'):
+        task, content = "send_message", {"message": data['message']}
+    elif data.get('question'):
+        try:
+            ai_options = get_model_router().parse_overrides(data)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": STRINGS["invalid_ai_options"].format(error=e)}), 400
+        task = "send_ai_message"
+        content = {"question": data['question'], "stream": wants_stream(data.get('stream')), "ai_options": ai_options}
+    else:
+        return jsonify({"status": "error", "message": STRINGS["schedule_content_required"]}), 400
+    
+    try:
+        due_at, jitter = scheduler.parse(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": STRINGS["invalid_schedule"].format(error=e)}), 400
+    
+    scheduled = scheduler.schedule(
+        [(task, {"phone_number": normalize_phone(number), **content}) for number in recipients], due_at, jitter
+    )
+    if data.get('phone_number'):
+        schedule_id, due_at = scheduled[0]
+        return jsonify({"status": "scheduled", "schedule_id": schedule_id, "due_at": due_at}), 202
+    return jsonify({
+        "status": "scheduled",
+        "schedules": [{"schedule_id": schedule_id, "due_at": due_at} for schedule_id, due_at in scheduled]
+    }), 202
+
+# State of a scheduled send; DELETE cancels it unless it has gone out
+@app.route('/schedule/<schedule_id>', methods=['GET', 'DELETE'])
+def schedule_status(schedule_id):
+    if request.method == 'DELETE':
+        scheduled = scheduler.cancel(schedule_id)
+    else:
+        scheduled = scheduler.get(schedule_id)
+    if scheduled is None:
+        return jsonify({"status": "error", "message": STRINGS["schedule_not_found"]}), 404
+    if request.method == 'DELETE' and scheduled["status"] != "cancelled":
+        return jsonify(scheduled), 409
+    return jsonify(scheduled)
+
+# Webhook verification handshake, called by Meta when the webhook is configured
+@app.route('/webhook', methods=['GET'])
+def webhook_verify():
+    challenge = verify_subscription(request.args, os.getenv("WHATSAPP_VERIFY_TOKEN"))
+    if challenge is None:
+        return "Forbidden", 403
+    return Response(challenge, mimetype="text/plain")
+
+# Incoming messages. Meta expects a fast 200 and redelivers slow or failed
+# webhooks, so replies are generated by the send queue workers.
+@app.route('/webhook', methods=['POST'])
+def webhook():
+    # Only Meta knows the app secret, so the signature proves where the request came from
+    app_secret = os.getenv("WHATSAPP_APP_SECRET")
+    if not app_secret:
+        logging.error("WHATSAPP_APP_SECRET is not set, rejecting webhook")
+    body = request.get_data()
+    if not verify_signature(app_secret, body, request.headers.get("X-Hub-Signature-256")):
+        return jsonify({"status": "error", "message": STRINGS["invalid_signature"]}), 403
+    
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return jsonify({"status": "error", "message": STRINGS["invalid_json"]}), 400
+    
+    idempotency = get_idempotency_store()
+    for message in iter_messages(payload):
+        WEBHOOK_MESSAGES.inc(type=message.get("type", "unknown"))
+        text = message_text(message)
+        if not text or not message.get("from"):
+            continue
+        
+        # Meta redelivered a message that has already been queued
+        message_id = message.get("id")
+        key = f"wamid:{message_id}" if idempotency is not None and message_id else None
+        if key is not None and idempotency.claim(key, scope="webhook") is not None:
+            continue
+        try:
+            job = send_queue.submit("reply_to_message", phone_number=message["from"], question=text,
+                                    message_id=message_id)
+        except QueueFull:
+            if key is not None:
+                idempotency.release(key)
+            # Answering with an error makes Meta deliver the webhook again later
+            return jsonify({"status": "error", "message": STRINGS["send_queue_full"]}), 503
+        if key is not None:
+            idempotency.complete(key, {"job_id": job.id})
+    
+    return jsonify({"status": "ok"}), 200
+
+# Status of a queued job
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = send_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": STRINGS["job_not_found"]}), 404
+    return jsonify(job.to_dict())
+
+# Latency and status of every request, for /metrics. For streamed
+# responses this is the time until the response starts.
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    observe_request(route, request.method, response.status_code, time.perf_counter() - g.request_start)
+    return response
+
+# Metrics in Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+# Circuit state per upstream and the send queue backlog. Answers 200 also
+# when degraded, since the fallbacks keep serving.
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({**health(), "send_queue": {"depth": send_queue.depth(), "deferred": send_queue.deferred()}})
+
+# Sends that would have to wait too long for a rate limit slot
+@app.errorhandler(RateLimited)
+def rate_limited(e):
+    response = jsonify({"status": "error", "message": STRINGS["rate_limited"]})
+    response.headers["Retry-After"] = str(math.ceil(e.retry_after))
+    return response, 429
+
+# Upstream down: fail fast instead of tying up a worker until it times out
+@app.errorhandler(CircuitOpen)
+def circuit_open(e):
+    response = jsonify({"status": "error", "message": STRINGS["service_unavailable"]})
+    response.headers["Retry-After"] = str(math.ceil(e.retry_after))
+    return response, 503
+
+# Endpoints on the home page: method, path and the locale key of the
+# description (the example is under the key + "_example")
+INDEX_ENDPOINTS = (
+    ("GET", "/testmessage", "index_testmessage"),
+    ("GET", "/askAI", "index_askai"),
+    ("POST", "/send_message", "index_send_message"),
+    ("POST", "/send_ai_message", "index_send_ai_message"),
+    ("POST", "/send_template", "index_send_template"),
+    ("POST", "/send_media", "index_send_media"),
+    ("POST", "/send_bulk", "index_send_bulk"),
+    ("POST", "/send_ai_batch", "index_send_ai_batch"),
+    ("POST", "/schedule", "index_schedule"),
+    ("GET/POST", "/webhook", "index_webhook"),
+    ("GET", "/jobs/&lt;job_id&gt;", "index_jobs"),
+)
+
+INDEX_ENDPOINT = """
+                <div class="endpoint">
+                    <h3><span class="method">{method}</span> {path}</h3>
+                    <p>{description}</p>
+                    <p>{example}</p>
+                </div>
+"""
+
+INDEX_PAGE = """
+    <html>
+        <head>
+            <title>WhatsApp API</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; line-height: 1.6; }}
+                .container {{ max-width: 800px; margin: 0 auto; }}
+                h1 {{ color: #4CAF50; }}
+                .endpoint {{ background: #f5f5f5; padding: 15px; margin-bottom: 20px; border-radius: 5px; }}
+                .method {{ font-weight: bold; color: #2196F3; }}
+                code {{ background: #e0e0e0; padding: 2px 5px; border-radius: 3px; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>WhatsApp API</h1>
+                <p>{intro}</p>
+                {endpoints}
+            </div>
+        </body>
+    </html>
+    """
+
+# Rendered once; the page does not change while the process runs
+INDEX_HTML = INDEX_PAGE.format(
+    intro=STRINGS["index_intro"],
+    endpoints="".join(
+        INDEX_ENDPOINT.format(method=method, path=path, description=STRINGS[key], example=STRINGS[f"{key}_example"])
+        for method, path, key in INDEX_ENDPOINTS
+    ),
+)
+
+# Home page
+@app.route('/')
+def index():
+    return INDEX_HTML
+
+# ASGI mode: the send routes as async handlers on the async OpenAI client and
+# a pooled httpx client, so one process can keep thousands of upstream calls
+# in flight. Serve with: uvicorn main_en:asgi_app
+async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=OPENAI_TIMEOUT)
+asgi_app = AsgiApp()
+
+# Async variant of generate_ai_response
+async def generate_ai_response_async(message_text, phone_number=None, ai_options=None):
+    start = time.perf_counter()
+    history = conversation_messages(phone_number)
+    route = get_model_router().choose(message_text, bool(history), ai_options)
+    use_cache = not history and not ai_options
+    if use_cache:
+        # The caches may call the embeddings API, so they run off the event loop
+        cached, question_vector = await asyncio.to_thread(cached_ai_response, message_text, route.model)
+        if cached is not None:
+            remember_ai_response(phone_number, message_text, cached)
+            AI_RESPONSE_LATENCY.observe(time.perf_counter() - start, source="cache")
+            return cached
+    else:
+        question_vector = None
+    
+    # Shares one completion between identical concurrent questions, like generate_ai_response
+    async def complete():
+        response = await ai_retry.acall(
+            async_client.chat.completions.create,
+            messages=ai_messages(message_text, history),
+            **route.params(),
+        )
+        ai_response = response.choices[0].message.content
+        log_success(
+            "AI response generated",
+            completion_id=response.id,
+            route=route.name,
+            chars=len(ai_response or ""),
+            ms=round((time.perf_counter() - start) * 1000, 1),
+            body=ai_response,
+        )
+        record_token_usage(route.model, response.usage)
+        get_model_router().record(route, time.perf_counter() - start, response.usage)
+        if use_cache:
+            store_ai_response(message_text, question_vector, ai_response, route.model)
+        return ai_response
+    
+    try:
+        key = None if history else flight_key(route.params(), SYSTEM_PROMPT, message_text)
+        ai_response, shared = await get_async_single_flight().do(key, complete)
+        remember_ai_response(phone_number, message_text, ai_response)
+        AI_RESPONSE_LATENCY.observe(time.perf_counter() - start, source="coalesced" if shared else "openai")
+        return ai_response
+    except CircuitOpen:
+        ai_response = await asyncio.to_thread(degraded_ai_response, message_text, phone_number, route.model, use_cache)
+        AI_RESPONSE_LATENCY.observe(time.perf_counter() - start, source="degraded")
+        return ai_response
+    except Exception as e:
+        logging.error("Error in AI response: %s", e)
+        AI_RESPONSE_LATENCY.observe(time.perf_counter() - start, source="error")
+        return AI_FALLBACK_REPLY
+
+# Async variant of send_whatsapp_message
+async def send_whatsapp_message_async(phone_number, message):
+    start = time.perf_counter()
+    response = await get_async_graph_client().send_message(text_payload(phone_number, message))
+    elapsed = time.perf_counter() - start
+    SEND_LATENCY.observe(elapsed, result="sent" if response.status_code == 200 else "failed")
+    
+    if response.status_code == 200:
+        log_success(
+            "Message sent successfully",
+            message_id=lambda: sent_message_id(response),
+            ms=round(elapsed * 1000, 1),
+            body=lambda: response.text,
+        )
+        return True
+    else:
+        logging.error("Error sending message: %s", response.text)
+        return False
+
+# enqueue_job() for the ASGI routes; a durable queue writes the job to disk,
+# so the submit runs in a thread
+async def enqueue_job_async(task, **kwargs):
+    try:
+        job = await asyncio.to_thread(send_queue.submit, task, **kwargs)
+    except QueueFull:
+        return json_response({"status": "error", "message": STRINGS["send_queue_full"]}, 503)
+    return json_response({"status": "queued", "job_id": job.id}, 202)
+
+# idempotent() for the ASGI routes, sharing the same store. Store calls may
+# go over the network (Redis), so they run in a thread.
+def idempotent_async(route):
+    @functools.wraps(route)
+    async def wrapper(req, **kwargs):
+        idempotency = get_idempotency_store()
+        key = req.headers.get('idempotency-key')
+        if idempotency is None or not key:
+            return await route(req, **kwargs)
+        
+        key = f"{req.path}:{key}"
+        fingerprint = hashlib.sha256(req.body).hexdigest()
+        record = await asyncio.to_thread(idempotency.claim, key, fingerprint=fingerprint)
+        if record is not None:
+            if record["state"] == PENDING:
+                return json_response({"status": "error", "message": STRINGS["idempotency_in_progress"]}, 409)
+            if record["fingerprint"] != fingerprint:
+                return json_response({"status": "error", "message": STRINGS["idempotency_mismatch"]}, 422)
+            response = text_response(record["body"], record["status"],
+                                     content_type=record.get("mimetype", "application/json"))
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        
+        try:
+            response = await route(req, **kwargs)
+        except BaseException:
+            # Also when the client went away and the handler was cancelled
+            idempotency.release(key)
+            raise
+        # Rate limited or failed sends may be retried with the same key
+        if response.status == 429 or response.status >= 500:
+            await asyncio.to_thread(idempotency.release, key)
+        else:
+            await asyncio.to_thread(idempotency.complete, key, {
+                "fingerprint": fingerprint,
+                "status": response.status,
+                "body": response.body.decode("utf-8"),
+                "mimetype": response.headers["Content-Type"].split(";")[0]
+            })
+        return response
+    return wrapper
+
+@asgi_app.route('/testmessage', methods=['GET'])
+async def test_send_message_async(req):
+    recipient = req.args.get('to', '')
+    message = req.args.get('message', STRINGS["test_message"])
+    
+    if not recipient:
+        return json_response({
+            "error": STRINGS["testmessage_phone_missing"]
+        }, 400)
+    
+    if wants_async(req.args.get('async')):
+        return await enqueue_job_async("send_message", phone_number=recipient, message=message)
+    
+    result = await send_whatsapp_message_async(recipient, message)
+    
+    return json_response({
+        "success": result,
+        "to": recipient,
+        "message": message
+    })
+
+@asgi_app.route('/askAI', methods=['GET'])
+async def ask_ai_async(req):
+    recipient = req.args.get('to', '')
+    question = req.args.get('question', '')
+    
+    if not recipient:
+        return json_response({
+            "error": STRINGS["askai_phone_missing"]
+        }, 400)
+    
+    if not question:
+        return json_response({
+            "error": STRINGS["askai_question_missing"]
+        }, 400)
+    
+    try:
+        ai_options = get_model_router().parse_overrides(req.args)
+    except ValueError as e:
+        return json_response({"error": STRINGS["invalid_ai_options"].format(error=e)}, 400)
+    
+    if wants_async(req.args.get('async')):
+        return await enqueue_job_async("send_ai_message", phone_number=recipient, question=question,
+                                       stream=wants_stream(req.args.get('stream')), ai_options=ai_options)
+    
+    # Streaming uses the blocking OpenAI stream and sends each chunk as it is
+    # ready, so it holds a thread for the whole answer
+    if wants_stream(req.args.get('stream')):
+        ai_response, result = await asyncio.to_thread(send_ai_response_streamed, recipient, question, ai_options)
+    else:
+        ai_response = await generate_ai_response_async(question, recipient, ai_options)
+        result = await send_whatsapp_message_async(recipient, ai_response)
+    
+    return json_response({
+        "success": result,
+        "to": recipient,
+        "question": question,
+        "ai_response": ai_response
+    })
+
+@asgi_app.route('/send_message', methods=['POST'])
+@idempotent_async
+async def send_message_async(req):
+    data = req.json() or {}
+    phone_number = data.get('phone_number')
+    message = data.get('message')
+    
+    if not phone_number or not message:
+        return json_response({"status": "error", "message": STRINGS["phone_and_message_required"]}, 400)
+    
+    if not phone_number.startswith('+'):
+        phone_number = '+' + phone_number
+    
+    if wants_async(data.get('async')):
+        return await enqueue_job_async("send_message", phone_number=phone_number, message=message)
+    
+    async with send_queue.ajournal("send_message", phone_number=phone_number, message=message) as job:
+        sent = await send_whatsapp_message_async(phone_number, message)
+        if not sent:
+            send_queue.fail_journal(job, STRINGS["send_failed"])
+    
+    if sent:
+        return json_response({"status": "success", "message": STRINGS["message_sent"]})
+    else:
+        return json_response({"status": "error", "message": STRINGS["send_failed"]}, 500)
+
+@asgi_app.route('/send_ai_message', methods=['POST'])
+@idempotent_async
+async def send_ai_message_async(req):
+    data = req.json() or {}
+    phone_number = data.get('phone_number')
+    question = data.get('question')
+    
+    if not phone_number or not question:
+        return json_response({"status": "error", "message": STRINGS["phone_and_question_required"]}, 400)
+    
+    if not phone_number.startswith('+'):
+        phone_number = '+' + phone_number
+    
+    try:
+        ai_options = get_model_router().parse_overrides(data)
+    except ValueError as e:
+        return json_response({"status": "error", "message": STRINGS["invalid_ai_options"].format(error=e)}, 400)
+    
+    stream = wants_stream(data.get('stream'))
+    if wants_async(data.get('async')):
+        return await enqueue_job_async("send_ai_message", phone_number=phone_number, question=question,
+                                       stream=stream, ai_options=ai_options)
+    
+    async with send_queue.ajournal("send_ai_message", phone_number=phone_number, question=question,
+                                   stream=stream, ai_options=ai_options) as job:
+        # Streaming holds a thread for the whole answer, see ask_ai_async
+        if stream:
+            ai_response, sent = await asyncio.to_thread(send_ai_response_streamed, phone_number, question,
+                                                        ai_options)
+        else:
+            ai_response = await generate_ai_response_async(question, phone_number, ai_options)
+            sent = await send_whatsapp_message_async(phone_number, ai_response)
+        if not sent:
+            send_queue.fail_journal(job, STRINGS["send_failed"])
+    
+    if sent:
+        return json_response({
+            "status": "success",
+            "message": STRINGS["ai_response_sent"],
+            "ai_response": ai_response
+        })
+    else:
+        return json_response({"status": "error", "message": STRINGS["send_failed"]}, 500)
+
+@asgi_app.route('/send_template', methods=['POST'])
+@idempotent_async
+async def send_template_async(req):
+    data = req.json() or {}
+    phone_number = data.get('phone_number')
+    template_name = data.get('template_name')
+    language_code = data.get('language_code', 'en_US')
+    
+    if not phone_number or not template_name:
+        return json_response({"status": "error", "message": STRINGS["phone_and_template_required"]}, 400)
+    
+    if not phone_number.startswith('+'):
+        phone_number = '+' + phone_number
+    
+    try:
+        payload = templates.render(phone_number, template_name, language_code, data.get('parameters'),
+                                   data.get('header'), data.get('buttons'))
+    except TemplateError as e:
+        return json_response({"status": "error", "message": STRINGS["invalid_template"].format(error=e)}, 400)
+    response = await get_async_graph_client().send_message(payload)
+    
+    if response.status_code == 200:
+        return json_response({"status": "success", "response": response.json()})
+    else:
+        return json_response({"status": "error", "message": response.text}, response.status_code)
+
+@asgi_app.route('/jobs/<job_id>', methods=['GET'])
+async def job_status_async(req, job_id):
+    job = await asyncio.to_thread(send_queue.get, job_id)
+    if job is None:
+        return json_response({"status": "error", "message": STRINGS["job_not_found"]}, 404)
+    return json_response(job.to_dict())
+
+# Latency and status of every async request, for /metrics
+@asgi_app.after_request
+def record_request_async(req, response, seconds):
+    observe_request(req.route or "unmatched", req.method, response.status, seconds)
+
+@asgi_app.route('/metrics', methods=['GET'])
+async def metrics_async(req):
+    return text_response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@asgi_app.route('/health', methods=['GET'])
+async def health_async(req):
+    return json_response({**health(), "send_queue": {"depth": send_queue.depth(), "deferred": send_queue.deferred()}})
+
+@asgi_app.errorhandler(RateLimited)
+def rate_limited_async(e):
+    return json_response(
+        {"status": "error", "message": STRINGS["rate_limited"]},
+        429,
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+@asgi_app.errorhandler(CircuitOpen)
+def circuit_open_async(e):
+    return json_response(
+        {"status": "error", "message": STRINGS["service_unavailable"]},
+        503,
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+# Start the send queue right away, so jobs left by a crashed process are sent
+@asgi_app.on_startup
+async def start_background_work():
+    await asyncio.to_thread(start_send_queue)
+    await asyncio.to_thread(start_ai_batches)
+    await asyncio.to_thread(start_scheduler)
+    await asyncio.to_thread(templates.warm_up)
+
+@asgi_app.on_shutdown
+async def close_async_clients():
+    await close_async_graph_client()
+    await async_client.close()
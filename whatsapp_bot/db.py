@@ -0,0 +1,53 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+# Connection in autocommit mode (transactions are explicit) with the WAL
+# journal, so readers in other processes do not block the writer.
+# `synchronous` NORMAL skips an fsync per commit; a power cut can then lose
+# the last commits, never corrupt the file.
+def connect(path, synchronous=None):
+    conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    if synchronous:
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+    return conn
+
+
+# One connection to a SQLite file shared by the threads of a process, one
+# statement or transaction at a time. Used by the scheduler and the AI
+# batch runner, which open it after the fork in each worker.
+class Database:
+    def __init__(self, path, schema, synchronous=None):
+        self.path = path
+        self._conn = connect(path, synchronous)
+        self._conn.executescript(schema)
+        self._lock = threading.Lock()
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def update(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    # The connection for statements that commit together, or not at all if
+    # the block raises
+    @contextmanager
+    def begin(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # Runs (sql, rows) statements in one transaction
+    def transaction(self, statements):
+        with self.begin() as conn:
+            for sql, rows in statements:
+                conn.executemany(sql, rows)
@@ -0,0 +1,328 @@
+import asyncio
+import io
+import os
+import threading
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from whatsapp_bot.config import env_bool, env_float, env_int
+from whatsapp_bot.rate_limit import RateLimiter
+from whatsapp_bot.retry import RetryPolicy
+
+GRAPH_API_BASE_URL = "https://graph.facebook.com"
+GRAPH_API_VERSION = "v22.0"
+
+# Graph error codes that mean "throttled / try again later", even when the
+# HTTP status itself is a 400:
+# https://developers.facebook.com/docs/whatsapp/cloud-api/support/error-codes
+THROTTLING_ERROR_CODES = frozenset({2, 4, 80007, 130429, 131056})
+
+
+def is_throttled(response):
+    if response.status_code < 400:
+        return False
+    try:
+        error = response.json().get("error") or {}
+    except ValueError:
+        return False
+    return error.get("code") in THROTTLING_ERROR_CODES
+
+
+# WhatsApp message id (wamid) of a successful send, None if there is none
+def sent_message_id(response):
+    try:
+        return response.json()["messages"][0]["id"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+# multipart/form-data body that reads the file while it is being sent
+# instead of holding it in memory. requests takes the Content-Length from
+# __len__ and http.client pulls the body through read() in blocks.
+class MultipartStream:
+    def __init__(self, fields, name, filename, fileobj, content_type, size):
+        boundary = uuid.uuid4().hex
+        filename = filename.replace('"', "%22").replace("\r", "").replace("\n", "")
+        head = "".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'
+            for key, value in fields.items()
+        ) + (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+        head = head.encode()
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._parts = [io.BytesIO(head), fileobj, io.BytesIO(tail)]
+        self._length = len(head) + size + len(tail)
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and size != 0:
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+
+# Pooled, keep-alive client for the WhatsApp Cloud (Graph) API.
+#
+# One requests.Session per process keeps TCP/TLS connections to
+# graph.facebook.com open between sends, so only the first message on each
+# pooled connection pays for the handshake.
+class GraphClient:
+    def __init__(
+        self,
+        token,
+        phone_id,
+        base_url=GRAPH_API_BASE_URL,
+        api_version=GRAPH_API_VERSION,
+        pool_connections=4,
+        pool_maxsize=32,
+        pool_block=False,
+        connect_timeout=3.05,
+        read_timeout=10.0,
+        keep_alive=True,
+        rate_limiter=None,
+        retry_policy=None,
+    ):
+        self.phone_id = phone_id
+        self.base_url = base_url.rstrip("/")
+        self.api_version = api_version
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.messages_url = self.url("messages")
+
+        # pool_connections = number of hosts kept in the pool,
+        # pool_maxsize = open connections per host,
+        # pool_block = wait for a free connection instead of opening extras
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}",
+        })
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            token=os.getenv("WHATSAPP_API_TOKEN"),
+            phone_id=os.getenv("WHATSAPP_PHONE_ID"),
+            base_url=os.getenv("GRAPH_API_BASE_URL", GRAPH_API_BASE_URL),
+            api_version=os.getenv("GRAPH_API_VERSION", GRAPH_API_VERSION),
+            pool_connections=env_int("GRAPH_POOL_CONNECTIONS", 4),
+            pool_maxsize=env_int("GRAPH_POOL_MAXSIZE", 32),
+            pool_block=env_bool("GRAPH_POOL_BLOCK", False),
+            connect_timeout=env_float("GRAPH_CONNECT_TIMEOUT", 3.05),
+            read_timeout=env_float("GRAPH_READ_TIMEOUT", 10.0),
+            keep_alive=env_bool("GRAPH_KEEP_ALIVE", True),
+            rate_limiter=RateLimiter.from_env() if env_bool("RATE_LIMIT_ENABLED", True) else None,
+            # Only connection failures are retried, not read timeouts: a POST
+            # that timed out may already have delivered the message. Timeouts
+            # still count against the circuit breaker.
+            retry_policy=RetryPolicy.from_env(
+                "graph",
+                retry_on=(requests.exceptions.ConnectionError,),
+                retry_if=is_throttled,
+                failure_on=(requests.exceptions.Timeout,),
+            ),
+        )
+
+    def url(self, path, api_version=None):
+        return f"{self.base_url}/{api_version or self.api_version}/{self.phone_id}/{path}"
+
+    # POST a message payload to /{phone_id}/messages. Every attempt first
+    # waits for a rate limiter slot (or raises RateLimited); transient
+    # failures are retried according to the retry policy.
+    def send_message(self, payload, api_version=None):
+        url = self.url("messages", api_version) if api_version else self.messages_url
+        if self.retry_policy is None:
+            return self._post(url, payload)
+        return self.retry_policy.call(self._post, url, payload)
+
+    def _post(self, url, payload):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(payload.get("to"))
+        return self.session.post(url, json=payload, timeout=self.timeout)
+
+    # Upload `size` bytes of a binary file to /{phone_id}/media, streamed
+    # from disk. Uploads are not messages, so they skip the rate limiter;
+    # a retried attempt reads the file again from the start.
+    def upload_media(self, fileobj, filename, mime_type, size):
+        url = self.url("media")
+        if self.retry_policy is None:
+            return self._upload(url, fileobj, filename, mime_type, size)
+        return self.retry_policy.call(self._upload, url, fileobj, filename, mime_type, size)
+
+    def _upload(self, url, fileobj, filename, mime_type, size):
+        fileobj.seek(0)
+        body = MultipartStream(
+            {"messaging_product": "whatsapp", "type": mime_type}, "file", filename, fileobj, mime_type, size
+        )
+        return self.session.post(url, data=body, headers={"Content-Type": body.content_type}, timeout=self.timeout)
+
+    # Approved message templates of a WhatsApp Business Account, following
+    # the paging links of the response
+    def message_templates(self, account_id):
+        url = f"{self.base_url}/{self.api_version}/{account_id}/message_templates"
+        params = {"status": "APPROVED", "fields": "name,language,status,category,components", "limit": 100}
+        while url:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            yield from data.get("data") or []
+            url, params = (data.get("paging") or {}).get("next"), None
+
+    def close(self):
+        self.session.close()
+
+
+
+# httpx is only needed by the ASGI mode, so it is imported on first use
+def _httpx():
+    try:
+        import httpx
+    except ImportError as e:
+        raise RuntimeError("SERVER_MODE=asgi needs the httpx package (pip install httpx)") from e
+    return httpx
+
+
+# asyncio counterpart of GraphClient for the ASGI mode: one pooled
+# httpx.AsyncClient per process, so thousands of sends can wait on the Graph
+# API at once without holding a thread each. Rate limiter waits and retry
+# backoff use asyncio.sleep.
+class AsyncGraphClient:
+    def __init__(
+        self,
+        token,
+        phone_id,
+        base_url=GRAPH_API_BASE_URL,
+        api_version=GRAPH_API_VERSION,
+        pool_maxsize=32,
+        connect_timeout=3.05,
+        read_timeout=10.0,
+        keep_alive=True,
+        rate_limiter=None,
+        retry_policy=None,
+    ):
+        self.phone_id = phone_id
+        self.base_url = base_url.rstrip("/")
+        self.api_version = api_version
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.messages_url = self.url("messages")
+        httpx = _httpx()
+        self.client = httpx.AsyncClient(
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {token}",
+            },
+            limits=httpx.Limits(
+                max_connections=pool_maxsize,
+                max_keepalive_connections=pool_maxsize if keep_alive else 0,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    @classmethod
+    def from_env(cls):
+        httpx = _httpx()
+        return cls(
+            token=os.getenv("WHATSAPP_API_TOKEN"),
+            phone_id=os.getenv("WHATSAPP_PHONE_ID"),
+            base_url=os.getenv("GRAPH_API_BASE_URL", GRAPH_API_BASE_URL),
+            api_version=os.getenv("GRAPH_API_VERSION", GRAPH_API_VERSION),
+            pool_maxsize=env_int("GRAPH_POOL_MAXSIZE", 32),
+            connect_timeout=env_float("GRAPH_CONNECT_TIMEOUT", 3.05),
+            read_timeout=env_float("GRAPH_READ_TIMEOUT", 10.0),
+            keep_alive=env_bool("GRAPH_KEEP_ALIVE", True),
+            rate_limiter=RateLimiter.from_env() if env_bool("RATE_LIMIT_ENABLED", True) else None,
+            # Same rule as the sync client: connection failures only
+            retry_policy=RetryPolicy.from_env(
+                "graph",
+                retry_on=(httpx.ConnectError, httpx.ConnectTimeout),
+                retry_if=is_throttled,
+                failure_on=(httpx.TimeoutException, httpx.NetworkError),
+            ),
+        )
+
+    def url(self, path, api_version=None):
+        return f"{self.base_url}/{api_version or self.api_version}/{self.phone_id}/{path}"
+
+    async def send_message(self, payload, api_version=None):
+        url = self.url("messages", api_version) if api_version else self.messages_url
+        if self.retry_policy is None:
+            return await self._post(url, payload)
+        return await self.retry_policy.acall(self._post, url, payload)
+
+    async def _post(self, url, payload):
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.reserve(payload.get("to"))
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return await self.client.post(url, json=payload)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Process-wide client, created on first use so that it picks up .env values
+# loaded by the app and is never shared across forked worker processes.
+def get_graph_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GraphClient.from_env()
+    return _client
+
+
+_async_client = None
+
+
+# Process-wide AsyncGraphClient. Only used from the event loop thread, so no
+# lock is needed.
+def get_async_graph_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncGraphClient.from_env()
+    return _async_client
+
+
+async def close_async_graph_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def _reset_after_fork():
+    global _client, _client_lock, _async_client
+    _client = None
+    _client_lock = threading.Lock()
+    _async_client = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from whatsapp_bot.config import env_bool, env_float, env_int
+from whatsapp_bot.metrics import counter
+from whatsapp_bot.redis_backend import RedisBackend as SharedRedisBackend
+
+IDEMPOTENCY_REQUESTS = counter(
+    "idempotency_requests_total", "Idempotency key lookups", ["scope", "result"]
+)
+
+PENDING = "pending"
+DONE = "done"
+
+
+# In-process backend: an OrderedDict in insertion order with a TTL per entry
+# and a hard cap on the number of keys, so every operation is O(1).
+class MemoryBackend:
+    def __init__(self, max_entries=100000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    # Store the record unless the key is already taken; returns the existing
+    # record in that case, None otherwise
+    def add(self, key, record, ttl):
+        with self._lock:
+            now = self.clock()
+            existing = self._live(key, now)
+            if existing is not None:
+                return existing
+            self._entries[key] = (now + ttl, record)
+            self._trim(now)
+            return None
+
+    def set(self, key, record, ttl):
+        with self._lock:
+            now = self.clock()
+            self._entries.pop(key, None)
+            self._entries[key] = (now + ttl, record)
+            self._trim(now)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    # Expired keys at the front go first, then the oldest keys over the cap
+    def _trim(self, now):
+        while self._entries:
+            expires_at, _ = next(iter(self._entries.values()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared backend so that retries landing on another worker process are
+# recognised too. add() is a single SET NX.
+class RedisBackend(SharedRedisBackend):
+    def __init__(self, url, prefix="idem:"):
+        super().__init__(url, "IDEMPOTENCY_BACKEND", prefix)
+
+    def add(self, key, record, ttl):
+        if self._redis.set(self.prefix + key, json.dumps(record), nx=True, ex=max(1, int(ttl))):
+            return None
+        value = self.get(key)
+        return json.loads(value) if value is not None else {"state": PENDING}
+
+    def set(self, key, record, ttl):
+        super().set(key, json.dumps(record), ttl)
+
+
+# Records which inbound message ids and client Idempotency-Keys have been
+# handled. A key is claimed while its request runs (kept for `pending_ttl`
+# so a crashed worker cannot block it forever) and then completed with a
+# JSON-friendly record of the outcome, kept for `ttl`.
+class IdempotencyStore:
+    def __init__(self, backend, ttl=86400.0, pending_ttl=300.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("IDEMPOTENCY_BACKEND", "memory") == "redis":
+            backend = RedisBackend(os.getenv("IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+        else:
+            backend = MemoryBackend(max_entries=env_int("IDEMPOTENCY_MAX_ENTRIES", 100000))
+        return cls(
+            backend,
+            ttl=env_float("IDEMPOTENCY_TTL", 86400.0),
+            pending_ttl=env_float("IDEMPOTENCY_PENDING_TTL", 300.0),
+        )
+
+    # None if the key was free and is now ours, otherwise the stored record
+    # ({"state": "pending", ...} while the first request is still running)
+    def claim(self, key, scope="send", fingerprint=None):
+        existing = self.backend.add(key, {"state": PENDING, "fingerprint": fingerprint}, self.pending_ttl)
+        IDEMPOTENCY_REQUESTS.inc(scope=scope, result="new" if existing is None else "duplicate")
+        return existing
+
+    def complete(self, key, record):
+        self.backend.set(key, dict(record, state=DONE), self.ttl)
+
+    # Forget a claim whose request failed, so that a retry runs again
+    def release(self, key):
+        self.backend.delete(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# The shared store, or None when IDEMPOTENCY_ENABLED is off
+def get_idempotency_store():
+    global _store
+    if not env_bool("IDEMPOTENCY_ENABLED", True):
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = IdempotencyStore.from_env()
+    return _store
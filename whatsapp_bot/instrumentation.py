@@ -0,0 +1,31 @@
+from whatsapp_bot.metrics import counter, histogram
+
+# Per-stage latency of the send routes, so a slow /send_ai_message can be
+# pinned on OpenAI, the Graph API or the app itself
+REQUEST_LATENCY = histogram(
+    "http_request_duration_seconds", "Time from request to response, per route", ["route", "method"]
+)
+REQUESTS = counter("http_requests_total", "Handled HTTP requests by route and status", ["route", "method", "status"])
+AI_RESPONSE_LATENCY = histogram(
+    "ai_response_duration_seconds", "Time to produce an AI answer, by where it came from", ["source"]
+)
+SEND_LATENCY = histogram(
+    "whatsapp_send_duration_seconds", "Time to send one WhatsApp message through the Graph API", ["result"]
+)
+TOKENS = counter("openai_tokens_total", "Tokens used by chat completions", ["model", "kind"])
+
+
+# `route` is the route pattern (/jobs/<job_id>), never the raw path, so an
+# unknown URL cannot add a new series
+def observe_request(route, method, status, seconds):
+    REQUEST_LATENCY.observe(seconds, route=route, method=method)
+    REQUESTS.inc(route=route, method=method, status=status)
+
+
+# Token counts from the `usage` of a completion (or of the last chunk of a
+# stream requested with include_usage)
+def record_token_usage(model, usage):
+    if usage is None:
+        return
+    TOKENS.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+    TOKENS.inc(usage.completion_tokens or 0, model=model, kind="completion")
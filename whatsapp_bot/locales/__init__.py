@@ -0,0 +1,46 @@
+import importlib
+import json
+import os
+
+# User-facing strings of the app (replies, error messages, prompts, the home
+# page), one JSON table per locale next to this file. Log messages are not
+# translated.
+LOCALES_DIR = os.path.dirname(__file__)
+DEFAULT_LOCALE = "en"
+
+_locale = None
+
+
+# The strings of a locale, with the English ones for keys it does not have
+def load_strings(name):
+    with open(os.path.join(LOCALES_DIR, f"{DEFAULT_LOCALE}.json"), encoding="utf-8") as f:
+        strings = json.load(f)
+    if name != DEFAULT_LOCALE:
+        with open(os.path.join(LOCALES_DIR, f"{name}.json"), encoding="utf-8") as f:
+            strings.update(json.load(f))
+    return strings
+
+
+# Picks the locale of the app in this process. The core is loaded once per
+# process, so a second, different locale is an error rather than silently
+# ignored.
+def use_locale(name):
+    global _locale
+    if _locale is not None and _locale != name:
+        raise RuntimeError(f"the app is already loaded with locale {_locale!r}, not {name!r}")
+    _locale = name
+
+
+# The locale an entry point picked, else APP_LOCALE, else English
+def current_locale():
+    if _locale is None:
+        use_locale(os.getenv("APP_LOCALE") or DEFAULT_LOCALE)
+    return _locale
+
+
+# The shared app (whatsapp_bot/core.py) in locale `name`. The entry points
+# call this on first attribute access, so importing them is cheap and the
+# core is imported once, when the server looks up the app.
+def load_app(name):
+    use_locale(name)
+    return importlib.import_module("whatsapp_bot.core")
@@ -0,0 +1,144 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from whatsapp_bot.config import env_bool, env_float, env_int
+from whatsapp_bot.metrics import counter
+
+DROPPED = counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_sample_rate = 1.0
+_log_bodies = False
+_queue_handler = None
+_listener = None
+_handlers = ()
+_queue_size = 10000
+
+
+def _extra_fields(record):
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRS}
+
+
+# The plain logging.basicConfig format with the `extra` fields appended as
+# key=value pairs
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(logging.BASIC_FORMAT)
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        fields = _extra_fields(record)
+        if not fields:
+            return message
+        return message + " " + " ".join(f"{key}={value}" for key, value in fields.items())
+
+
+# One JSON object per line: time, level, logger, message and the fields
+# passed with `extra`
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update(_extra_fields(record))
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+# Hands records to a background thread that formats and writes them, so a
+# request thread never waits on stderr. The stdlib QueueHandler formats the
+# message before queueing (to make records picklable); in-process that is
+# not needed, so formatting is left to the listener. A full queue drops the
+# record instead of blocking.
+class _BackgroundHandler(QueueHandler):
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+def _start_listener():
+    global _listener
+    _queue_handler.queue = queue.Queue(_queue_size)
+    _listener = QueueListener(_queue_handler.queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# Replaces logging.basicConfig in the apps. LOG_FORMAT=json writes JSON
+# lines, text keeps the plain format; both go through the background
+# handler unless LOG_QUEUE=false.
+def configure_logging():
+    global _sample_rate, _log_bodies, _queue_handler, _handlers, _queue_size
+    _sample_rate = env_float("LOG_SAMPLE_RATE", 1.0)
+    _log_bodies = env_bool("LOG_BODIES", False)
+    _queue_size = env_int("LOG_QUEUE_SIZE", 10000)
+
+    handler = logging.StreamHandler(sys.stderr)
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter())
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    if not env_bool("LOG_QUEUE", True):
+        root.addHandler(handler)
+        return
+
+    _stop_listener()
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)
+    _handlers = (handler,)
+    _queue_handler = _BackgroundHandler(queue.Queue(_queue_size))
+    root.addHandler(_queue_handler)
+    _start_listener()
+
+
+# Info log for the success path (message sent, answer generated). Only
+# LOG_SAMPLE_RATE of the calls are logged, and `fields` should carry ids,
+# sizes and timings. `body` (message text, API response) is only added with
+# LOG_BODIES=true, as it holds personal data. Field values may be functions,
+# called only when the record is kept.
+def log_success(msg, *args, body=None, **fields):
+    if _sample_rate < 1.0 and random.random() >= _sample_rate:
+        return
+    if not logging.root.isEnabledFor(logging.INFO):
+        return
+    if body is not None and _log_bodies:
+        fields["body"] = body
+    logging.info(msg, *args, extra={key: value() if callable(value) else value for key, value in fields.items()})
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork; pre-fork records stay with
+    # the parent's queue
+    if _listener is not None:
+        _start_listener()
+
+
+atexit.register(_stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
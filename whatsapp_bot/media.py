@@ -0,0 +1,230 @@
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from whatsapp_bot.config import env_float, env_int
+from whatsapp_bot.graph_client import get_graph_client
+from whatsapp_bot.metrics import counter, histogram
+from whatsapp_bot.redis_backend import RedisBackend
+
+MEDIA_UPLOADS = counter("media_uploads_total", "Media uploads to the Graph API by result", ["result"])
+MEDIA_CACHE_REQUESTS = counter("media_cache_requests_total", "Media id cache lookups", ["result"])
+UPLOAD_LATENCY = histogram(
+    "media_upload_duration_seconds", "Time of one media upload to the Graph API",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+MB = 1024 * 1024
+
+# Largest file and accepted MIME types per message type:
+# https://developers.facebook.com/docs/whatsapp/cloud-api/reference/media#supported-media-types
+MEDIA_TYPES = {
+    "image": (5 * MB, frozenset({"image/jpeg", "image/png"})),
+    "audio": (16 * MB, frozenset({"audio/aac", "audio/amr", "audio/mpeg", "audio/mp4", "audio/ogg"})),
+    "document": (100 * MB, frozenset({
+        "text/plain",
+        "application/pdf",
+        "application/msword",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        "application/vnd.ms-excel",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "application/vnd.ms-powerpoint",
+        "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    })),
+}
+
+# Graph error codes of a send whose media id is no longer usable (uploaded
+# media is deleted after 30 days)
+MEDIA_ID_ERROR_CODES = frozenset({100, 131053})
+
+# Read size for hashing
+CHUNK = MB
+
+
+# A media send that cannot be made as asked (unknown type, file missing or
+# too large, ...); the request is at fault, not the Graph API
+class MediaError(ValueError):
+    pass
+
+
+class MediaUploadFailed(Exception):
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Whether a failed send was refused because of its media id
+def is_media_id_error(response):
+    if response.status_code != 400:
+        return False
+    try:
+        error = response.json().get("error") or {}
+    except ValueError:
+        return False
+    return error.get("code") in MEDIA_ID_ERROR_CODES
+
+
+# (largest size, accepted MIME types) of a message type
+def media_limits(media_type):
+    if media_type not in MEDIA_TYPES:
+        raise MediaError(f"unknown media type {media_type!r}, use one of {', '.join(MEDIA_TYPES)}")
+    return MEDIA_TYPES[media_type]
+
+
+def file_sha256(fileobj):
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(CHUNK), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+# In-process backend: content key -> (expires_at, media id), oldest first
+class MemoryBackend:
+    def __init__(self, max_entries=10000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self.clock() + ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# Media ids of uploaded files, keyed by the SHA-256 of the content and the
+# MIME type: the same image or PDF sent to many users is uploaded once, and
+# later sends only reference its id. An id is kept for `ttl` seconds, less
+# than the 30 days the Graph API keeps the media; a send refused because
+# the id is gone anyway drops it (forget()) so the next lookup uploads again.
+#
+# Files are hashed and uploaded in chunks straight from disk, never read
+# into memory whole. Files named by path are hashed once per size and
+# modification time. Concurrent sends of a new file wait for one upload.
+class MediaStore:
+    def __init__(self, backend, ttl=29 * 86400.0, media_dir="media", max_digests=1024, lock_stripes=64):
+        self.backend = backend
+        self.ttl = ttl
+        self.media_dir = os.path.realpath(media_dir)
+        self.max_digests = max_digests
+        self._digests = OrderedDict()
+        self._digests_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("MEDIA_CACHE_BACKEND", "memory") == "redis":
+            # A file is uploaded once for all worker processes
+            backend = RedisBackend(os.getenv("MEDIA_CACHE_REDIS_URL", "redis://localhost:6379/0"), "MEDIA_CACHE_BACKEND")
+        else:
+            backend = MemoryBackend(max_entries=env_int("MEDIA_CACHE_MAX_ENTRIES", 10000))
+        return cls(
+            backend,
+            ttl=env_float("MEDIA_CACHE_TTL", 29 * 86400.0),
+            media_dir=os.getenv("MEDIA_DIR", "media"),
+        )
+
+    # A file under MEDIA_DIR; anything that resolves outside it is refused
+    def resolve(self, name):
+        path = os.path.realpath(os.path.join(self.media_dir, name))
+        if os.path.commonpath((path, self.media_dir)) != self.media_dir or not os.path.isfile(path):
+            raise MediaError(f"no such file in the media directory: {name}")
+        return path
+
+    def _path_digest(self, path, fileobj):
+        stat = os.fstat(fileobj.fileno())
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._digests_lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = file_sha256(fileobj)
+            with self._digests_lock:
+                self._digests[key] = digest
+                while len(self._digests) > self.max_digests:
+                    self._digests.popitem(last=False)
+        return digest
+
+    # (media id, cache key, whether it came from the cache) for a file under
+    # MEDIA_DIR (`path`) or an open binary file (`fileobj`, e.g. a request
+    # upload). Raises MediaError for unusable files and MediaUploadFailed
+    # when the Graph API refuses the upload.
+    def media_id(self, media_type, path=None, fileobj=None, filename=None, mime_type=None):
+        max_size, mime_types = media_limits(media_type)
+        if path is not None:
+            path = self.resolve(path)
+            filename = filename or os.path.basename(path)
+        mime_type = mime_type or mimetypes.guess_type(filename or "")[0]
+        if mime_type not in mime_types:
+            raise MediaError(f"{mime_type or 'unknown'} files cannot be sent as {media_type}")
+
+        if path is not None:
+            with open(path, "rb") as f:
+                return self._media_id(f, filename, mime_type, max_size, path)
+        return self._media_id(fileobj, filename or "upload", mime_type, max_size)
+
+    def _media_id(self, fileobj, filename, mime_type, max_size, path=None):
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        if size == 0 or size > max_size:
+            raise MediaError(f"file size {size} bytes is not within 1..{max_size}")
+        digest = self._path_digest(path, fileobj) if path is not None else file_sha256(fileobj)
+        key = f"media:{digest}:{mime_type}"
+
+        media_id = self.backend.get(key)
+        if media_id is not None:
+            MEDIA_CACHE_REQUESTS.inc(result="hit")
+            return media_id, key, True
+        with self._locks[hash(key) % len(self._locks)]:
+            # Uploaded by the send we waited for
+            media_id = self.backend.get(key)
+            if media_id is not None:
+                MEDIA_CACHE_REQUESTS.inc(result="hit")
+                return media_id, key, True
+            MEDIA_CACHE_REQUESTS.inc(result="miss")
+            start = time.perf_counter()
+            response = get_graph_client().upload_media(fileobj, filename, mime_type, size)
+            UPLOAD_LATENCY.observe(time.perf_counter() - start)
+            if response.status_code != 200:
+                MEDIA_UPLOADS.inc(result="failed")
+                raise MediaUploadFailed(response.text, response.status_code)
+            MEDIA_UPLOADS.inc(result="uploaded")
+            media_id = response.json()["id"]
+            self.backend.set(key, media_id, self.ttl)
+        return media_id, key, False
+
+    def forget(self, key):
+        self.backend.delete(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_media_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MediaStore.from_env()
+    return _store
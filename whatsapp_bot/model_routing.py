@@ -0,0 +1,254 @@
+import json
+import os
+import re
+import threading
+
+from whatsapp_bot.config import env_bool, env_float, env_int
+from whatsapp_bot.metrics import counter, histogram
+
+ROUTE_LATENCY = histogram(
+    "ai_route_duration_seconds", "Completion time by model route (streamed answers excluded)", ["route", "model"]
+)
+ROUTE_REQUESTS = counter("ai_route_requests_total", "Completions requested by model route", ["route", "model"])
+ROUTE_TOKENS = counter("ai_route_tokens_total", "Tokens used by model route", ["route", "model", "kind"])
+ROUTE_COST = counter(
+    "ai_route_cost_usd_total", "Estimated OpenAI cost in USD by model route, from MODEL_PRICES", ["route", "model"]
+)
+
+FAST_MODEL = "gpt-4.1-nano-2025-04-14"
+STANDARD_MODEL = "gpt-4.1-mini-2025-04-14"
+
+# USD per million input / output tokens, for the cost estimate. Override or
+# extend with AI_MODEL_PRICES='{"model": [input, output]}'.
+MODEL_PRICES = {
+    "gpt-4.1-2025-04-14": (2.00, 8.00),
+    "gpt-4.1-mini-2025-04-14": (0.40, 1.60),
+    "gpt-4.1-nano-2025-04-14": (0.10, 0.40),
+}
+
+# Words that mark a question as worth the standard model even when short
+ESCALATE_KEYWORDS = (
+    "why explain compare difference recommend problem error broken complaint refund "
+    "miksi selitä vertaa ero suosittele ongelma virhe rikki reklamaatio hyvitys"
+)
+
+_WORD = re.compile(r"\w+")
+
+
+# Model and generation settings for one class of questions
+class ModelRoute:
+    __slots__ = ("name", "model", "max_tokens", "temperature")
+
+    def __init__(self, name, model, max_tokens=300, temperature=None):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def replace(self, model=None, max_tokens=None, temperature=None):
+        return ModelRoute(
+            self.name,
+            model or self.model,
+            self.max_tokens if max_tokens is None else max_tokens,
+            self.temperature if temperature is None else temperature,
+        )
+
+    # Keyword arguments for chat.completions.create
+    def params(self):
+        params = {"model": self.model, "max_tokens": self.max_tokens}
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        return params
+
+
+# One routing rule: every condition that is set must hold. `keywords`
+# matches whole words, case-insensitively; `history` is whether the number
+# has earlier turns in conversation memory.
+class Rule:
+    def __init__(self, route, min_chars=None, max_chars=None, min_words=None, max_words=None,
+                 keywords=(), pattern=None, history=None):
+        self.route = route
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.min_words = min_words
+        self.max_words = max_words
+        self.keywords = frozenset(word.lower() for word in keywords)
+        self.pattern = re.compile(pattern, re.IGNORECASE) if pattern else None
+        self.history = history
+
+    def matches(self, text, words, has_history):
+        if self.history is not None and self.history != has_history:
+            return False
+        if self.min_chars is not None and len(text) < self.min_chars:
+            return False
+        if self.max_chars is not None and len(text) > self.max_chars:
+            return False
+        if self.min_words is not None and len(words) < self.min_words:
+            return False
+        if self.max_words is not None and len(words) > self.max_words:
+            return False
+        if self.keywords and self.keywords.isdisjoint(words):
+            return False
+        if self.pattern is not None and not self.pattern.search(text):
+            return False
+        return True
+
+
+# Picks the model route for a question: the first matching rule wins,
+# otherwise the default route. By default short questions go to the fast
+# route, and long ones, ones with "hard" keywords and follow-ups with
+# conversation history stay on the standard route.
+class ModelRouter:
+    def __init__(self, routes, rules=(), default="standard", prices=None, max_tokens_limit=1000, enabled=True):
+        self.routes = {route.name: route for route in routes}
+        self.rules = list(rules)
+        self.default = default
+        self.prices = dict(MODEL_PRICES if prices is None else prices)
+        self.max_tokens_limit = max_tokens_limit
+        self.enabled = enabled
+        if default not in self.routes:
+            raise ValueError(f"unknown default model route: {default}")
+        for rule in self.rules:
+            if rule.route not in self.routes:
+                raise ValueError(f"unknown model route in rule: {rule.route}")
+
+    @classmethod
+    def from_env(cls):
+        routes = [
+            ModelRoute(
+                name,
+                os.getenv(f"AI_{name.upper()}_MODEL", model),
+                env_int(f"AI_{name.upper()}_MAX_TOKENS", max_tokens),
+                env_float(f"AI_{name.upper()}_TEMPERATURE", None),
+            )
+            for name, model, max_tokens in (("fast", FAST_MODEL, 150), ("standard", STANDARD_MODEL, 300))
+        ]
+        keywords = os.getenv("AI_ROUTING_KEYWORDS", ESCALATE_KEYWORDS).replace(",", " ").split()
+        rules = [
+            Rule("standard", history=True),
+            Rule("standard", keywords=keywords),
+            Rule("fast", max_chars=env_int("AI_ROUTING_FAST_MAX_CHARS", 120)),
+        ]
+        default = "standard"
+        prices = dict(MODEL_PRICES)
+        prices.update({model: tuple(price) for model, price in json.loads(os.getenv("AI_MODEL_PRICES") or "{}").items()})
+
+        # A JSON file can add routes and replace the rules:
+        # {"routes": {"name": {"model": ..., "max_tokens": ..., "temperature": ...}},
+        #  "rules": [{"route": "fast", "max_chars": 80}, ...], "default": "standard"}
+        path = os.getenv("AI_ROUTING_CONFIG")
+        if path:
+            with open(path) as f:
+                config = json.load(f)
+            by_name = {route.name: route for route in routes}
+            for name, settings in (config.get("routes") or {}).items():
+                base = by_name.get(name) or ModelRoute(name, STANDARD_MODEL)
+                by_name[name] = ModelRoute(
+                    name,
+                    settings.get("model", base.model),
+                    settings.get("max_tokens", base.max_tokens),
+                    settings.get("temperature", base.temperature),
+                )
+            routes = list(by_name.values())
+            if "rules" in config:
+                rules = [Rule(**rule) for rule in config["rules"]]
+            default = config.get("default", default)
+
+        return cls(
+            routes,
+            rules,
+            default=default,
+            prices=prices,
+            max_tokens_limit=env_int("AI_MAX_TOKENS_LIMIT", 1000),
+            enabled=env_bool("AI_ROUTING_ENABLED", True),
+        )
+
+    # Route for a question; `overrides` (from parse_overrides) can force a
+    # route and replace its model, max_tokens or temperature
+    def choose(self, text, has_history=False, overrides=None):
+        overrides = overrides or {}
+        name = overrides.get("route")
+        if name is None:
+            name = self._match(text, has_history) if self.enabled else self.default
+        route = self.routes[name]
+        if overrides:
+            route = route.replace(overrides.get("model"), overrides.get("max_tokens"), overrides.get("temperature"))
+        return route
+
+    def _match(self, text, has_history):
+        words = set(_WORD.findall(text.lower()))
+        for rule in self.rules:
+            if rule.matches(text, words, has_history):
+                return rule.route
+        return self.default
+
+    # Validated per-request overrides from a JSON body or query string
+    # (route, model, max_tokens, temperature), None when there are none.
+    # Only models of the configured routes are allowed. Raises ValueError.
+    def parse_overrides(self, values):
+        overrides = {}
+        route = values.get("route")
+        if route not in (None, ""):
+            if not isinstance(route, str):
+                raise ValueError("route must be a string")
+            if route not in self.routes:
+                raise ValueError(f"unknown model route {route!r}")
+            overrides["route"] = route
+        model = values.get("model")
+        if model not in (None, ""):
+            if not isinstance(model, str):
+                raise ValueError("model must be a string")
+            if model not in {route.model for route in self.routes.values()}:
+                raise ValueError(f"model {model!r} is not allowed")
+            overrides["model"] = model
+        max_tokens = values.get("max_tokens")
+        if max_tokens not in (None, ""):
+            try:
+                max_tokens = int(max_tokens)
+            except (TypeError, ValueError):
+                raise ValueError("max_tokens must be a whole number")
+            if not 1 <= max_tokens <= self.max_tokens_limit:
+                raise ValueError(f"max_tokens must be between 1 and {self.max_tokens_limit}")
+            overrides["max_tokens"] = max_tokens
+        temperature = values.get("temperature")
+        if temperature not in (None, ""):
+            try:
+                temperature = float(temperature)
+            except (TypeError, ValueError):
+                raise ValueError("temperature must be a number")
+            if not 0.0 <= temperature <= 2.0:
+                raise ValueError("temperature must be between 0 and 2")
+            overrides["temperature"] = temperature
+        return overrides or None
+
+    def cost(self, model, usage):
+        price = self.prices.get(model)
+        if price is None or usage is None:
+            return 0.0
+        return ((usage.prompt_tokens or 0) * price[0] + (usage.completion_tokens or 0) * price[1]) / 1e6
+
+    # Latency (None for streamed answers, where it would include the sends)
+    # and token usage of one completion on `route`
+    def record(self, route, seconds=None, usage=None):
+        labels = {"route": route.name, "model": route.model}
+        ROUTE_REQUESTS.inc(**labels)
+        if seconds is not None:
+            ROUTE_LATENCY.observe(seconds, **labels)
+        if usage is None:
+            return
+        ROUTE_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt", **labels)
+        ROUTE_TOKENS.inc(usage.completion_tokens or 0, kind="completion", **labels)
+        ROUTE_COST.inc(self.cost(route.model, usage), **labels)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter.from_env()
+    return _router
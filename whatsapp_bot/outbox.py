@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from whatsapp_bot.db import connect
+from whatsapp_bot.metrics import counter, histogram
+from whatsapp_bot.send_queue import FAILED, QUEUED, SUCCEEDED, Job, QueueFull
+
+COMMIT_LATENCY = histogram(
+    "outbox_commit_duration_seconds", "Time of one outbox transaction, fsync included",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+WRITES = counter("outbox_writes_total", "Rows written to the outbox by kind", ["kind"])
+REPLAYED = counter("outbox_replayed_total", "Unfinished outbox jobs of dead processes queued again")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    task TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_unfinished ON outbox (owner) WHERE finished_at IS NULL;
+CREATE INDEX IF NOT EXISTS outbox_finished ON outbox (finished_at) WHERE finished_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS outbox_processes (
+    pid INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL
+);
+"""
+
+INSERT = (
+    "INSERT OR IGNORE INTO outbox (id, task, kwargs, status, owner, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+)
+FINISH = "UPDATE outbox SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?"
+
+
+# Whether another process with this pid is running on this host. Our own
+# pid does not count: a restarted server (pid 1 in a container) gets the pid
+# of the process it replaces.
+def process_alive(pid):
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# One statement for the writer thread; `done` is set once it is committed
+class _Write:
+    __slots__ = ("sql", "params", "done", "error")
+
+    def __init__(self, sql, params, wait):
+        self.sql = sql
+        self.params = params
+        self.done = threading.Event() if wait else None
+        self.error = None
+
+
+# Durable send queue backend: every accepted job is in an SQLite database in
+# WAL mode before put() returns, and is marked finished once its task has
+# run. Jobs are dispatched from memory; the database is only read at startup
+# and for /jobs lookups of jobs no longer in memory.
+#
+# One writer thread does all the writes. Whatever has piled up while the
+# previous transaction was committing goes into the next one (group
+# commit), so concurrent sends share a single fsync instead of paying one
+# each, and a lone send does not wait for a batch to fill up.
+#
+# Crash recovery: rows carry the owner token of the process that accepted
+# them. When a process opens the outbox, it claims the unfinished rows of
+# owners that are no longer running and queues them again. Delivery is
+# therefore at least once: a process that dies between the Graph API
+# answering and the finish being committed sends that message again.
+class SqliteBackend:
+    durable = True
+
+    def __init__(self, path="outbox.db", maxsize=10000, max_jobs=10000, batch_size=500,
+                 synchronous="FULL", retention=86400.0):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_jobs = max_jobs
+        self.batch_size = batch_size
+        self.synchronous = synchronous
+        self.retention = retention
+        self._pid = None
+        self._open_lock = threading.Lock()
+
+    # Opens the database on first use in each process (never in a gunicorn
+    # master that forks afterwards) and replays what dead processes left
+    def open(self):
+        if self._pid == os.getpid():
+            return
+        with self._open_lock:
+            if self._pid == os.getpid():
+                return
+            self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._pending = queue.Queue()
+            self._jobs = OrderedDict()
+            self._lock = threading.Lock()
+            self._writes = []
+            self._cond = threading.Condition()
+            self._pruned_at = time.monotonic()
+            self._reader = connect(self.path, self.synchronous)
+            self._reader_lock = threading.Lock()
+            replayed = self._recover()
+            writer = connect(self.path, self.synchronous)
+            threading.Thread(target=self._write_loop, args=(writer,), name="outbox-writer", daemon=True).start()
+            self._pid = os.getpid()
+        if replayed:
+            logging.warning("Outbox: queued %d unfinished jobs of stopped processes again", replayed)
+
+    def _recover(self):
+        conn = self._reader
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            processes = conn.execute("SELECT pid, owner FROM outbox_processes").fetchall()
+            live = {owner for pid, owner in processes if process_alive(pid)}
+            conn.execute("DELETE FROM outbox_processes WHERE owner NOT IN (SELECT value FROM json_each(?))",
+                         (json.dumps(sorted(live)),))
+            conn.execute("INSERT OR REPLACE INTO outbox_processes (pid, owner) VALUES (?, ?)",
+                         (os.getpid(), self.owner))
+            live.add(self.owner)
+            conn.execute(
+                "UPDATE outbox SET owner = ? WHERE finished_at IS NULL "
+                "AND owner NOT IN (SELECT value FROM json_each(?))",
+                (self.owner, json.dumps(sorted(live))),
+            )
+            rows = conn.execute(
+                "SELECT id, task, kwargs, created_at FROM outbox WHERE finished_at IS NULL AND owner = ? "
+                "ORDER BY seq",
+                (self.owner,),
+            ).fetchall()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for job_id, task, kwargs, created_at in rows:
+            job = Job(task, json.loads(kwargs), job_id=job_id)
+            job.created_at = created_at
+            self._remember(job)
+            self._pending.put(job)
+        REPLAYED.inc(len(rows))
+        return len(rows)
+
+    def _write(self, sql, params, wait):
+        write = _Write(sql, params, wait)
+        with self._cond:
+            self._writes.append(write)
+            self._cond.notify()
+        if wait:
+            write.done.wait()
+            if write.error is not None:
+                raise QueueFull(f"outbox write failed: {write.error}")
+
+    def _write_loop(self, conn):
+        while True:
+            with self._cond:
+                while not self._writes:
+                    self._cond.wait()
+                batch = self._writes[:self.batch_size]
+                del self._writes[:self.batch_size]
+            start = time.perf_counter()
+            error = None
+            try:
+                conn.execute("BEGIN")
+                for write in batch:
+                    conn.execute(write.sql, write.params)
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                logging.error("Outbox write failed: %s", e)
+                error = e
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            COMMIT_LATENCY.observe(time.perf_counter() - start)
+            for write in batch:
+                WRITES.inc(kind="insert" if write.sql == INSERT else "finish")
+                if write.done is not None:
+                    write.error = error
+                    write.done.set()
+            self._prune(conn)
+
+    # Finished rows are kept for `retention` seconds for /jobs lookups
+    def _prune(self, conn):
+        if time.monotonic() - self._pruned_at < 60.0:
+            return
+        self._pruned_at = time.monotonic()
+        try:
+            conn.execute("DELETE FROM outbox WHERE finished_at < ?", (time.time() - self.retention,))
+        except sqlite3.Error as e:
+            logging.error("Outbox prune failed: %s", e)
+
+    def _insert(self, job):
+        self._write(INSERT, (job.id, job.task, json.dumps(job.kwargs), job.status, self.owner, job.created_at),
+                    wait=True)
+
+    def _remember(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._jobs.move_to_end(job.id)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    # Returns once the job is on disk. A job that comes back from a deferral
+    # is already there, so the insert is a no-op.
+    def put(self, job):
+        self.open()
+        if self._pending.qsize() >= self.maxsize:
+            raise QueueFull("send queue is full")
+        self._insert(job)
+        self._remember(job)
+        self._pending.put(job)
+
+    # Writes a job that runs in the request thread (SendQueue.journal)
+    # without queueing it
+    def record(self, job):
+        self.open()
+        self._insert(job)
+
+    def get(self, timeout=None):
+        self.open()
+        try:
+            return self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # Only the final state goes to disk, without waiting for the commit:
+    # until then the job simply counts as unfinished
+    def save(self, job):
+        self.open()
+        self._remember(job)
+        if job.status in (SUCCEEDED, FAILED):
+            result = json.dumps(job.result) if job.result is not None else None
+            self._write(FINISH, (job.status, result, job.error, job.finished_at, job.id), wait=False)
+
+    def load(self, job_id):
+        self.open()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        with self._reader_lock:
+            row = self._reader.execute(
+                "SELECT task, kwargs, status, result, error, created_at, finished_at FROM outbox WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        task, kwargs, status, result, error, created_at, finished_at = row
+        job = Job(task, json.loads(kwargs), job_id=job_id)
+        job.status = status if finished_at is not None else QUEUED
+        job.result = json.loads(result) if result is not None else None
+        job.error = error
+        job.created_at = created_at
+        job.finished_at = finished_at
+        return job
+
+    def depth(self):
+        return self._pending.qsize() if self._pid == os.getpid() else 0
@@ -0,0 +1,52 @@
+# Graph API message payloads shared by the single and bulk send paths
+
+
+def text_payload(phone_number, message):
+    return {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": phone_number,
+        "type": "text",
+        "text": {
+            "preview_url": False,
+            "body": message
+        }
+    }
+
+
+# parameters fill the {{1}}, {{2}}, ... placeholders of the template body
+def template_payload(phone_number, template_name, language_code="en_US", parameters=None):
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": phone_number,
+        "type": "template",
+        "template": {
+            "name": template_name,
+            "language": {
+                "code": language_code
+            }
+        }
+    }
+    if parameters:
+        payload["template"]["components"] = [{
+            "type": "body",
+            "parameters": [{"type": "text", "text": str(value)} for value in parameters]
+        }]
+    return payload
+
+
+# image, document or audio by the media id of an upload. Audio has no
+# caption and only documents have a file name.
+def media_payload(phone_number, media_type, media_id, caption=None, filename=None):
+    media = {"id": media_id}
+    if caption and media_type != "audio":
+        media["caption"] = caption
+    if filename and media_type == "document":
+        media["filename"] = filename
+    return {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": phone_number,
+        "type": media_type,
+        media_type: media
+    }
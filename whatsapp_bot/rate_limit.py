@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+
+from whatsapp_bot.config import env_float
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+# Token bucket that hands out reservations: a caller takes a token right
+# away (the balance may go negative) and gets back how long to wait before
+# using it. Concurrent callers are therefore spaced out in arrival order
+# instead of all waking up together. Not thread-safe on its own.
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def reserve(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        self.tokens += 1
+
+    # Seconds until the bucket is full again, i.e. until it can be forgotten
+    def idle_after(self):
+        return (self.burst - self.tokens) / self.rate
+
+
+# Paces Graph API sends under the WhatsApp Cloud API limits: a global
+# messages-per-second bucket for the phone number's throughput tier and a
+# per-recipient bucket for the pair rate limit (Meta error 131056).
+class RateLimiter:
+    def __init__(
+        self,
+        rate=80.0,
+        burst=None,
+        recipient_interval=6.0,
+        recipient_burst=45,
+        max_wait=10.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.clock = clock
+        self.sleep = sleep
+        self.max_wait = max_wait
+        now = clock()
+        self.bucket = TokenBucket(rate, burst or rate, now) if rate > 0 else None
+        self.recipient_rate = 1.0 / recipient_interval if recipient_interval > 0 else 0.0
+        self.recipient_burst = recipient_burst
+        self.recipients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        rate = env_float("WHATSAPP_MPS", 80.0)
+        return cls(
+            rate=rate,
+            burst=env_float("WHATSAPP_BURST", rate),
+            recipient_interval=env_float("WHATSAPP_RECIPIENT_INTERVAL", 6.0),
+            recipient_burst=env_float("WHATSAPP_RECIPIENT_BURST", 45),
+            max_wait=env_float("RATE_LIMIT_MAX_WAIT", 10.0),
+        )
+
+    # Reserve a send slot and return the delay before it may go out.
+    # Raises RateLimited (reserving nothing) if the delay exceeds max_wait.
+    def reserve(self, recipient=None):
+        with self._lock:
+            now = self.clock()
+            wait = 0.0
+            if self.bucket is not None:
+                wait = self.bucket.reserve(now)
+
+            bucket = None
+            if recipient and self.recipient_rate:
+                self._evict_idle(now)
+                key = recipient.lstrip('+')
+                bucket = self.recipients.pop(key, None)
+                if bucket is None:
+                    bucket = TokenBucket(self.recipient_rate, self.recipient_burst, now)
+                self.recipients[key] = bucket
+                wait = max(wait, bucket.reserve(now))
+
+            if wait > self.max_wait:
+                if self.bucket is not None:
+                    self.bucket.refund()
+                if bucket is not None:
+                    bucket.refund()
+                raise RateLimited(wait)
+            return wait
+
+    def acquire(self, recipient=None):
+        wait = self.reserve(recipient)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    # Recipients are kept in least-recently-used order, so idle buckets that
+    # have refilled completely sit at the front and can be dropped cheaply.
+    def _evict_idle(self, now):
+        while self.recipients:
+            key, bucket = next(iter(self.recipients.items()))
+            if now - bucket.updated < bucket.idle_after():
+                break
+            del self.recipients[key]
@@ -0,0 +1,23 @@
+# Strings in Redis with a TTL, for the backends that share state between
+# worker processes (AI cache, media ids, idempotency keys). redis is only
+# imported when such a backend is configured; `setting` names the variable
+# that picked it, for the error when the package is missing.
+class RedisBackend:
+    def __init__(self, url, setting, prefix=""):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(f"{setting}=redis needs the redis package (pip install redis)") from e
+
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self._redis.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self._redis.delete(self.prefix + key)
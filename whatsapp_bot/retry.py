@@ -0,0 +1,209 @@
+import asyncio
+import email.utils
+import random
+import time
+
+from whatsapp_bot.circuit_breaker import get_circuit_breaker
+from whatsapp_bot.config import env_float, env_int
+from whatsapp_bot.metrics import counter
+
+# Statuses worth another try: timeouts, throttling and server errors
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+# Statuses that count against the circuit breaker: the upstream is
+# throttling everyone or failing itself
+def is_outage_status(status):
+    return status == 429 or status >= 500
+
+ATTEMPTS = counter("upstream_attempts_total", "Calls made to an upstream API, including retries", ["upstream"])
+RETRIES = counter("upstream_retries_total", "Retries after a transient upstream failure", ["upstream", "reason"])
+RETRY_DELAY = counter("upstream_retry_delay_seconds_total", "Time spent waiting between retries", ["upstream"])
+GIVE_UPS = counter("upstream_retry_giveups_total", "Transient failures still failing after the last attempt", ["upstream"])
+
+
+# Seconds from a Retry-After header (delta-seconds or HTTP date), or None
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(response):
+    headers = getattr(response, "headers", None)
+    return parse_retry_after(headers.get("Retry-After")) if headers else None
+
+
+# Retry policy shared by the Graph API and OpenAI calls: capped exponential
+# backoff with full jitter, Retry-After honoured when the upstream sends it.
+#
+# A call is retried when it raises one of `retry_on`, raises an exception
+# carrying a retryable `status_code` (OpenAI's APIStatusError), or returns a
+# response whose status is retryable or for which `retry_if(response)` is true.
+#
+# With a `breaker`, a call first asks the circuit breaker and fails with
+# CircuitOpen while the upstream is down; the outcome after the last attempt
+# is reported back to it. Failures are connection errors, `failure_on`
+# (e.g. read timeouts, which are not retried), 429s and 5xx responses.
+class RetryPolicy:
+    def __init__(
+        self,
+        name,
+        max_attempts=3,
+        base_delay=0.5,
+        max_delay=8.0,
+        max_retry_after=30.0,
+        retry_on=(ConnectionError, TimeoutError),
+        retry_if=None,
+        retryable_status=RETRYABLE_STATUS,
+        breaker=None,
+        failure_on=(),
+        sleep=time.sleep,
+        rand=random.random,
+    ):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_on = tuple(retry_on)
+        self.retry_if = retry_if
+        self.retryable_status = retryable_status
+        self.breaker = breaker
+        self.failure_on = self.retry_on + tuple(failure_on)
+        self.sleep = sleep
+        self.rand = rand
+
+    @classmethod
+    def from_env(cls, name, **kwargs):
+        return cls(
+            name,
+            max_attempts=env_int("RETRY_MAX_ATTEMPTS", 3),
+            base_delay=env_float("RETRY_BASE_DELAY", 0.5),
+            max_delay=env_float("RETRY_MAX_DELAY", 8.0),
+            max_retry_after=env_float("RETRY_MAX_RETRY_AFTER", 30.0),
+            breaker=get_circuit_breaker(name),
+            **kwargs,
+        )
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return self.rand() * min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+
+    # Reason label when `error` is worth retrying, None otherwise
+    def _exception_reason(self, error):
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            return str(status) if status in self.retryable_status else None
+        if isinstance(error, self.retry_on):
+            return type(error).__name__
+        return None
+
+    def _response_reason(self, response):
+        status = getattr(response, "status_code", None)
+        if status in self.retryable_status:
+            return str(status)
+        if self.retry_if is not None and self.retry_if(response):
+            return f"{status}-throttled"
+        return None
+
+    # Delay before the next attempt, or None when the outcome is final.
+    # `carrier` is the response (or the exception's response) that may hold
+    # a Retry-After header.
+    def _next_delay(self, attempt, reason, carrier):
+        if reason is None:
+            return None
+        if attempt >= self.max_attempts:
+            GIVE_UPS.inc(upstream=self.name)
+            return None
+        delay = self.backoff(attempt, _retry_after(carrier))
+        RETRIES.inc(upstream=self.name, reason=reason)
+        RETRY_DELAY.inc(delay, upstream=self.name)
+        return delay
+
+    # Outcome for the circuit breaker: False when the upstream is failing,
+    # True when it answered, None when the call never reached it (RateLimited)
+    def _healthy(self, error=None, response=None):
+        if error is None:
+            status = getattr(response, "status_code", None)
+            return not (isinstance(status, int) and is_outage_status(status))
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            return not is_outage_status(status)
+        if isinstance(error, self.failure_on):
+            return False
+        return None
+
+    def call(self, fn, *args, **kwargs):
+        if self.breaker is None:
+            return self._call(fn, *args, **kwargs)
+        probe = self.breaker.allow()
+        healthy = None
+        try:
+            result = self._call(fn, *args, **kwargs)
+            healthy = self._healthy(response=result)
+            return result
+        except Exception as e:
+            healthy = self._healthy(error=e)
+            raise
+        finally:
+            self.breaker.record(healthy, probe)
+
+    def _call(self, fn, *args, **kwargs):
+        attempt = 1
+        while True:
+            ATTEMPTS.inc(upstream=self.name)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(attempt, self._exception_reason(e), getattr(e, "response", None))
+                if delay is None:
+                    raise
+            else:
+                delay = self._next_delay(attempt, self._response_reason(result), result)
+                if delay is None:
+                    return result
+            self.sleep(delay)
+            attempt += 1
+
+    # call() for coroutine functions; waits with asyncio.sleep so the event
+    # loop keeps serving other requests during the backoff
+    async def acall(self, fn, *args, **kwargs):
+        if self.breaker is None:
+            return await self._acall(fn, *args, **kwargs)
+        probe = self.breaker.allow()
+        healthy = None
+        try:
+            result = await self._acall(fn, *args, **kwargs)
+            healthy = self._healthy(response=result)
+            return result
+        except Exception as e:
+            healthy = self._healthy(error=e)
+            raise
+        finally:
+            self.breaker.record(healthy, probe)
+
+    async def _acall(self, fn, *args, **kwargs):
+        attempt = 1
+        while True:
+            ATTEMPTS.inc(upstream=self.name)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(attempt, self._exception_reason(e), getattr(e, "response", None))
+                if delay is None:
+                    raise
+            else:
+                delay = self._next_delay(attempt, self._response_reason(result), result)
+                if delay is None:
+                    return result
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,390 @@
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from whatsapp_bot.config import env_float, env_int
+from whatsapp_bot.db import Database
+from whatsapp_bot.metrics import counter, gauge, histogram
+from whatsapp_bot.outbox import process_alive
+from whatsapp_bot.send_queue import QueueFull
+
+SCHEDULED = counter("scheduled_sends_total", "Scheduled sends by outcome", ["status"])
+HEAP_SIZE = gauge("scheduler_heap_size", "Scheduled sends due within the horizon held in this process's timer heap")
+FIRE_LAG = histogram(
+    "scheduled_send_lag_seconds", "Time from a scheduled send's due time until it is on the send queue",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+# States of a scheduled send: waiting, claimed by a process that is handing
+# it to the send queue, on the send queue (job_id), cancelled, not sendable
+PENDING = "pending"
+FIRING = "firing"
+FIRED = "fired"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scheduled_sends (
+    id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    due_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    job_id TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    fired_at REAL
+);
+CREATE INDEX IF NOT EXISTS scheduled_sends_due ON scheduled_sends (due_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS scheduled_sends_firing ON scheduled_sends (owner) WHERE status = 'firing';
+CREATE INDEX IF NOT EXISTS scheduled_sends_done ON scheduled_sends (fired_at) WHERE fired_at IS NOT NULL;
+"""
+
+# "23h", "1h30m", "90s", "2d"
+DURATION = re.compile(r"(\d+(?:\.\d+)?)\s*([dhms])")
+DURATION_UNITS = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+# "09:00" or "9:00"
+TIME_OF_DAY = re.compile(r"^(\d{1,2}):(\d{2})$")
+
+
+# Seconds from a number or a duration like "23h" or "1h30m"
+def parse_duration(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value).strip().lower()
+    if re.fullmatch(r"\d+(?:\.\d+)?", text):
+        return float(text)
+    parts = DURATION.findall(text)
+    if not parts or "".join(DURATION.sub("", text).split()):
+        raise ValueError(f"invalid duration {value!r}, use seconds or e.g. \"23h\", \"1h30m\"")
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_timezone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown timezone {name!r}") from None
+
+
+# Fires registered send queue tasks at a later time.
+#
+# Every scheduled send is a row in SQLite, indexed by due time, so pending
+# sends survive restarts and millions of them cost disk, not memory. Each
+# process keeps only the sends due within `horizon` seconds in a heap
+# (O(log n) inserts and pops) and one timer thread sleeps until the earliest
+# is due. A send scheduled further out is loaded into the heap by the
+# refill that runs every `poll_interval` seconds.
+#
+# A due send is handed to the send queue (bind()), so it goes through the
+# same tasks, rate limiter, retries and outbox as an immediate one. Workers
+# sharing the database claim sends with a conditional UPDATE, so exactly one
+# of them queues each send. A worker that dies between the claim and
+# queueing leaves the send `firing`; the next refill of any live worker puts
+# it back, so delivery is at least once.
+#
+# Due times get up to `jitter` seconds added at random, so that a campaign
+# scheduled for 09:00 does not hit the send queue and the Graph API in the
+# same second.
+class Scheduler:
+    def __init__(self, path="schedule.db", jitter=30.0, horizon=3600.0, poll_interval=30.0, batch_size=500,
+                 max_delay=30 * 86400.0, max_recipients=10000, max_heap=100000, retention=7 * 86400.0,
+                 timezone="UTC"):
+        self.path = path
+        self.jitter = jitter
+        self.horizon = horizon
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_recipients = max_recipients
+        self.max_heap = max_heap
+        self.retention = retention
+        self.timezone = parse_timezone(timezone)
+        self._submit = None
+        self._pid = None
+        self._open_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("SCHEDULE_PATH", "schedule.db"),
+            jitter=env_float("SCHEDULE_JITTER", 30.0),
+            horizon=env_float("SCHEDULE_HORIZON", 3600.0),
+            poll_interval=env_float("SCHEDULE_POLL_INTERVAL", 30.0),
+            batch_size=env_int("SCHEDULE_BATCH_SIZE", 500),
+            max_delay=env_float("SCHEDULE_MAX_DELAY", 30 * 86400.0),
+            max_recipients=env_int("SCHEDULE_MAX_RECIPIENTS", 10000),
+            max_heap=env_int("SCHEDULE_MAX_HEAP", 100000),
+            retention=env_float("SCHEDULE_RETENTION", 7 * 86400.0),
+            timezone=os.getenv("SCHEDULE_TIMEZONE", "UTC"),
+        )
+
+    # The send queue's submit(task, **kwargs)
+    def bind(self, submit):
+        self._submit = submit
+
+    # Fire what is due right away; without a database nothing was scheduled
+    # and no thread is started
+    def start(self):
+        if os.path.exists(self.path):
+            self._open()
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        with self._open_lock:
+            if self._pid == os.getpid():
+                return
+            self._db = Database(self.path, SCHEMA, synchronous="NORMAL")
+            self._cond = threading.Condition()
+            self._heap = []
+            self._queued = set()
+            self._refill_at = 0.0
+            self._pruned_at = time.monotonic()
+            self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            threading.Thread(target=self._run, name="scheduler", daemon=True).start()
+            self._pid = os.getpid()
+
+    # The due time (epoch seconds, before jitter) and jitter of a /schedule
+    # body. "send_at" is an ISO 8601 time, or "HH:MM" for the next time the
+    # clock shows that; both in "timezone" unless they carry an offset.
+    # "delay" is seconds or a duration like "23h". Raises ValueError.
+    def parse(self, data, now=None):
+        now = time.time() if now is None else now
+        send_at, delay = data.get("send_at"), data.get("delay")
+        if (send_at is None) == (delay is None):
+            raise ValueError("give either send_at or delay")
+        timezone = parse_timezone(data["timezone"]) if data.get("timezone") else self.timezone
+
+        if delay is not None:
+            seconds = parse_duration(delay)
+            if seconds < 0:
+                raise ValueError("delay must not be negative")
+            due_at = now + seconds
+        else:
+            match = TIME_OF_DAY.match(str(send_at).strip())
+            if match:
+                hour, minute = int(match.group(1)), int(match.group(2))
+                if hour > 23 or minute > 59:
+                    raise ValueError(f"invalid time of day {send_at!r}")
+                local_now = datetime.fromtimestamp(now, timezone)
+                due = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                if due.timestamp() <= now:
+                    # Same wall clock time tomorrow, also across a DST change
+                    due = (due.replace(tzinfo=None) + timedelta(days=1)).replace(tzinfo=timezone)
+                due_at = due.timestamp()
+            else:
+                try:
+                    due = datetime.fromisoformat(str(send_at).strip())
+                except ValueError:
+                    raise ValueError(f"invalid send_at {send_at!r}, use ISO 8601 or \"HH:MM\"") from None
+                if due.tzinfo is None:
+                    due = due.replace(tzinfo=timezone)
+                due_at = due.timestamp()
+                if due_at < now - 60.0:
+                    raise ValueError(f"send_at {send_at!r} is in the past")
+
+        if due_at - now > self.max_delay:
+            raise ValueError(f"send is more than {self.max_delay / 86400:g} days away")
+        jitter = parse_duration(data["jitter"]) if data.get("jitter") is not None else self.jitter
+        if jitter < 0:
+            raise ValueError("jitter must not be negative")
+        return max(due_at, now), jitter
+
+    # Stores (task, kwargs) sends due at `due_at` plus up to `jitter`
+    # seconds each, in one transaction. Returns [(schedule_id, due_at)].
+    def schedule(self, items, due_at, jitter=None):
+        if self._submit is None:
+            raise RuntimeError("Scheduler.bind() has not been called")
+        jitter = self.jitter if jitter is None else jitter
+        self._open()
+        now = time.time()
+        rows = [
+            (uuid.uuid4().hex, task, json.dumps(kwargs), due_at + random.uniform(0.0, jitter), PENDING, now)
+            for task, kwargs in items
+        ]
+        self._db.transaction([(
+            "INSERT INTO scheduled_sends (id, task, kwargs, due_at, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )])
+        SCHEDULED.inc(len(rows), status="scheduled")
+        self._push([(row[3], row[0]) for row in rows if row[3] < now + self.horizon])
+        return [(row[0], row[3]) for row in rows]
+
+    # Adds (due_at, schedule_id) entries to the heap and wakes the timer
+    # thread if one of them is due before what it is sleeping for
+    def _push(self, entries):
+        if not entries:
+            return
+        with self._cond:
+            earliest = self._heap[0][0] if self._heap else None
+            for entry in entries:
+                if entry[1] not in self._queued:
+                    self._queued.add(entry[1])
+                    heapq.heappush(self._heap, entry)
+            if earliest is None or self._heap[0][0] < earliest:
+                self._cond.notify()
+
+    # State of a scheduled send for /schedule/<schedule_id>, None if unknown
+    def get(self, schedule_id):
+        if self._pid != os.getpid() and not os.path.exists(self.path):
+            return None
+        self._open()
+        rows = self._db.query(
+            "SELECT task, kwargs, due_at, status, job_id, error, created_at, fired_at FROM scheduled_sends "
+            "WHERE id = ?",
+            (schedule_id,),
+        )
+        if not rows:
+            return None
+        task, kwargs, due_at, status, job_id, error, created_at, fired_at = rows[0]
+        return {
+            "schedule_id": schedule_id,
+            "task": task,
+            "phone_number": json.loads(kwargs).get("phone_number"),
+            "status": status,
+            "due_at": due_at,
+            "job_id": job_id,
+            "error": error,
+            "created_at": created_at,
+            "fired_at": fired_at,
+        }
+
+    # Cancels a send that is still pending. Returns its state afterwards,
+    # None if unknown; a send already queued stays "fired".
+    def cancel(self, schedule_id):
+        if self._pid != os.getpid() and not os.path.exists(self.path):
+            return None
+        self._open()
+        if self._db.update(
+            "UPDATE scheduled_sends SET status = ?, fired_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, time.time(), schedule_id, PENDING),
+        ):
+            SCHEDULED.inc(status=CANCELLED)
+        # The heap entry stays and is skipped when it comes up
+        return self.get(schedule_id)
+
+    def heap_size(self):
+        return len(self._heap) if self._pid == os.getpid() else 0
+
+    def _run(self):
+        while True:
+            try:
+                if time.time() >= self._refill_at:
+                    self._refill()
+                due = self._wait_due()
+                if due:
+                    self._fire(due)
+            except Exception:
+                logging.exception("Scheduler failed")
+                time.sleep(1.0)
+
+    # Sleeps until the earliest send is due or the next refill, then pops up
+    # to batch_size due schedule ids
+    def _wait_due(self):
+        with self._cond:
+            now = time.time()
+            while not self._heap or self._heap[0][0] > now:
+                until = min(self._heap[0][0] if self._heap else self._refill_at, self._refill_at)
+                if until <= now:
+                    return []
+                self._cond.wait(until - now)
+                now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                schedule_id = heapq.heappop(self._heap)[1]
+                self._queued.discard(schedule_id)
+                due.append(schedule_id)
+            return due
+
+    # Loads the pending sends due within the horizon into the heap, puts
+    # back the sends of dead workers and prunes old finished rows
+    def _refill(self):
+        now = time.time()
+        self._refill_at = now + self.poll_interval
+        for (owner,) in self._db.query("SELECT DISTINCT owner FROM scheduled_sends WHERE status = ?", (FIRING,)):
+            if owner != self.owner and not process_alive(int(owner.split(":")[0])):
+                released = self._db.update(
+                    "UPDATE scheduled_sends SET status = ?, owner = NULL WHERE status = ? AND owner = ?",
+                    (PENDING, FIRING, owner),
+                )
+                logging.warning("Scheduler: %d sends of a stopped process are pending again", released)
+        with self._cond:
+            room = self.max_heap - len(self._heap)
+        if room > 0:
+            self._push(self._db.query(
+                "SELECT due_at, id FROM scheduled_sends WHERE status = ? AND due_at < ? ORDER BY due_at LIMIT ?",
+                (PENDING, now + self.horizon, room),
+            ))
+        if time.monotonic() - self._pruned_at > 3600.0:
+            self._pruned_at = time.monotonic()
+            self._db.update("DELETE FROM scheduled_sends WHERE fired_at < ?", (now - self.retention,))
+
+    # Claims the due sends that are still pending, queues them and records
+    # the job ids. A full send queue puts a send back for a second later.
+    def _fire(self, schedule_ids):
+        claimed = json.dumps(schedule_ids)
+        with self._db.begin() as conn:
+            conn.execute(
+                "UPDATE scheduled_sends SET status = ?, owner = ? "
+                "WHERE id IN (SELECT value FROM json_each(?)) AND status = ?",
+                (FIRING, self.owner, claimed, PENDING),
+            )
+            rows = conn.execute(
+                "SELECT id, task, kwargs, due_at FROM scheduled_sends "
+                "WHERE id IN (SELECT value FROM json_each(?)) AND status = ? AND owner = ?",
+                (claimed, FIRING, self.owner),
+            ).fetchall()
+
+        fired, failed, retry = [], [], []
+        for schedule_id, task, kwargs, due_at in rows:
+            now = time.time()
+            try:
+                job = self._submit(task, **json.loads(kwargs))
+            except QueueFull:
+                retry.append((now + 1.0, schedule_id))
+                continue
+            except Exception as e:
+                logging.error("Scheduled send %s (%s) could not be queued: %s", schedule_id, task, e)
+                failed.append((FAILED, str(e), now, schedule_id))
+                continue
+            fired.append((FIRED, job.id, now, schedule_id))
+            FIRE_LAG.observe(max(0.0, now - due_at))
+
+        self._db.transaction([
+            ("UPDATE scheduled_sends SET status = ?, job_id = ?, fired_at = ? WHERE id = ?", fired),
+            ("UPDATE scheduled_sends SET status = ?, error = ?, fired_at = ? WHERE id = ?", failed),
+            ("UPDATE scheduled_sends SET status = 'pending', owner = NULL, due_at = ? WHERE id = ?", retry),
+        ])
+        SCHEDULED.inc(len(fired), status=FIRED)
+        SCHEDULED.inc(len(failed), status=FAILED)
+        self._push(retry)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler.from_env()
+                HEAP_SIZE.set_function(_scheduler.heap_size)
+    return _scheduler
+
+
+# Called after the fork in every server worker, like start_send_queue
+def start_scheduler():
+    if _scheduler is not None and _scheduler._submit is not None:
+        _scheduler.start()
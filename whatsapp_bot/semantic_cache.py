@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from whatsapp_bot.ai_cache import CACHE_REQUESTS, normalize_question
+from whatsapp_bot.circuit_breaker import CircuitOpen, get_circuit_breaker
+from whatsapp_bot.config import env_bool, env_float, env_int
+
+_TOKENS = re.compile(r"\w+")
+
+
+# numpy and hnswlib are optional and only imported once a semantic cache is
+# built, so the app starts without them (and without their import time)
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise RuntimeError("The semantic cache needs numpy (pip install numpy)") from e
+    return numpy
+
+
+# None without hnswlib; searches then always go through the matrix product
+def _hnswlib():
+    try:
+        import hnswlib
+    except ImportError:
+        return None
+    return hnswlib
+
+
+# Deterministic local embedder: hashed word unigrams/bigrams plus character
+# trigrams, L2-normalized. It only captures lexical overlap, but needs no
+# network or model, which makes it suitable for tests and benchmarks.
+class HashingEmbedder:
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _features(self, text):
+        words = _TOKENS.findall(text)
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+        padded = f" {text} "
+        yield from (padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def __call__(self, texts):
+        np = _numpy()
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return _normalize(vectors)
+
+
+# Embeddings from the OpenAI embeddings endpoint, skipped while the OpenAI
+# circuit is open
+class OpenAIEmbedder:
+    def __init__(self, client, model="text-embedding-3-small"):
+        self.client = client
+        self.model = model
+
+    def __call__(self, texts):
+        np = _numpy()
+        get_circuit_breaker("openai").check()
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        return _normalize(np.array([item.embedding for item in response.data], dtype=np.float32))
+
+
+def _normalize(vectors):
+    norms = _numpy().linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# Fixed-capacity store of unit vectors searched by one matrix-vector
+# product. Once full, the oldest row is overwritten (ring buffer), so memory
+# stays at capacity * dim * 4 bytes. Above `ann_min_entries` rows, and if
+# hnswlib is installed, searches go through an HNSW index instead.
+class VectorIndex:
+    def __init__(self, dim, capacity, ann_min_entries=20000):
+        np = _numpy()
+        self.dim = dim
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, 1024), dim), dtype=np.float32)
+        self.expires = np.zeros(len(self.vectors), dtype=np.float64)
+        self.answers = [None] * len(self.vectors)
+        self.size = 0
+        self.next_row = 0
+        self.ann_min_entries = ann_min_entries
+        self.ann = None
+        self._hnswlib = _hnswlib()
+
+    def _grow(self):
+        np = _numpy()
+        rows = min(self.capacity, len(self.vectors) * 2)
+        vectors = np.zeros((rows, self.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        expires = np.zeros(rows, dtype=np.float64)
+        expires[:self.size] = self.expires[:self.size]
+        self.vectors, self.expires = vectors, expires
+        self.answers.extend([None] * (rows - len(self.answers)))
+
+    def add(self, vector, answer, expires_at):
+        if self.next_row == len(self.vectors) and len(self.vectors) < self.capacity:
+            self._grow()
+        row = self.next_row
+        self.vectors[row] = vector
+        self.expires[row] = expires_at
+        self.answers[row] = answer
+        self.size = max(self.size, row + 1)
+        self.next_row = (row + 1) % self.capacity
+
+        if self.ann is not None:
+            self.ann.add_items(vector[None, :], [row])
+        elif self._hnswlib is not None and self.size >= self.ann_min_entries:
+            self._build_ann()
+
+    def _build_ann(self):
+        self.ann = self._hnswlib.Index(space="ip", dim=self.dim)
+        self.ann.init_index(max_elements=self.capacity, ef_construction=200, M=16)
+        self.ann.add_items(self.vectors[:self.size], _numpy().arange(self.size))
+        self.ann.set_ef(64)
+
+    # (row, similarity) of the nearest unexpired vector, or (None, 0.0)
+    def search(self, vector, now):
+        if self.size == 0:
+            return None, 0.0
+        if self.ann is not None:
+            labels, distances = self.ann.knn_query(vector, k=min(8, self.size))
+            for label, distance in zip(labels[0], distances[0]):
+                if self.expires[label] > now:
+                    return int(label), 1.0 - float(distance)
+            return None, 0.0
+
+        np = _numpy()
+        scores = self.vectors[:self.size] @ vector
+        scores[self.expires[:self.size] <= now] = -np.inf
+        row = int(np.argmax(scores))
+        score = float(scores[row])
+        return (row, score) if score > -np.inf else (None, 0.0)
+
+
+# Answers near-duplicate questions ("when are you open?" vs "what are your
+# opening hours") with a previously generated answer when the cosine
+# similarity of their embeddings reaches `threshold`. Entries are kept per
+# (model, system prompt) so a prompt change never serves stale answers.
+class SemanticCache:
+    def __init__(self, embedder, threshold=0.92, max_entries=10000, ttl=3600.0,
+                 ann_min_entries=20000, clock=time.time, name="semantic"):
+        # Without numpy the app fails at startup, not on the first question
+        _numpy()
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ann_min_entries = ann_min_entries
+        self.clock = clock
+        self.name = name
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, client=None):
+        if os.getenv("SEMANTIC_CACHE_EMBEDDER", "openai") == "local" or client is None:
+            embedder = HashingEmbedder(env_int("SEMANTIC_CACHE_DIM", 512))
+        else:
+            embedder = OpenAIEmbedder(
+                client, os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+            )
+        return cls(
+            embedder,
+            threshold=env_float("SEMANTIC_CACHE_THRESHOLD", 0.92),
+            max_entries=env_int("SEMANTIC_CACHE_MAX_ENTRIES", 10000),
+            ttl=env_float("SEMANTIC_CACHE_TTL", 3600.0),
+            ann_min_entries=env_int("SEMANTIC_CACHE_ANN_MIN_ENTRIES", 20000),
+        )
+
+    def embed(self, question):
+        return self.embedder([normalize_question(question)])[0]
+
+    # Returns (answer or None, question vector). The vector is handed back
+    # to store() so a miss costs only one embedding call.
+    def lookup(self, model, system_prompt, question):
+        try:
+            vector = self.embed(question)
+        except CircuitOpen:
+            CACHE_REQUESTS.inc(cache=self.name, result="error")
+            return None, None
+        except Exception as e:
+            logging.warning("Semantic cache embedding failed: %s", e)
+            CACHE_REQUESTS.inc(cache=self.name, result="error")
+            return None, None
+
+        with self._lock:
+            index = self._indexes.get((model, system_prompt))
+            answer = None
+            if index is not None:
+                row, score = index.search(vector, self.clock())
+                if row is not None and score >= self.threshold:
+                    answer = index.answers[row]
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if answer is None else "hit")
+        return answer, vector
+
+    def store(self, model, system_prompt, vector, answer):
+        if vector is None:
+            return
+        with self._lock:
+            index = self._indexes.get((model, system_prompt))
+            if index is None:
+                index = self._indexes[(model, system_prompt)] = VectorIndex(
+                    len(vector), self.max_entries, self.ann_min_entries
+                )
+            index.add(vector, answer, self.clock() + self.ttl)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# The shared semantic cache, or None when SEMANTIC_CACHE_ENABLED is off
+def get_semantic_cache(client=None):
+    global _cache
+    if not env_bool("SEMANTIC_CACHE_ENABLED", False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache.from_env(client)
+    return _cache
@@ -0,0 +1,361 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from whatsapp_bot.circuit_breaker import CircuitOpen
+from whatsapp_bot.config import env_bool, env_float, env_int
+from whatsapp_bot.metrics import counter, gauge
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+QUEUE_DEPTH = gauge("send_queue_depth", "Jobs waiting on the send queue")
+DEFERRED = gauge("send_queue_deferred", "Jobs put aside until an upstream circuit closes")
+JOBS = counter("send_queue_jobs_total", "Finished send queue jobs by task and status", ["task", "status"])
+
+
+class QueueFull(Exception):
+    pass
+
+
+# Raised by a task to mark its job failed while still reporting a result
+class JobFailed(Exception):
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+# One unit of background work. Jobs only carry a task name and JSON-friendly
+# kwargs so that a shared backend can serialize them.
+class Job:
+    __slots__ = ("id", "task", "kwargs", "status", "result", "error", "created_at", "finished_at")
+
+    def __init__(self, task, kwargs, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.task = task
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "task": self.task,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# In-process backend: a bounded FIFO for pending jobs plus a bounded job
+# table for status lookups. A shared backend (Redis, SQS, ...) only needs to
+# provide the same methods. A durable one (whatsapp_bot/outbox.py) also
+# writes jobs that run in the request thread, see SendQueue.journal.
+class MemoryBackend:
+    durable = False
+
+    def __init__(self, maxsize=10000, max_jobs=10000):
+        self._pending = queue.Queue(maxsize)
+        self._jobs = OrderedDict()
+        self._max_jobs = max_jobs
+        self._lock = threading.Lock()
+
+    # Nothing to connect to or replay
+    def open(self):
+        pass
+
+    def put(self, job):
+        try:
+            self._pending.put_nowait(job)
+        except queue.Full:
+            raise QueueFull("send queue is full")
+        self.save(job)
+
+    def get(self, timeout=None):
+        try:
+            return self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._jobs.move_to_end(job.id)
+            while len(self._jobs) > self._max_jobs:
+                self._jobs.popitem(last=False)
+
+    def load(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self):
+        return self._pending.qsize()
+
+
+# Worker pool that runs registered tasks off the request thread.
+#
+# A job whose task hits an open circuit (CircuitOpen) is put aside until the
+# circuit may close and then queued again, for up to `defer_max_age` seconds
+# after it was submitted; older jobs fail.
+class SendQueue:
+    def __init__(self, workers=8, backend=None, defer_max_age=3600.0):
+        self.workers = workers
+        self.backend = backend or MemoryBackend()
+        self.defer_max_age = defer_max_age
+        self._deferred = []
+        self._sequence = itertools.count()
+        self._tasks = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._active = 0
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("SEND_QUEUE_BACKEND", "memory") == "sqlite":
+            from whatsapp_bot.outbox import SqliteBackend
+
+            backend = SqliteBackend(
+                path=os.getenv("OUTBOX_PATH", "outbox.db"),
+                maxsize=env_int("SEND_QUEUE_MAXSIZE", 10000),
+                max_jobs=env_int("SEND_QUEUE_MAX_JOBS", 10000),
+                batch_size=env_int("OUTBOX_BATCH_SIZE", 500),
+                synchronous=os.getenv("OUTBOX_SYNCHRONOUS", "FULL").upper(),
+                retention=env_float("OUTBOX_RETENTION", 86400.0),
+            )
+        else:
+            backend = MemoryBackend(
+                maxsize=env_int("SEND_QUEUE_MAXSIZE", 10000),
+                max_jobs=env_int("SEND_QUEUE_MAX_JOBS", 10000),
+            )
+        return cls(
+            workers=env_int("SEND_QUEUE_WORKERS", 8),
+            backend=backend,
+            defer_max_age=env_float("SEND_QUEUE_DEFER_MAX_AGE", 3600.0),
+        )
+
+    def register(self, name, fn):
+        self._tasks[name] = fn
+
+    def submit(self, task, **kwargs):
+        if task not in self._tasks:
+            raise KeyError(f"unknown task: {task}")
+        if self._stopping.is_set():
+            raise QueueFull("send queue is shutting down")
+        self._ensure_started()
+        job = Job(task, kwargs)
+        self.backend.put(job)
+        return job
+
+    def get(self, job_id):
+        return self.backend.load(job_id)
+
+    # Runs the block as `task` in the calling thread. With a durable backend
+    # the job is on disk before the block starts and marked finished after
+    # it, so if the process dies in between, the job is run again by the
+    # queue of the next process that opens the outbox. Yields the job (None
+    # without a durable backend); a send that fails without raising must
+    # say so with fail_journal().
+    @contextmanager
+    def journal(self, task, **kwargs):
+        job = self._begin_journal(task, kwargs)
+        if job is not None:
+            self.backend.record(job)
+        try:
+            yield job
+        except BaseException as e:
+            self._finish_journal(job, e)
+            raise
+        self._finish_journal(job)
+
+    # journal() for the event loop; the write runs in a thread
+    @asynccontextmanager
+    async def ajournal(self, task, **kwargs):
+        job = self._begin_journal(task, kwargs)
+        if job is not None:
+            await asyncio.to_thread(self.backend.record, job)
+        try:
+            yield job
+        except BaseException as e:
+            self._finish_journal(job, e)
+            raise
+        self._finish_journal(job)
+
+    def _begin_journal(self, task, kwargs):
+        if not self.backend.durable:
+            return None
+        if task not in self._tasks:
+            raise KeyError(f"unknown task: {task}")
+        self._ensure_started()
+        job = Job(task, kwargs)
+        job.status = RUNNING
+        return job
+
+    # Marks the job of a journal() block failed, for a send that reports
+    # its failure by its result instead of an exception
+    def fail_journal(self, job, error):
+        if job is not None:
+            job.status = FAILED
+            job.error = str(error)
+
+    def _finish_journal(self, job, error=None):
+        if job is None:
+            return
+        if error is not None:
+            job.status = FAILED
+            job.error = str(error)
+        elif job.status != FAILED:
+            job.status = SUCCEEDED
+        job.finished_at = time.time()
+        self.backend.save(job)
+
+    def depth(self):
+        return self.backend.depth()
+
+    def deferred(self):
+        return len(self._deferred)
+
+    # Threads are started on first use so that forked server workers each
+    # get their own pool.
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self.backend.open()
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"send-queue-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            if self._deferred:
+                self._requeue_due()
+            job = self.backend.get(timeout=0.5)
+            if job is None:
+                if self._stopping.is_set():
+                    return
+                continue
+            with self._lock:
+                self._active += 1
+            try:
+                self._execute(job)
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def _execute(self, job):
+        job.status = RUNNING
+        self.backend.save(job)
+        try:
+            job.result = self._tasks[job.task](**job.kwargs)
+            job.status = SUCCEEDED
+        except CircuitOpen as e:
+            if self._defer(job, e):
+                return
+            job.error = str(e)
+            job.status = FAILED
+        except JobFailed as e:
+            job.result = e.result
+            job.error = str(e)
+            job.status = FAILED
+        except Exception as e:
+            logging.exception("Job %s (%s) failed", job.id, job.task)
+            job.error = str(e)
+            job.status = FAILED
+        job.finished_at = time.time()
+        self.backend.save(job)
+        JOBS.inc(task=job.task, status=job.status)
+
+    def _defer(self, job, error):
+        if time.time() - job.created_at > self.defer_max_age:
+            return False
+        job.status = QUEUED
+        job.error = str(error)
+        self.backend.save(job)
+        with self._lock:
+            heapq.heappush(self._deferred, (time.monotonic() + error.retry_after, next(self._sequence), job))
+        return True
+
+    # Jobs whose wait is over go back on the queue; the workers check
+    # between jobs and at least every 0.5 s
+    def _requeue_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = []
+            while self._deferred and self._deferred[0][0] <= now:
+                due.append(heapq.heappop(self._deferred)[2])
+        for job in due:
+            try:
+                self.backend.put(job)
+            except QueueFull:
+                with self._lock:
+                    heapq.heappush(self._deferred, (now + 1.0, next(self._sequence), job))
+
+    # Stop accepting work and let the workers drain what is already queued
+    def shutdown(self, timeout=None):
+        self._stopping.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            thread.join(remaining)
+        self._threads = []
+
+
+# Per-request switch for async mode; ASYNC_SEND sets the default
+def wants_async(value=None):
+    if value is None or value == "":
+        return env_bool("ASYNC_SEND", False)
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+_send_queue = None
+_send_queue_lock = threading.Lock()
+
+
+def get_send_queue():
+    global _send_queue
+    if _send_queue is None:
+        with _send_queue_lock:
+            if _send_queue is None:
+                _send_queue = SendQueue.from_env()
+                QUEUE_DEPTH.set_function(_send_queue.depth)
+                DEFERRED.set_function(_send_queue.deferred)
+    return _send_queue
+
+
+# Start the workers now rather than on the first job, so that a durable
+# backend replays what a crashed process left as soon as the server is up.
+# Called after the fork in every server worker.
+def start_send_queue():
+    get_send_queue()._ensure_started()
+
+
+# Graceful shutdown: stop taking jobs and give the workers up to `timeout`
+# seconds to finish the queued ones. Returns how many jobs were left over,
+# deferred ones included.
+def shutdown_send_queue(timeout=None):
+    if _send_queue is None:
+        return 0
+    _send_queue.shutdown(timeout)
+    return _send_queue.depth() + _send_queue.deferred()
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+
+from whatsapp_bot.ai_cache import normalize_question
+from whatsapp_bot.config import env_bool, env_float
+from whatsapp_bot.metrics import counter, gauge
+
+COALESCED = counter(
+    "ai_coalesced_requests_total",
+    "AI completions by whether the caller ran the call (leader) or shared one already in flight (follower)",
+    ["role"],
+)
+IN_FLIGHT = gauge("ai_completions_in_flight", "Distinct AI completions currently in flight", ["mode"])
+
+
+# Same key for the same normalized question sent with the same model
+# settings and system prompt
+def flight_key(params, system_prompt, question):
+    raw = "\x1f".join((json.dumps(params, sort_keys=True), system_prompt, normalize_question(question)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Coalesces concurrent calls with the same key: the first caller runs the
+# function, the rest wait for it and get the same result (or exception).
+# A follower that has waited `timeout` seconds gives up and runs the
+# function itself. Nothing is kept once the call has finished; that is what
+# the response caches are for.
+class SingleFlight:
+    def __init__(self, enabled=True, timeout=60.0):
+        self.enabled = enabled
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=env_bool("AI_COALESCE_ENABLED", True),
+            timeout=env_float("AI_COALESCE_TIMEOUT", 60.0),
+        )
+
+    # (result, shared), `shared` being whether it came from another caller's
+    # call. A None key runs `fn` directly.
+    def do(self, key, fn):
+        if not self.enabled or key is None:
+            return fn(), False
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                IN_FLIGHT.inc(mode="threaded")
+
+        if not leader:
+            if call.done.wait(self.timeout):
+                COALESCED.inc(role="follower")
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+            return fn(), False
+
+        COALESCED.inc(role="leader")
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            IN_FLIGHT.dec(mode="threaded")
+            call.done.set()
+
+
+# Event loop variant of SingleFlight. The leader's coroutine runs as a task
+# of its own that every caller awaits through a shield, so a caller that is
+# cancelled (client gone) does not cancel the completion for the others.
+class AsyncSingleFlight:
+    def __init__(self, enabled=True, timeout=60.0):
+        self.enabled = enabled
+        self.timeout = timeout
+        self._tasks = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=env_bool("AI_COALESCE_ENABLED", True),
+            timeout=env_float("AI_COALESCE_TIMEOUT", 60.0),
+        )
+
+    # Async version of SingleFlight.do; `make_coro` is called only by the
+    # leader (or by a follower that timed out)
+    async def do(self, key, make_coro):
+        if not self.enabled or key is None:
+            return await make_coro(), False
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(make_coro())
+            IN_FLIGHT.inc(mode="async")
+            task.add_done_callback(lambda _: self._finish(key))
+            COALESCED.inc(role="leader")
+            return await asyncio.shield(task), False
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            return await make_coro(), False
+        COALESCED.inc(role="follower")
+        return result, True
+
+    def _finish(self, key):
+        self._tasks.pop(key, None)
+        IN_FLIGHT.dec(mode="async")
+
+
+_flight = None
+_flight_lock = threading.Lock()
+_async_flight = None
+
+
+def get_single_flight():
+    global _flight
+    if _flight is None:
+        with _flight_lock:
+            if _flight is None:
+                _flight = SingleFlight.from_env()
+    return _flight
+
+
+# Only used from the event loop thread, so no lock is needed
+def get_async_single_flight():
+    global _async_flight
+    if _async_flight is None:
+        _async_flight = AsyncSingleFlight.from_env()
+    return _async_flight
+
+
+# Calls in flight in the parent never finish in the child
+def _reset_after_fork():
+    global _flight, _flight_lock, _async_flight
+    _flight = None
+    _flight_lock = threading.Lock()
+    _async_flight = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,76 @@
+import re
+import threading
+from contextlib import contextmanager
+
+from whatsapp_bot.config import env_bool
+
+# End of a sentence (optionally followed by closing quotes/brackets) plus the
+# whitespace after it, or a blank line between paragraphs
+_BOUNDARY = re.compile(r"""[.!?…]["')\]]*\s+|\n\s*\n""")
+
+
+def _find_cut(buffer, min_chars, max_chars):
+    for match in _BOUNDARY.finditer(buffer):
+        if match.end() > max_chars:
+            break
+        if match.end() >= min_chars:
+            return match.end()
+    if len(buffer) > max_chars:
+        space = buffer.rfind(" ", min_chars, max_chars)
+        return space + 1 if space > 0 else max_chars
+    return None
+
+
+# Regroup streamed text deltas into chunks that end at a sentence or
+# paragraph boundary, each at least `min_chars` long (except the last) and
+# at most `max_chars`. Whitespace is kept, so "".join(chunks) is the full
+# text.
+def split_chunks(deltas, min_chars=60, max_chars=1000):
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        while True:
+            cut = _find_cut(buffer, min_chars, max_chars)
+            if cut is None:
+                break
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer:
+        yield buffer
+
+
+# One lock per recipient, so that the chunks of two streamed answers to the
+# same person never interleave. Entries are dropped once nobody holds them.
+class RecipientLocks:
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, recipient):
+        key = recipient.lstrip('+')
+        with self._lock:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+recipient_locks = RecipientLocks()
+
+
+# Per-request switch for streaming; AI_STREAM sets the default
+def wants_stream(value=None):
+    if value is None or value == "":
+        return env_bool("AI_STREAM", False)
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,327 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from whatsapp_bot.config import env_float
+from whatsapp_bot.graph_client import get_graph_client
+from whatsapp_bot.metrics import counter
+from whatsapp_bot.payloads import template_payload
+
+TEMPLATE_REFUSED = counter("template_sends_refused_total", "Template sends refused before reaching the Graph API")
+TEMPLATE_LOADS = counter("template_registry_loads_total", "Template definition loads by result", ["result"])
+
+# {{1}} or, for templates with named parameters, {{first_name}}
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+# The Graph API refuses text parameters with new lines, tabs or more than
+# four consecutive spaces (error 132018)
+INVALID_TEXT = re.compile(r"[\n\t]| {5,}")
+
+MEDIA_FORMATS = {"IMAGE": "image", "VIDEO": "video", "DOCUMENT": "document"}
+# Button type -> (sub_type, parameter type) of the buttons that take a value
+BUTTON_PARAMETERS = {
+    "URL": ("url", "text"),
+    "QUICK_REPLY": ("quick_reply", "payload"),
+    "COPY_CODE": ("copy_code", "coupon_code"),
+}
+
+
+# The payload of a template send, around the "template" object of
+# TemplateRegistry.prepare()
+def template_message(phone_number, template):
+    return {"messaging_product": "whatsapp", "to": phone_number, "type": "template", "template": template}
+
+
+# A template send that cannot be made as asked (unknown template or
+# language, missing or extra parameters, ...); the request is at fault
+class TemplateError(ValueError):
+    pass
+
+
+# Placeholder names of a component text in order of first appearance, and
+# whether they are named rather than {{1}}, {{2}}, ...
+def _placeholders(text):
+    names = list(dict.fromkeys(PLACEHOLDER.findall(text or "")))
+    named = any(not name.isdigit() for name in names)
+    if not named:
+        names.sort(key=int)
+    return names, named
+
+
+def _text_parameter(value, name, named, where):
+    if value is None or value == "":
+        raise TemplateError(f"{where} parameter {name} is empty")
+    text = str(value)
+    if where == "body" and INVALID_TEXT.search(text):
+        raise TemplateError(f"body parameter {name} cannot contain new lines, tabs or more than 4 spaces in a row")
+    parameter = {"type": "text", "text": text}
+    if named:
+        parameter["parameter_name"] = name
+    return parameter
+
+
+# Positional parameters come as a JSON array, never as one string
+def _check_list(values, where):
+    if isinstance(values, (str, bytes)) or not isinstance(values, (list, tuple)):
+        raise TemplateError(f"{where} parameters must be a list")
+
+
+# Values for `names` from a list ({{1}}, {{2}}, ...) or an object (named
+# parameters), in placeholder order
+def _values(values, names, named, where):
+    values = values or ([] if not named else {})
+    if named:
+        if not isinstance(values, dict):
+            raise TemplateError(f"{where} parameters are named, give an object of {', '.join(names)}")
+        missing = [name for name in names if name not in values]
+        extra = [name for name in values if name not in names]
+        if missing or extra:
+            raise TemplateError(f"{where} needs parameters {', '.join(names) or 'none'}, "
+                                f"got {', '.join(map(str, values)) or 'none'}")
+        return [values[name] for name in names]
+    _check_list(values, where)
+    if len(values) != len(names):
+        raise TemplateError(f"{where} takes {len(names)} parameters, got {len(values)}")
+    return values
+
+
+# One approved template in one language. Everything that does not depend on
+# the parameters is worked out once: the placeholders of each component and,
+# for templates without parameters, the whole "template" object of the
+# payload, which prepare() hands out as is.
+class Template:
+    def __init__(self, definition):
+        self.name = definition["name"]
+        self.language = definition["language"]
+        self.header_format = None
+        self.header_names, self.header_named = [], False
+        self.body_names, self.body_named = [], False
+        # (index, sub_type, parameter type, takes a value) per button
+        self.buttons = []
+
+        for component in definition.get("components") or []:
+            kind = str(component.get("type", "")).upper()
+            if kind == "HEADER":
+                self.header_format = str(component.get("format", "TEXT")).upper()
+                if self.header_format == "TEXT":
+                    self.header_names, self.header_named = _placeholders(component.get("text"))
+            elif kind == "BODY":
+                self.body_names, self.body_named = _placeholders(component.get("text"))
+            elif kind == "BUTTONS":
+                for index, button in enumerate(component.get("buttons") or []):
+                    button_type = str(button.get("type", "")).upper()
+                    if button_type not in BUTTON_PARAMETERS:
+                        continue
+                    sub_type, parameter_type = BUTTON_PARAMETERS[button_type]
+                    # URL buttons take a value only for a dynamic {{1}} suffix;
+                    # a quick reply payload is optional
+                    required = button_type == "COPY_CODE" or (
+                        button_type == "URL" and bool(PLACEHOLDER.search(button.get("url") or ""))
+                    )
+                    if button_type == "URL" and not required:
+                        continue
+                    self.buttons.append((str(index), sub_type, parameter_type, required))
+
+        self._template = {"name": self.name, "language": {"code": self.language}}
+        self._static = not (self.header_names or self.header_format in MEDIA_FORMATS
+                            or self.header_format == "LOCATION" or self.body_names
+                            or any(required for *_, required in self.buttons))
+
+    def _header(self, header):
+        if self.header_format in MEDIA_FORMATS:
+            media_type = MEDIA_FORMATS[self.header_format]
+            if not isinstance(header, dict) or not (header.get("id") or header.get("link")):
+                raise TemplateError(f"the {media_type} header needs an object with an \"id\" or a \"link\"")
+            media = {"id": header["id"]} if header.get("id") else {"link": header["link"]}
+            if media_type == "document" and header.get("filename"):
+                media["filename"] = header["filename"]
+            return {"type": "header", "parameters": [{"type": media_type, media_type: media}]}
+        if self.header_format == "LOCATION":
+            if not isinstance(header, dict) or "latitude" not in header or "longitude" not in header:
+                raise TemplateError("the location header needs an object with \"latitude\" and \"longitude\"")
+            location = {key: header[key] for key in ("latitude", "longitude", "name", "address") if key in header}
+            return {"type": "header", "parameters": [{"type": "location", "location": location}]}
+        if self.header_names:
+            if not isinstance(header, (list, dict)):
+                header = [header] if header is not None else []
+            values = _values(header, self.header_names, self.header_named, "header")
+            return {"type": "header", "parameters": [
+                _text_parameter(value, name, self.header_named, "header")
+                for name, value in zip(self.header_names, values)
+            ]}
+        if header:
+            raise TemplateError("the template has no header parameters")
+        return None
+
+    def _buttons(self, buttons):
+        buttons = buttons or []
+        if not isinstance(buttons, list):
+            raise TemplateError("button parameters must be a list, one value (or null) per button")
+        if len(buttons) > len(self.buttons):
+            raise TemplateError(f"the template has {len(self.buttons)} buttons that take a parameter, "
+                                f"got {len(buttons)}")
+        components = []
+        for position, (index, sub_type, parameter_type, required) in enumerate(self.buttons):
+            value = buttons[position] if position < len(buttons) else None
+            if value is None or value == "":
+                if required:
+                    raise TemplateError(f"button {index} needs a parameter")
+                continue
+            components.append({
+                "type": "button",
+                "sub_type": sub_type,
+                "index": index,
+                "parameters": [{"type": parameter_type, parameter_type: str(value)}],
+            })
+        return components
+
+    # The "template" object of a send with these parameters. Raises
+    # TemplateError, without any Graph API call, when they do not fit.
+    def prepare(self, parameters=None, header=None, buttons=None):
+        if self._static and not (parameters or header or buttons):
+            return self._template
+        components = []
+        header_component = self._header(header)
+        if header_component is not None:
+            components.append(header_component)
+        values = _values(parameters, self.body_names, self.body_named, "body")
+        if self.body_names:
+            components.append({"type": "body", "parameters": [
+                _text_parameter(value, name, self.body_named, "body")
+                for name, value in zip(self.body_names, values)
+            ]})
+        components.extend(self._buttons(buttons))
+        return {**self._template, "components": components} if components else self._template
+
+
+# Approved message templates, loaded once per process from a JSON file
+# (TEMPLATES_PATH, in the shape of the Graph API message_templates response
+# or a plain list of its "data") or from the Graph API itself
+# (WHATSAPP_BUSINESS_ACCOUNT_ID). Template sends are checked and built
+# locally, so a misspelt name or a missing parameter gets a 400 right away
+# instead of a Graph API round trip. With neither configured, templates are
+# sent unchecked with body parameters only, as before.
+#
+# TEMPLATES_REFRESH_INTERVAL reloads the definitions now and then, for
+# templates approved while the app runs. A failed load keeps the
+# definitions it has and is tried again after a minute.
+class TemplateRegistry:
+    def __init__(self, path=None, account_id=None, refresh_interval=0.0, retry_interval=60.0, clock=time.monotonic):
+        self.path = path
+        self.account_id = account_id
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self._templates = None
+        self._next_load = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("TEMPLATES_PATH") or None,
+            account_id=os.getenv("WHATSAPP_BUSINESS_ACCOUNT_ID") or None,
+            refresh_interval=env_float("TEMPLATES_REFRESH_INTERVAL", 0.0),
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.path or self.account_id)
+
+    def _definitions(self):
+        if self.path:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("data", []) if isinstance(data, dict) else data
+        return get_graph_client().message_templates(self.account_id)
+
+    # (name, language) -> Template of every approved definition
+    def load(self):
+        templates = {}
+        for definition in self._definitions():
+            if definition.get("status", "APPROVED") != "APPROVED":
+                continue
+            template = Template(definition)
+            templates[(template.name, template.language)] = template
+        return templates
+
+    def _ensure_loaded(self):
+        if self._templates is not None and (not self.refresh_interval or self.clock() < self._next_load):
+            return
+        with self._lock:
+            now = self.clock()
+            if self._templates is not None and (not self.refresh_interval or now < self._next_load):
+                return
+            if self._templates is None and now < self._next_load:
+                return
+            try:
+                self._templates = self.load()
+            except Exception as e:
+                TEMPLATE_LOADS.inc(result="failed")
+                logging.error("Loading message templates failed: %s", e)
+                self._next_load = now + self.retry_interval
+                return
+            TEMPLATE_LOADS.inc(result="loaded")
+            logging.info("Loaded %d message templates", len(self._templates))
+            self._next_load = now + self.refresh_interval
+
+    # Loads the definitions now rather than on the first send
+    def warm_up(self):
+        if self.enabled:
+            self._ensure_loaded()
+
+    # The Template of `name` in `language`; None when the registry is not
+    # configured or could not load any definitions yet
+    def get(self, name, language):
+        if not self.enabled:
+            return None
+        self._ensure_loaded()
+        if self._templates is None:
+            return None
+        template = self._templates.get((name, language))
+        if template is None:
+            languages = sorted(lang for template_name, lang in self._templates if template_name == name)
+            if languages:
+                raise TemplateError(f"template {name!r} has no language {language!r}, "
+                                    f"use one of {', '.join(languages)}")
+            raise TemplateError(f"no approved template {name!r}")
+        return template
+
+    # The "template" object of a send, checked against its definition. The
+    # object does not depend on the recipient: a campaign prepares it once
+    # and wraps it with template_message() for every number.
+    def prepare(self, template_name, language_code="en_US", parameters=None, header=None, buttons=None):
+        try:
+            template = self.get(template_name, language_code)
+            if template is not None:
+                return template.prepare(parameters, header, buttons)
+            if header or buttons:
+                raise TemplateError("header and button parameters need the template definitions "
+                                    "(TEMPLATES_PATH or WHATSAPP_BUSINESS_ACCOUNT_ID)")
+            # Without a definition only the shape of the body parameters is known
+            if parameters:
+                _check_list(parameters, "body")
+        except TemplateError:
+            TEMPLATE_REFUSED.inc()
+            raise
+        # Not configured, or the definitions could not be loaded yet
+        return template_payload(None, template_name, language_code, parameters)["template"]
+
+    # Graph API payload of a template send to one number
+    def render(self, phone_number, template_name, language_code="en_US", parameters=None, header=None, buttons=None):
+        return template_message(phone_number, self.prepare(template_name, language_code, parameters, header, buttons))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_template_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TemplateRegistry.from_env()
+    return _registry
@@ -0,0 +1,69 @@
+import hashlib
+import hmac
+
+from whatsapp_bot.metrics import counter
+
+WEBHOOK_MESSAGES = counter("webhook_messages_total", "Inbound WhatsApp messages received by the webhook", ["type"])
+
+
+# True if the X-Hub-Signature-256 header ("sha256=<hex>") is the HMAC-SHA256
+# of the raw request body keyed with the app secret
+def verify_signature(app_secret, body, header):
+    if not app_secret or not header or not header.startswith("sha256="):
+        return False
+    expected = hmac.new(app_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected.encode("ascii"), header[len("sha256="):].encode("utf-8"))
+
+
+# Subscription handshake: returns hub.challenge if the verify token matches,
+# otherwise None
+def verify_subscription(args, verify_token):
+    if not verify_token or args.get("hub.mode") != "subscribe":
+        return None
+    token = args.get("hub.verify_token", "")
+    if not hmac.compare_digest(token.encode("utf-8"), verify_token.encode("utf-8")):
+        return None
+    return args.get("hub.challenge", "")
+
+
+# The objects of a JSON array in a webhook payload; anything else where an
+# array belongs counts as empty, and so do non-objects in the array
+def _objects(value):
+    if not isinstance(value, list):
+        return []
+    return [item for item in value if isinstance(item, dict)]
+
+
+# A JSON object in a webhook payload, empty if the field is something else
+def _object(value):
+    return value if isinstance(value, dict) else {}
+
+
+# Messages in a webhook payload. Meta batches several entries and changes
+# into one POST; delivery/read status updates carry no messages and are
+# skipped, and so are parts of the payload that do not have the expected
+# shape.
+def iter_messages(payload):
+    if not isinstance(payload, dict):
+        return
+    for entry in _objects(payload.get("entry")):
+        for change in _objects(entry.get("changes")):
+            if change.get("field") != "messages":
+                continue
+            yield from _objects(_object(change.get("value")).get("messages"))
+
+
+# The text a user sent (typed, or the title of a tapped button / list item),
+# or None for media, reactions, locations etc.
+def message_text(message):
+    kind = message.get("type")
+    text = None
+    if kind == "text":
+        text = _object(message.get("text")).get("body")
+    elif kind == "button":
+        text = _object(message.get("button")).get("text")
+    elif kind == "interactive":
+        interactive = _object(message.get("interactive"))
+        reply = _object(interactive.get("button_reply")) or _object(interactive.get("list_reply"))
+        text = reply.get("title")
+    return text if isinstance(text, str) else None